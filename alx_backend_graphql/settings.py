@@ -76,10 +76,14 @@ WSGI_APPLICATION = 'alx_backend_graphql_crm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connections are kept for CONN_MAX_AGE seconds; crm.db sets WAL mode and
+# the other SQLite pragmas once per new connection
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
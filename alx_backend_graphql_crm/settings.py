@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'crm.routers.replica_pinning_middleware',
 ]
 
 ROOT_URLCONF = 'alx_backend_graphql_crm.urls'
@@ -76,13 +78,30 @@ WSGI_APPLICATION = 'alx_backend_graphql_crm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connections are kept for CONN_MAX_AGE seconds; crm.db sets WAL mode and
+# the other SQLite pragmas once per new connection
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Optional read replica. Query resolvers read from it and writes go to the
+# primary (crm.routers). Locally, point CRM_REPLICA_DB_NAME at a second SQLite
+# file and keep it in sync with `python manage.py sync_replica --interval 5`.
+CRM_REPLICA_DB_NAME = os.environ.get('CRM_REPLICA_DB_NAME')
+if CRM_REPLICA_DB_NAME:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': CRM_REPLICA_DB_NAME,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['crm.routers.PrimaryReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -125,5 +144,160 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 GRAPHENE = {
-    "SCHEMA": "alx_backend_graphql_crm.schema.schema"
-}
\ No newline at end of file
+    "SCHEMA": "alx_backend_graphql_crm.schema.schema",
+    "MIDDLEWARE": ["crm.routers.PrimaryForMutationsMiddleware"],
+}
+
+# Channel layer for GraphQL subscriptions. The in-memory layer only reaches
+# subscribers in the same process (single node, tests); set
+# CRM_CHANNEL_LAYER_URL to a Redis URL when several processes serve traffic.
+CRM_CHANNEL_LAYER_URL = os.environ.get('CRM_CHANNEL_LAYER_URL')
+if CRM_CHANNEL_LAYER_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [CRM_CHANNEL_LAYER_URL]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    }
+
+# Order archival (see crm.archive). Orders older than this many days move to
+# the archive tables; allOrders only reads them with includeArchived.
+CRM_ORDER_ARCHIVE_DAYS = int(os.environ.get('CRM_ORDER_ARCHIVE_DAYS', 365))
+
+# Cache for GraphQL node and connection lookups (see crm.caching). Local
+# memory suits tests and a single process; set CRM_CACHE_URL to a Redis URL
+# so every worker shares cached entries and version bumps.
+CRM_CACHE_URL = os.environ.get('CRM_CACHE_URL')
+if CRM_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CRM_CACHE_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'crm',
+        },
+    }
+
+# Celery Configuration
+# CRM_CELERY_BROKER_URL=memory:// keeps the broker and results in-process,
+# for tests and benchmarks that start their workers in the same process.
+CRM_CELERY_BROKER_URL = os.environ.get('CRM_CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_BROKER_URL = CRM_CELERY_BROKER_URL
+if CRM_CELERY_BROKER_URL.startswith('memory://'):
+    CELERY_RESULT_BACKEND = 'cache+memory://'
+else:
+    CELERY_RESULT_BACKEND = CRM_CELERY_BROKER_URL
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
+CELERY_TIMEZONE = 'UTC'
+
+# Queues, so long report runs never hold up short stock and notification
+# tasks. Run one worker per queue with the concurrency and prefetch in
+# CRM_CELERY_WORKERS (`python manage.py celery_workers` prints the commands).
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+from kombu import Exchange, Queue
+
+CELERY_TASK_QUEUES = [
+    Queue(name, Exchange(name), routing_key=name)
+    for name in ('default', 'inventory', 'reminders', 'imports', 'reports')
+]
+CELERY_TASK_ROUTES = {
+    'crm.tasks.release_expired_reservations': {'queue': 'inventory'},
+    'crm.tasks.update_low_stock': {'queue': 'inventory'},
+    'crm.tasks.drain_outbox': {'queue': 'reminders'},
+    'crm.tasks.import_customer_chunk': {'queue': 'imports'},
+    'crm.tasks.resume_import_job': {'queue': 'imports'},
+    'crm.tasks.generate_crm_report': {'queue': 'reports'},
+    'crm.tasks.compute_customer_cohorts': {'queue': 'reports'},
+    'crm.tasks.compute_product_reports': {'queue': 'reports'},
+    'crm.tasks.purge_outbox': {'queue': 'reports'},
+    'crm.tasks.archive_orders': {'queue': 'reports'},
+}
+CRM_CELERY_WORKERS = {
+    'default': {'concurrency': 2, 'prefetch_multiplier': 4},
+    'inventory': {'concurrency': 4, 'prefetch_multiplier': 4},
+    'reminders': {'concurrency': 2, 'prefetch_multiplier': 4},
+    'imports': {'concurrency': 4, 'prefetch_multiplier': 1},
+    # One long task at a time, and none reserved behind it
+    'reports': {'concurrency': 1, 'prefetch_multiplier': 1},
+}
+
+# Soft limits raise SoftTimeLimitExceeded in the task; hard limits kill it.
+# Priorities order tasks within a queue; on Redis 0 runs first.
+CELERY_TASK_SOFT_TIME_LIMIT = 5 * 60
+CELERY_TASK_TIME_LIMIT = 6 * 60
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+CELERY_TASK_ANNOTATIONS = {
+    'crm.tasks.release_expired_reservations': {'priority': 0, 'soft_time_limit': 50, 'time_limit': 60},
+    'crm.tasks.drain_outbox': {'priority': 1, 'soft_time_limit': 50, 'time_limit': 60},
+    'crm.tasks.update_low_stock': {'priority': 1, 'soft_time_limit': 60, 'time_limit': 90},
+    'crm.tasks.log_crm_heartbeat': {'priority': 0, 'soft_time_limit': 30, 'time_limit': 40},
+    'crm.tasks.resume_import_job': {'priority': 2, 'soft_time_limit': 60, 'time_limit': 90},
+    'crm.tasks.import_customer_chunk': {'priority': 3, 'soft_time_limit': 2 * 60, 'time_limit': 3 * 60},
+    'crm.tasks.generate_crm_report': {'priority': 5, 'soft_time_limit': 10 * 60, 'time_limit': 15 * 60},
+    'crm.tasks.compute_customer_cohorts': {'priority': 7, 'soft_time_limit': 25 * 60, 'time_limit': 30 * 60},
+    'crm.tasks.compute_product_reports': {'priority': 7, 'soft_time_limit': 25 * 60, 'time_limit': 30 * 60},
+    'crm.tasks.purge_outbox': {'priority': 9},
+    'crm.tasks.archive_orders': {'priority': 9, 'soft_time_limit': 25 * 60, 'time_limit': 30 * 60},
+}
+
+# Celery Beat Schedule
+from celery.schedules import crontab
+
+# Every scheduled task but drain_outbox takes a single-flight lock
+# (crm.locks), so each one runs once per interval however many beat or
+# worker processes fire it. drain_outbox is deliberately not wrapped: drains
+# may overlap, since each claims its own batch of events under a lease.
+CELERY_BEAT_SCHEDULE = {
+    'log-crm-heartbeat': {
+        'task': 'crm.tasks.log_crm_heartbeat',
+        'schedule': crontab(minute='*/5'),
+    },
+    'update-low-stock': {
+        'task': 'crm.tasks.update_low_stock',
+        'schedule': crontab(minute=0, hour='*/12'),
+    },
+    'generate-crm-report': {
+        'task': 'crm.tasks.generate_crm_report',
+        'schedule': crontab(day_of_week='mon', hour=6, minute=0),
+    },
+    'compute-customer-cohorts': {
+        'task': 'crm.tasks.compute_customer_cohorts',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'compute-product-reports': {
+        'task': 'crm.tasks.compute_product_reports',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'release-expired-reservations': {
+        'task': 'crm.tasks.release_expired_reservations',
+        'schedule': crontab(),
+    },
+    'drain-outbox': {
+        'task': 'crm.tasks.drain_outbox',
+        'schedule': crontab(),
+    },
+    'purge-outbox': {
+        'task': 'crm.tasks.purge_outbox',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'archive-orders': {
+        'task': 'crm.tasks.archive_orders',
+        'schedule': crontab(hour=4, minute=30),
+    },
+}
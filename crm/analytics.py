@@ -0,0 +1,246 @@
+"""
+Offline customer and product analytics, computed with NumPy and SciPy.
+
+Rows are streamed from the database with ``values_list`` in chunks. Each
+chunk becomes columnar arrays and is folded into sparse accumulators. The
+size of those accumulators depends on the number of customers, months and
+products, not on the number of orders, so memory stays bounded however many
+order lines there are.
+
+- ``customer_cohorts``: customers and revenue per first-order month cohort
+  and months since that first order.
+- ``product_reports``: orders per product (top products) and the sparse
+  product x product co-occurrence matrix (co-purchase pairs).
+
+Both read active and archived orders (crm.archive). The archive job runs
+after them in the beat schedule, so no order moves during a scan.
+
+The ``save_*`` functions replace a result table in one transaction.
+"""
+import itertools
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max, Min
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+from scipy import sparse
+
+from . import locks
+from .models import ArchivedOrder, ArchivedOrderProduct, CohortRetention, Order, Product, ProductAffinity, TopProduct
+from .utils import chunked
+
+CHUNK_SIZE = 50000
+BATCH_SIZE = 1000
+
+
+def _month_index(value):
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.year * 12 + value.month - 1
+
+
+def _month_start(index):
+    return date(int(index) // 12, int(index) % 12 + 1, 1)
+
+
+def _money(value):
+    return Decimal(f"{value:.2f}")
+
+
+# --------------------------
+# CUSTOMER COHORTS
+# --------------------------
+
+def activity_matrices(chunk_size=CHUNK_SIZE):
+    """
+    Return ``(orders, revenue, first_month)``: customers x months sparse
+    matrices of order counts and revenue, and the month index of column 0.
+    Returns None when there are no orders.
+    """
+    tables = [
+        (model, model.objects.aggregate(
+            first=Min('order_date'), last=Max('order_date'), customers=Max('customer_id'), last_id=Max('pk'),
+        ))
+        for model in (Order, ArchivedOrder)
+    ]
+    tables = [(model, bounds) for model, bounds in tables if bounds['first'] is not None]
+    if not tables:
+        return None
+    first_month = _month_index(min(bounds['first'] for _, bounds in tables))
+    last_month = _month_index(max(bounds['last'] for _, bounds in tables))
+    shape = (max(bounds['customers'] for _, bounds in tables) + 1, last_month - first_month + 1)
+
+    # Orders created while scanning fall outside the matrices, so leave them out
+    rows = itertools.chain.from_iterable(
+        model.objects.filter(pk__lte=bounds['last_id'], customer_id__lt=shape[0])
+        .order_by()
+        .values_list('customer_id', ExtractYear('order_date'), ExtractMonth('order_date'), 'total_amount')
+        .iterator(chunk_size=chunk_size)
+        for model, bounds in tables
+    )
+    orders = sparse.csr_matrix(shape, dtype=np.int64)
+    revenue = sparse.csr_matrix(shape, dtype=np.float64)
+    for chunk in chunked(rows, chunk_size):
+        locks.check()
+        columns = np.array(chunk, dtype=object)
+        customers = columns[:, 0].astype(np.int64)
+        months = columns[:, 1].astype(np.int64) * 12 + columns[:, 2].astype(np.int64) - 1 - first_month
+        in_range = months < shape[1]
+        customers, months = customers[in_range], months[in_range]
+        amounts = columns[in_range, 3].astype(np.float64)
+        orders = orders + sparse.csr_matrix((np.ones(len(customers), dtype=np.int64), (customers, months)), shape=shape)
+        revenue = revenue + sparse.csr_matrix((amounts, (customers, months)), shape=shape)
+    return orders, revenue, first_month
+
+
+def customer_cohorts(chunk_size=CHUNK_SIZE):
+    """
+    Return a list of ``(cohort_month_index, months_since, customers, revenue)``
+    tuples, one per cohort and month with any activity.
+    """
+    matrices = activity_matrices(chunk_size)
+    if matrices is None:
+        return []
+    orders, revenue, first_month = matrices
+    months = orders.shape[1]
+
+    # Each customer's cohort is the first month column holding an order
+    orders.sort_indices()
+    active = np.diff(orders.indptr) > 0
+    cohort = np.zeros(orders.shape[0], dtype=np.int64)
+    cohort[active] = orders.indices[orders.indptr[:-1][active]]
+
+    def by_cohort_month(matrix, weighted):
+        cells = matrix.tocoo()
+        keys = cohort[cells.row] * months + (cells.col - cohort[cells.row])
+        return np.bincount(keys, weights=cells.data if weighted else None, minlength=months * months)
+
+    customers = by_cohort_month(orders, weighted=False)
+    amounts = by_cohort_month(revenue, weighted=True)
+    keys = np.flatnonzero(customers)
+    return [
+        (first_month + key // months, key % months, int(customers[key]), float(amounts[key]))
+        for key in keys
+    ]
+
+
+def save_cohorts(cohorts):
+    rows = [
+        CohortRetention(cohort=_month_start(cohort), months_since=months_since,
+                        customers=customers, revenue=_money(revenue))
+        for cohort, months_since, customers, revenue in cohorts
+    ]
+    locks.check()
+    with transaction.atomic():
+        CohortRetention.objects.all().delete()
+        CohortRetention.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+# --------------------------
+# PRODUCT REPORTS
+# --------------------------
+
+def _add_baskets(co_orders, lines, products):
+    """Fold ``lines`` (order id, product id rows, whole orders only) into the co-occurrence matrix."""
+    if not len(lines):
+        return co_orders, 0
+    order_ids, order_rows = np.unique(lines[:, 0], return_inverse=True)
+    baskets = sparse.csr_matrix(
+        (np.ones(len(lines), dtype=np.int64), (order_rows, lines[:, 1])),
+        shape=(len(order_ids), products),
+    )
+    return co_orders + baskets.T @ baskets, len(order_ids)
+
+
+def co_occurrence(chunk_size=CHUNK_SIZE):
+    """
+    Return ``(co_orders, total_orders)``. ``co_orders[i, j]`` is the number of
+    orders holding both products i and j; its diagonal is the number of
+    orders holding each product.
+    """
+    tables = [
+        (links, links.objects.aggregate(last_id=Max('pk'), products=Max('product_id')))
+        for links in (Order.products.through, ArchivedOrderProduct)
+    ]
+    tables = [(links, bounds) for links, bounds in tables if bounds['last_id'] is not None]
+    if not tables:
+        return sparse.csr_matrix((0, 0), dtype=np.int64), 0
+    products = max(bounds['products'] for _, bounds in tables) + 1
+
+    co_orders = sparse.csr_matrix((products, products), dtype=np.int64)
+    total_orders = 0
+    # An order's links are all in one table, so each table is folded on its own
+    for links, bounds in tables:
+        rows = (
+            links.objects.filter(pk__lte=bounds['last_id'], product_id__lt=products)
+            .order_by('order_id')
+            .values_list('order_id', 'product_id')
+        )
+        carry = np.empty((0, 2), dtype=np.int64)
+        for chunk in chunked(rows.iterator(chunk_size=chunk_size), chunk_size):
+            locks.check()
+            lines = np.vstack([carry, np.array(chunk, dtype=np.int64)])
+            # Hold back the last order: its lines may continue in the next chunk
+            split = np.searchsorted(lines[:, 0], lines[-1, 0])
+            co_orders, orders = _add_baskets(co_orders, lines[:split], products)
+            total_orders += orders
+            carry = lines[split:]
+        co_orders, orders = _add_baskets(co_orders, carry, products)
+        total_orders += orders
+    return co_orders, total_orders
+
+
+def product_reports(top=50, per_product=10, chunk_size=CHUNK_SIZE):
+    """
+    Return ``(top_products, affinities)``. ``top_products`` holds
+    ``(product_id, order_count)`` pairs for the ``top`` most ordered products.
+    ``affinities`` holds ``(product_id, other_id, co_orders, confidence, lift)``
+    rows, at most ``per_product`` per product.
+    """
+    co_orders, total_orders = co_occurrence(chunk_size)
+    support = co_orders.diagonal()
+    ranked = np.argsort(-support, kind='stable')[:top]
+    top_products = [(int(product), int(support[product])) for product in ranked if support[product]]
+
+    pairs = (co_orders - sparse.diags(support)).tocsr()
+    pairs.eliminate_zeros()
+    affinities = []
+    for product in np.flatnonzero(np.diff(pairs.indptr)):
+        start, end = pairs.indptr[product], pairs.indptr[product + 1]
+        others, counts = pairs.indices[start:end], pairs.data[start:end]
+        best = np.argsort(-counts, kind='stable')[:per_product]
+        others, counts = others[best], counts[best]
+        confidence = counts / support[product]
+        lift = confidence * total_orders / support[others]
+        affinities.extend(zip(
+            [int(product)] * len(others), others.tolist(), counts.tolist(), confidence.tolist(), lift.tolist(),
+        ))
+    return top_products, affinities
+
+
+def save_product_reports(top_products, affinities):
+    # Products deleted since the scan are skipped
+    prices = dict(Product.objects.values_list('pk', 'price'))
+    ranking = [
+        TopProduct(rank=rank, product_id=product_id, order_count=order_count,
+                   revenue=prices[product_id] * order_count)
+        for rank, (product_id, order_count) in enumerate(top_products, start=1)
+        if product_id in prices
+    ]
+    pairs = [
+        ProductAffinity(product_id=product_id, other_id=other_id, co_orders=co_orders,
+                        confidence=confidence, lift=lift)
+        for product_id, other_id, co_orders, confidence, lift in affinities
+        if product_id in prices and other_id in prices
+    ]
+    locks.check()
+    with transaction.atomic():
+        TopProduct.objects.all().delete()
+        ProductAffinity.objects.all().delete()
+        TopProduct.objects.bulk_create(ranking, batch_size=BATCH_SIZE)
+        ProductAffinity.objects.bulk_create(pairs, batch_size=BATCH_SIZE)
+    return len(ranking), len(pairs)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        # Connect the Celery task signal handlers (metrics, replica pinning)
+        # and the SQLite connection tuning hook
+        from . import db, metrics, routers  # noqa: F401
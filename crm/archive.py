@@ -0,0 +1,96 @@
+"""
+Order archival.
+
+Orders older than ``CRM_ORDER_ARCHIVE_DAYS`` days move to ArchivedOrder,
+under the same ids, and their product links move to ArchivedOrderProduct.
+``archive_orders`` does this ``CHUNK_SIZE`` orders at a time, one short
+transaction per chunk, so the orders table and its indexes stay the size of
+the active window and hot queries never scan years of history.
+
+Every query path reads only the active table, except:
+
+- ``allOrders(includeArchived: true)``, which unions both tables
+  (``with_archived``);
+- the recomputations that must see every order: ``rollups.rebuild``,
+  ``rollups.reconcile_customers``, full CRM reports and crm.analytics.
+
+Customer stats and the DailySales rollup already include archived orders,
+so moving an order changes neither. Stock reservations committed to an
+archived order lose their link to it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Value
+from django.utils import timezone
+
+from . import locks
+from .models import ArchivedOrder, ArchivedOrderProduct, Order
+from .routers import PRIMARY
+
+CHUNK_SIZE = 1000
+
+# Columns shared by both tables, in the same order, so their rows can be unioned
+UNION_FIELDS = ('customer', 'order_date', 'total_amount')
+
+
+class ArchiveConflict(Exception):
+    """An order of the chunk changed while it was being moved."""
+
+
+def horizon():
+    """Orders placed before this are archived."""
+    return timezone.now() - timedelta(days=settings.CRM_ORDER_ARCHIVE_DAYS)
+
+
+def _move(rows):
+    """Move the orders in ``rows`` (dicts of Order columns) and their links in one transaction."""
+    ids = [row['id'] for row in rows]
+    with transaction.atomic():
+        # A write first: on SQLite a transaction that reads before writing fails under contention
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**row) for row in rows])
+        links = Order.products.through.objects.filter(order_id__in=ids).values_list('order_id', 'product_id')
+        ArchivedOrderProduct.objects.bulk_create([
+            ArchivedOrderProduct(order_id=order_id, product_id=product_id) for order_id, product_id in links
+        ])
+        _, deleted = Order.objects.filter(pk__in=ids).delete()
+        if deleted.get(Order._meta.label, 0) != len(ids):
+            raise ArchiveConflict()
+
+
+def archive_orders(before=None, chunk_size=CHUNK_SIZE, max_chunks=None):
+    """Archive orders placed before ``before`` (default ``horizon()``). Returns how many were moved."""
+    before = before or horizon()
+    moved = chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        rows = list(
+            Order.objects.using(PRIMARY).filter(order_date__lt=before).order_by('pk')
+            .values('id', 'customer_id', 'order_date', 'total_amount')[:chunk_size]
+        )
+        if not rows:
+            break
+        locks.check()
+        try:
+            _move(rows)
+        except ArchiveConflict:
+            # Rolled back; the next read no longer sees the deleted order
+            continue
+        moved += len(rows)
+        chunks += 1
+    return moved
+
+
+def with_archived(active, archived):
+    """
+    Union the Order queryset ``active`` with the ArchivedOrder queryset
+    ``archived``. Rows are Order instances with an ``archived`` flag, in the
+    ordering of ``active`` (order columns only), by default by id.
+    """
+    ordering = active.query.order_by or ['id']
+
+    def part(queryset, flag):
+        return queryset.order_by().only(*UNION_FIELDS).annotate(
+            archived=Value(flag, output_field=BooleanField()),
+        )
+    return part(active, False).union(part(archived, True), all=True).order_by(*ordering)
@@ -0,0 +1,101 @@
+"""
+Async execution path for the CRM schema, served at /graphql/async.
+
+``schema`` is built from the Query and Mutation of the project schema
+(``GRAPHENE['SCHEMA']``), so /graphql/async serves exactly the types of
+/graphql: relay ids, connections, orderBy and countStrategy included. Only
+where the resolvers run differs. Resolvers marked ``loaders.loop_safe`` (and
+graphene's attribute and relay id resolvers) run on the event loop, where
+node lookups go through the per-request DataLoaders in ``crm.loaders`` and
+``customer`` on 50 orders costs one query. Every other resolver, mutations
+and connection pages included, runs in a worker thread through
+``sync_to_async``, since it uses the sync ORM and ``transaction.atomic``.
+
+The same schema serves the ``orderCreated`` and ``stockChanged`` subscriptions
+over WebSocket (see ``crm.consumers``).
+"""
+from functools import partial
+
+import graphene
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet
+from graphene.relay.node import GlobalID, Node
+from graphene.types.resolver import attr_resolver, dict_or_attr_resolver, dict_resolver
+from graphene.types.schema import identity_resolve
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLObjectType
+
+from . import loaders
+from .models import Order, Product
+from .schema import OrderNode, ProductNode
+from .subscriptions import ORDERS_GROUP, STOCK_GROUP, listen
+
+# graphene's own resolvers that never query the database
+LOOP_SAFE_RESOLVERS = {
+    attr_resolver, dict_resolver, dict_or_attr_resolver, identity_resolve,
+    GlobalID.id_resolver, Node.node_resolver.__func__,
+}
+
+# --------------------------
+# SUBSCRIPTIONS
+# --------------------------
+
+class Subscription(graphene.ObjectType):
+    order_created = graphene.Field(OrderNode)
+    stock_changed = graphene.Field(ProductNode, product_id=graphene.ID())
+
+    async def subscribe_order_created(root, info):
+        async for event in listen(ORDERS_GROUP):
+            order = await Order.objects.filter(pk=event['order_id']).afirst()
+            if order is not None:
+                # Fresh loaders per event so related rows are never stale
+                loaders.reset(info.context)
+                yield order
+
+    async def subscribe_stock_changed(root, info, product_id=None):
+        async for event in listen(STOCK_GROUP):
+            if product_id is not None and int(product_id) != event['product_id']:
+                continue
+            product = await Product.objects.filter(pk=event['product_id']).afirst()
+            if product is not None:
+                yield product
+
+# --------------------------
+# SCHEMA DEFINITION
+# --------------------------
+
+def is_loop_safe(resolve):
+    """Whether the field resolver ``resolve`` may run on the event loop."""
+    while isinstance(resolve, partial):
+        resolve = resolve.func
+    resolve = getattr(resolve, '__func__', resolve)
+    return resolve in LOOP_SAFE_RESOLVERS or getattr(resolve, 'loop_safe', False)
+
+
+def in_thread(resolve):
+    """Run the sync resolver ``resolve`` in a worker thread."""
+    def evaluate(root, info, **args):
+        result = resolve(root, info, **args)
+        # A lazy queryset would otherwise be evaluated on the event loop
+        if isinstance(result, QuerySet):
+            result = list(result)
+        return result
+
+    async def resolve_in_thread(root, info, **args):
+        return await sync_to_async(evaluate)(root, info, **args)
+    return resolve_in_thread
+
+
+def build_schema(sync_schema):
+    """The schema of ``sync_schema`` plus subscriptions, with sync resolvers moved off the loop."""
+    schema = graphene.Schema(query=sync_schema.query, mutation=sync_schema.mutation, subscription=Subscription)
+    for graphql_type in schema.graphql_schema.type_map.values():
+        if not isinstance(graphql_type, GraphQLObjectType) or graphql_type.name.startswith('__'):
+            continue
+        for field in graphql_type.fields.values():
+            if field.resolve is not None and not is_loop_safe(field.resolve):
+                field.resolve = in_thread(field.resolve)
+    return schema
+
+
+schema = build_schema(graphene_settings.SCHEMA)
@@ -0,0 +1,101 @@
+"""
+Process-local snapshot of the product catalog.
+
+``get_catalog()`` returns a read-only mapping of product id to
+ProductRecord. It is rebuilt lazily when the shared ``SCOPE`` version in
+``crm.caching`` changes, so a write in any process refreshes every other
+process on its next lookup. Order validation and price lookups are then
+served from memory.
+
+Versions only reach other processes through a shared cache, and writes
+made outside the mutations (shell, seeding, data fixes) bump nothing. So a
+snapshot is also rebuilt once it is ``MAX_AGE`` seconds old, and
+``get_products`` checks ids missing from it against the database before
+treating them as unknown.
+
+Stock is deliberately left out. It changes with every order, and checks on
+it must run against the database inside the writing transaction. For the
+same reason the snapshot has its own version rather than the Product one:
+writers that add products or change names or prices call ``invalidate()``,
+while stock changes leave the snapshot alone.
+"""
+import threading
+import time
+from types import MappingProxyType
+
+from . import caching
+from .models import Product
+from .routers import PRIMARY
+
+
+SCOPE = 'crm.catalog'
+MAX_AGE = 60
+
+
+def invalidate():
+    """Rebuild every process's snapshot once the current transaction commits."""
+    caching.invalidate(SCOPE)
+
+
+class ProductRecord:
+    """Immutable, compact view of one product."""
+
+    __slots__ = ('pk', 'name', 'price')
+
+    def __init__(self, pk, name, price):
+        object.__setattr__(self, 'pk', pk)
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'price', price)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ProductRecord is immutable")
+
+    def __repr__(self):
+        return f"ProductRecord(pk={self.pk!r}, name={self.name!r}, price={self.price!r})"
+
+
+_lock = threading.Lock()
+_snapshot = (None, 0.0, MappingProxyType({}))
+
+
+def load_catalog():
+    """Read every product into a new read-only mapping."""
+    # From the primary: a lagging replica would be cached under the new version
+    rows = Product.objects.using(PRIMARY).values_list('pk', 'name', 'price')
+    return MappingProxyType({pk: ProductRecord(pk, name, price) for pk, name, price in rows.iterator()})
+
+
+def _fresh(snapshot, version):
+    snapshot_version, loaded_at, _ = snapshot
+    return snapshot_version == version and time.monotonic() - loaded_at < MAX_AGE
+
+
+def get_catalog(force=False):
+    """Return the current snapshot, rebuilding it if its version moved, it aged out, or ``force``."""
+    global _snapshot
+    version = caching.get_version(SCOPE)
+    snapshot = _snapshot
+    if not force and _fresh(snapshot, version):
+        return snapshot[2]
+    with _lock:
+        if _snapshot is not snapshot and _fresh(_snapshot, version):
+            # Another thread rebuilt it while this one waited
+            return _snapshot[2]
+        # Version first, rows second: a write in between only causes one extra reload
+        loaded_at = time.monotonic()
+        products = load_catalog()
+        _snapshot = (version, loaded_at, products)
+    return products
+
+
+def get_products(pks):
+    """
+    Map each of ``pks`` that exists to its ProductRecord. If an id missing
+    from the snapshot exists in the database, the snapshot missed a write
+    and is rebuilt first.
+    """
+    products = get_catalog()
+    missing = [pk for pk in pks if pk not in products]
+    if missing and Product.objects.using(PRIMARY).filter(pk__in=missing).exists():
+        products = get_catalog(force=True)
+    return {pk: products[pk] for pk in pks if pk in products}
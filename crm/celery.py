@@ -1,6 +1,5 @@
 import os
 from celery import Celery
-from django.conf import settings
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crm.settings')
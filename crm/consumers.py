@@ -0,0 +1,94 @@
+"""
+WebSocket consumer serving GraphQL subscriptions.
+
+Speaks the ``graphql-transport-ws`` protocol used by graphql-ws and Apollo
+clients: connection_init/connection_ack, subscribe, next, error, complete and
+ping/pong. Each subscription runs as its own task and gets its own context
+and DataLoaders.
+"""
+import asyncio
+from types import SimpleNamespace
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .async_schema import schema
+
+PROTOCOL = 'graphql-transport-ws'
+
+
+class GraphQLSubscriptionConsumer(AsyncJsonWebsocketConsumer):
+    schema = schema
+
+    async def connect(self):
+        self.acknowledged = False
+        self.operations = {}
+        if PROTOCOL not in self.scope.get('subprotocols', []):
+            await self.close(code=4406)
+            return
+        await self.accept(PROTOCOL)
+
+    async def disconnect(self, code):
+        for task in self.operations.values():
+            task.cancel()
+        self.operations.clear()
+
+    async def receive_json(self, message, **kwargs):
+        message_type = message.get('type')
+
+        if message_type == 'connection_init':
+            if self.acknowledged:
+                await self.close(code=4429)
+                return
+            self.acknowledged = True
+            await self.send_json({'type': 'connection_ack'})
+        elif message_type == 'ping':
+            await self.send_json({'type': 'pong'})
+        elif message_type == 'pong':
+            pass
+        elif message_type == 'subscribe':
+            if not self.acknowledged:
+                await self.close(code=4401)
+                return
+            operation_id = message.get('id')
+            if operation_id in self.operations:
+                await self.close(code=4409)
+                return
+            self.operations[operation_id] = asyncio.create_task(
+                self.run_operation(operation_id, message.get('payload') or {})
+            )
+        elif message_type == 'complete':
+            task = self.operations.pop(message.get('id'), None)
+            if task is not None:
+                task.cancel()
+        else:
+            await self.close(code=4400)
+
+    async def run_operation(self, operation_id, payload):
+        context = SimpleNamespace(scope=self.scope, loaders=None)
+        result = None
+        try:
+            result = await self.schema.subscribe(
+                payload.get('query', ''),
+                variable_values=payload.get('variables'),
+                operation_name=payload.get('operationName'),
+                context_value=context,
+            )
+            if hasattr(result, 'errors'):
+                await self.send_json({
+                    'id': operation_id,
+                    'type': 'error',
+                    'payload': [error.formatted for error in result.errors or []],
+                })
+                return
+
+            async for item in result:
+                message = {'data': item.data}
+                if item.errors:
+                    message['errors'] = [error.formatted for error in item.errors]
+                await self.send_json({'id': operation_id, 'type': 'next', 'payload': message})
+            await self.send_json({'id': operation_id, 'type': 'complete'})
+        finally:
+            self.operations.pop(operation_id, None)
+            # Leave the channel layer group even when the client cancelled us
+            if hasattr(result, 'aclose'):
+                await result.aclose()
@@ -0,0 +1,114 @@
+"""
+Row counts for ``totalCount`` on the filter connections.
+
+Clients pick a strategy per query with ``countStrategy``:
+
+- ``EXACT``: ``COUNT(*)`` (``COUNT(DISTINCT ...)`` with M2M filters) on
+  every request.
+- ``CACHED``: the exact count, kept ``CACHE_TTL`` seconds under the model's
+  ``crm.caching`` version and the normalized filters. Writes that
+  invalidate the model start over; others show up within the TTL.
+- ``ESTIMATED``: the field's own estimate when it has one (allOrders reads
+  the DailySales rollup). Otherwise the table's row estimate from the
+  database statistics for unfiltered queries, and PostgreSQL's planner
+  estimate for filtered ones. Where neither is available, the cached count.
+
+Only ``EXACT`` needs the count to page, so the other strategies fetch one
+row past the page instead (see ``schema.CountedConnectionField``).
+"""
+import json
+import logging
+
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+from . import caching
+
+EXACT = 'exact'
+CACHED = 'cached'
+ESTIMATED = 'estimated'
+
+CACHE_TTL = 60
+
+logger = logging.getLogger(__name__)
+
+
+def cached_count(queryset, parts, ttl=CACHE_TTL):
+    """``queryset.count()``, cached for ``ttl`` seconds under ``parts``."""
+    key = caching.make_key(queryset.model, ['count', parts])
+    total = cache.get(key)
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, ttl)
+    return total
+
+
+def table_estimate(model, using):
+    """Row count of ``model``'s table from the database statistics, or None."""
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table]),
+        # Filled in by ANALYZE; the first number of a table's stat is its row count
+        'sqlite': ("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table]),
+        'mysql': ("SELECT table_rows FROM information_schema.tables "
+                  "WHERE table_schema = DATABASE() AND table_name = %s", [table]),
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(*queries[connection.vendor])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # e.g. no sqlite_stat1 before the first ANALYZE
+        return None
+    if row is None or row[0] is None:
+        return None
+    total = int(str(row[0]).split()[0])
+    # PostgreSQL reports -1 for tables that were never analyzed
+    return total if total >= 0 else None
+
+
+def planner_estimate(queryset):
+    """PostgreSQL's estimate of the rows ``queryset`` returns, or None elsewhere."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.get_compiler(queryset.db).as_sql()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+    except DatabaseError:
+        logger.exception("Could not estimate the row count of %s", queryset.model._meta.label)
+        return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _filtered(queryset):
+    query = queryset.query
+    return bool(query.where) or bool(query.combinator)
+
+
+def estimated_count(queryset, parts, estimate=None):
+    """Cheap approximation of ``queryset.count()``; ``estimate`` is the field's own, tried first."""
+    total = estimate() if estimate is not None else None
+    if total is None and not _filtered(queryset):
+        total = table_estimate(queryset.model, queryset.db)
+    if total is None:
+        total = planner_estimate(queryset)
+    if total is None:
+        total = cached_count(queryset, parts)
+    return total
+
+
+def count(queryset, strategy, parts, estimate=None):
+    """Count ``queryset`` with ``strategy``. ``parts`` describe its filters for the cache key."""
+    if strategy == CACHED:
+        return cached_count(queryset, parts)
+    if strategy == ESTIMATED:
+        return estimated_count(queryset, parts, estimate)
+    return queryset.count()
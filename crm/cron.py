@@ -1,11 +1,19 @@
 from datetime import datetime
 from gql import gql, Client
 from gql.transport.requests import RequestsHTTPTransport
+import requests
+
+from .logsink import get_sink
+
+HEALTHZ_URL = "http://localhost:8000/healthz"
+HEARTBEAT_LOG = '/tmp/crm_heartbeat_log.txt'
+LOW_STOCK_LOG = '/tmp/low_stock_updates_log.txt'
 
 def log_crm_heartbeat():
     """
     Logs a heartbeat message every 5 minutes to confirm CRM application health.
-    Also verifies GraphQL endpoint responsiveness.
+    Uses the /healthz endpoint instead of a GraphQL query, so no schema
+    introspection is needed.
     """
     # Get current timestamp in required format
     timestamp = datetime.now().strftime('%d/%m/%Y-%H:%M:%S')
@@ -13,38 +21,27 @@ def log_crm_heartbeat():
     # Log basic heartbeat message
     heartbeat_message = f"{timestamp} CRM is alive"
     
-    # Try to verify GraphQL endpoint
-    graphql_status = "GraphQL endpoint: "
+    # Ask the health endpoint for probe results
+    health_status = "Health: "
+    body = {}
     try:
-        # Setup GraphQL client
-        transport = RequestsHTTPTransport(
-            url="http://localhost:8000/graphql",
-            use_json=True
+        response = requests.get(HEALTHZ_URL, timeout=5)
+        body = response.json()
+        checks = ", ".join(
+            f"{name} {'ok' if check['ok'] else 'FAILED'} ({check['latency_us']}us)"
+            for name, check in body.get('checks', {}).items()
         )
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        
-        # Query hello field to verify endpoint
-        query = gql("""
-            query {
-                hello
-            }
-        """)
-        
-        result = client.execute(query)
-        if 'hello' in result:
-            graphql_status += "responsive"
-        else:
-            graphql_status += "unexpected response"
-            
+        health_status += f"{body.get('status', 'unknown')} - {checks}"
     except Exception as e:
-        graphql_status += f"error: {str(e)}"
+        health_status += f"error: {str(e)}"
     
     # Combine messages
-    full_message = f"{heartbeat_message} - {graphql_status}"
+    full_message = f"{heartbeat_message} - {health_status}"
     
     # Append to log file
-    with open('/tmp/crm_heartbeat_log.txt', 'a') as log_file:
-        log_file.write(full_message + '\n')
+    get_sink(HEARTBEAT_LOG).write(
+        full_message, status=body.get('status'), checks=body.get('checks')
+    )
     
     return full_message
 
@@ -95,8 +92,9 @@ def update_low_stock():
                 log_message += f"  - {product['name']}: Stock updated to {product['stock']}\n"
             
             # Write to log file
-            with open('/tmp/low_stock_updates_log.txt', 'a') as log_file:
-                log_file.write(log_message + '\n')
+            get_sink(LOW_STOCK_LOG).write(
+                log_message, success=True, updated_products=updated_products
+            )
             
             return f"Success: {message}"
             
@@ -104,15 +102,13 @@ def update_low_stock():
             error_message = mutation_result.get('message', 'Unknown error')
             log_message = f"[{timestamp}] Failed to update low-stock products: {error_message}"
             
-            with open('/tmp/low_stock_updates_log.txt', 'a') as log_file:
-                log_file.write(log_message + '\n')
+            get_sink(LOW_STOCK_LOG).write(log_message, success=False, error=error_message)
             
             return f"Error: {error_message}"
             
     except Exception as e:
         error_msg = f"[{timestamp}] GraphQL mutation failed: {str(e)}"
         
-        with open('/tmp/low_stock_updates_log.txt', 'a') as log_file:
-            log_file.write(error_msg + '\n')
+        get_sink(LOW_STOCK_LOG).write(error_msg, success=False, error=str(e))
         
         return f"Exception: {str(e)}"
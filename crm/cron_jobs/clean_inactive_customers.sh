@@ -2,7 +2,7 @@
 
 # Get the directory where the script is located
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
-PROJECT_DIR="$(dirname "$SCRIPT_DIR")"
+PROJECT_DIR="$(dirname "$(dirname "$SCRIPT_DIR")")"
 
 # Change to project directory (where manage.py is located)
 cd "$PROJECT_DIR" || exit 1
@@ -11,20 +11,16 @@ cd "$PROJECT_DIR" || exit 1
 DELETED_COUNT=$(python manage.py shell -c "
 from django.utils import timezone
 from datetime import timedelta
-from customers.models import Customer
-from orders.models import Order
+from crm.models import Customer
 
 # Calculate date one year ago from now
 one_year_ago = timezone.now() - timedelta(days=365)
 
-# Find customers to delete:
-# 1. Customers with NO orders at all
-# 2. Customers whose last order was more than 1 year ago
-inactive_customers = Customer.objects.filter(
-    orders__isnull=True  # No orders at all
-) | Customer.objects.exclude(
-    orders__order_date__gte=one_year_ago  # No recent orders
-).distinct()  # Remove duplicates
+# Customers with no orders at all, or whose last order was more than a year
+# ago: one range query on the indexed last_order_at column
+inactive_customers = Customer.objects.filter(last_order_at__isnull=True) | Customer.objects.filter(
+    last_order_at__lt=one_year_ago
+)
 
 # Count how many will be deleted, then delete them
 count = inactive_customers.count()
@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 
+import sys
+from pathlib import Path
+
 from gql import gql, Client
 from gql.transport.requests import RequestsHTTPTransport
 from datetime import datetime, timedelta
 
+# Run as a plain script from cron, so make the project importable
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from crm.logsink import get_sink
+
+REMINDERS_LOG = '/tmp/order_reminders_log.txt'
+
 def send_order_reminders():
     # GraphQL endpoint configuration
     transport = RequestsHTTPTransport(
@@ -52,22 +62,21 @@ def send_order_reminders():
             order_date = order.get('orderDate', 'N/A')
             
             log_entry = f"[{timestamp}] Order ID: {order_id}, Customer Email: {customer_email}, Order Date: {order_date}"
-            log_message(log_entry)
+            log_message(log_entry, order_id=order_id, customer_email=customer_email, order_date=order_date)
         
         # Print success message and log
         success_msg = f"[{timestamp}] Order reminders processed! Found {len(orders)} pending orders."
-        log_message(success_msg)
+        log_message(success_msg, pending_orders=len(orders))
         print("Order reminders processed!")
         
     except Exception as e:
         error_msg = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error: {e}"
-        log_message(error_msg)
+        log_message(error_msg, error=str(e))
         print(f"Error: {e}")
 
-def log_message(message):
-    """Append message to log file"""
-    with open('/tmp/order_reminders_log.txt', 'a') as log_file:
-        log_file.write(message + '\n')
+def log_message(message, **fields):
+    """Append message to the shared, buffered reminders log"""
+    get_sink(REMINDERS_LOG).write(message, **fields)
 
 if __name__ == "__main__":
     send_order_reminders()
@@ -0,0 +1,41 @@
+"""
+SQLite connection tuning.
+
+Every new SQLite connection gets the pragmas below (override them with the
+SQLITE_PRAGMAS setting). WAL lets readers keep going while CreateOrder or a
+cron job is writing. synchronous=NORMAL is durable across application
+crashes in WAL mode. busy_timeout makes writers wait for the lock instead of
+failing with "database is locked", and mmap/cache_size keep hot pages in
+memory. Pair this with CONN_MAX_AGE so each worker pays the setup cost once
+rather than on every request.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative means KiB, so 64 MiB
+    'temp_store': 'MEMORY',
+}
+
+
+def sqlite_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_SQLITE_PRAGMAS)
+
+
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, sqlite_pragmas())
+
+
+connection_created.connect(configure_sqlite, dispatch_uid='crm.db.configure_sqlite')
@@ -0,0 +1,90 @@
+"""
+Streaming NDJSON/CSV exports of orders and customers.
+
+Rows are read with ``values()`` and ``iterator(chunk_size=...)``, then
+serialized one chunk at a time. Only one chunk is ever held in memory, however
+many rows match.
+"""
+import csv
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .filters import CustomerFilter, OrderFilter
+from .models import Customer, Order
+from .utils import chunked
+
+CHUNK_SIZE = 2000
+
+CUSTOMER_FIELDS = ['id', 'name', 'email', 'phone', 'created_at']
+ORDER_FIELDS = ['id', 'order_date', 'total_amount', 'customer_id', 'customer__name', 'customer__email']
+# Filters that join the M2M table and can repeat an order
+ORDER_M2M_FILTERS = {'products', 'product_name', 'product_id'}
+
+
+def customer_rows(params, chunk_size=CHUNK_SIZE):
+    """Filter with CustomerFilter and yield lists of row dicts, one list per chunk."""
+    filterset = CustomerFilter(params, queryset=Customer.objects.all())
+    if not filterset.is_valid():
+        raise ValueError(filterset.errors.get_json_data())
+    queryset = filterset.qs.order_by('pk').values(*CUSTOMER_FIELDS)
+    return chunked(queryset.iterator(chunk_size=chunk_size), chunk_size)
+
+
+def order_rows(params, chunk_size=CHUNK_SIZE):
+    """Filter with OrderFilter and yield lists of order row dicts with product ids, one list per chunk."""
+    filterset = OrderFilter(params, queryset=Order.objects.all())
+    if not filterset.is_valid():
+        raise ValueError(filterset.errors.get_json_data())
+    queryset = filterset.qs.order_by('pk').values(*ORDER_FIELDS)
+    if ORDER_M2M_FILTERS & set(params):
+        queryset = queryset.distinct()
+    return _with_product_ids(chunked(queryset.iterator(chunk_size=chunk_size), chunk_size))
+
+
+def _with_product_ids(chunks):
+    links = Order.products.through.objects
+    for chunk in chunks:
+        product_ids = {row['id']: [] for row in chunk}
+        for order_id, product_id in links.filter(order_id__in=product_ids).values_list('order_id', 'product_id'):
+            product_ids[order_id].append(product_id)
+        for row in chunk:
+            row['product_ids'] = product_ids[row['id']]
+        yield chunk
+
+
+def ndjson_chunks(row_chunks):
+    encoder = DjangoJSONEncoder()
+    for chunk in row_chunks:
+        yield ''.join(encoder.encode(row) + '\n' for row in chunk)
+
+
+def csv_chunks(row_chunks, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for chunk in row_chunks:
+        for row in chunk:
+            if isinstance(row.get('product_ids'), list):
+                row['product_ids'] = ' '.join(map(str, row['product_ids']))
+            writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+EXPORTS = {
+    'customers': (customer_rows, CUSTOMER_FIELDS),
+    'orders': (order_rows, ORDER_FIELDS + ['product_ids']),
+}
+
+
+def export(kind, params, fmt):
+    """Return an iterator of text chunks for ``kind`` ('orders'/'customers') in ``fmt`` ('ndjson'/'csv')."""
+    rows, fields = EXPORTS[kind]
+    row_chunks = rows(params)
+    if fmt == 'csv':
+        return csv_chunks(row_chunks, fields)
+    return ndjson_chunks(row_chunks)
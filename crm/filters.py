@@ -1,21 +1,43 @@
 import django_filters
-from .models import Customer, Product, Order
+import graphene
+from graphene_django.filter import TypedFilter
+from .models import ArchivedOrder, Customer, Product, Order
 from django.db.models import Q
 
+class ListOrderingFilter(TypedFilter, django_filters.OrderingFilter):
+    """OrderingFilter taking a list of fields, e.g. orderBy: ["-price", "name"]."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('input_type', graphene.List(graphene.String))
+        super().__init__(*args, **kwargs)
+
 class CustomerFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(lookup_expr='icontains')
     email = django_filters.CharFilter(lookup_expr='icontains')
     created_at__gte = django_filters.DateFilter(field_name='created_at', lookup_expr='gte')
     created_at__lte = django_filters.DateFilter(field_name='created_at', lookup_expr='lte')
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
+    order_count__gte = django_filters.NumberFilter(field_name='order_count', lookup_expr='gte')
+    order_count__lte = django_filters.NumberFilter(field_name='order_count', lookup_expr='lte')
+    lifetime_value__gte = django_filters.NumberFilter(field_name='lifetime_value', lookup_expr='gte')
+    lifetime_value__lte = django_filters.NumberFilter(field_name='lifetime_value', lookup_expr='lte')
+    last_order_at__gte = django_filters.DateFilter(field_name='last_order_at', lookup_expr='gte')
+    last_order_at__lte = django_filters.DateFilter(field_name='last_order_at', lookup_expr='lte')
+    inactive_since = django_filters.DateFilter(method='filter_inactive_since')
+    order_by = ListOrderingFilter(
+        fields=('name', 'created_at', 'order_count', 'lifetime_value', 'last_order_at')
+    )
 
     class Meta:
         model = Customer
-        fields = ['name', 'email', 'created_at']
+        fields = ['name', 'email', 'created_at', 'order_count', 'lifetime_value', 'last_order_at']
 
     def filter_phone_pattern(self, queryset, name, value):
         return queryset.filter(phone__startswith=value)
 
+    def filter_inactive_since(self, queryset, name, value):
+        return queryset.filter(Q(last_order_at__isnull=True) | Q(last_order_at__lt=value))
+
 class ProductFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(lookup_expr='icontains')
     price__gte = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
@@ -23,6 +45,7 @@ class ProductFilter(django_filters.FilterSet):
     stock__gte = django_filters.NumberFilter(field_name='stock', lookup_expr='gte')
     stock__lte = django_filters.NumberFilter(field_name='stock', lookup_expr='lte')
     low_stock = django_filters.BooleanFilter(method='filter_low_stock')
+    order_by = ListOrderingFilter(fields=('name', 'price', 'stock'))
 
     class Meta:
         model = Product
@@ -41,7 +64,15 @@ class OrderFilter(django_filters.FilterSet):
     customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
     product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains')
     product_id = django_filters.NumberFilter(field_name='products__id')
+    order_by = ListOrderingFilter(fields=('id', 'order_date', 'total_amount'))
 
     class Meta:
         model = Order
-        fields = ['total_amount', 'order_date', 'customer', 'products']
\ No newline at end of file
+        fields = ['total_amount', 'order_date', 'customer', 'products']
+
+class ArchivedOrderFilter(OrderFilter):
+    """OrderFilter over ArchivedOrder, for allOrders(includeArchived: true)."""
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['total_amount', 'order_date', 'customer', 'products']
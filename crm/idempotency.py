@@ -0,0 +1,141 @@
+"""
+Idempotency keys for GraphQL mutations.
+
+A client that may retry a mutation sends an ``Idempotency-Key`` header. The
+first request with a key takes an in-flight lock, runs, and stores its
+response for ``TTL`` seconds under the key and a hash of the request body.
+Later requests behave as follows:
+
+- same key and same body: get the stored response back (marked with an
+  ``Idempotent-Replayed`` header) without running the mutation again;
+- same key while the first one is still running: 409;
+- same key with a different body: 422.
+
+Responses with top-level errors are not stored, so those requests can be
+retried. Batched requests (a JSON array) with a mutation cannot use a key.
+Entries live in the Django cache, so every worker must share it
+(``CRM_CACHE_URL``).
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from graphql import GraphQLError, OperationType, parse
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+TTL = 24 * 60 * 60
+LOCK_TIMEOUT = 60
+
+
+def _error(message, status):
+    return JsonResponse({'errors': [{'message': message}]}, status=status)
+
+
+def is_mutation(query):
+    """Whether ``query`` holds a mutation operation; False when it does not parse."""
+    try:
+        document = parse(query)
+    except GraphQLError:
+        return False
+    return any(getattr(definition, 'operation', None) == OperationType.MUTATION for definition in document.definitions)
+
+
+class Claim:
+    """One request's hold on an idempotency key."""
+
+    def __init__(self, key, fingerprint):
+        # Hashed so any client string makes a valid cache key
+        self.key = hashlib.sha256(key.encode()).hexdigest()
+        self.fingerprint = fingerprint
+        self.response = None
+        self.locked = False
+
+    @property
+    def result_key(self):
+        return f'crm:idempotency:{self.key}'
+
+    @property
+    def lock_key(self):
+        return f'crm:idempotency:{self.key}:lock'
+
+    def _stored_response(self):
+        stored = cache.get(self.result_key)
+        if stored is None:
+            return None
+        if stored['fingerprint'] != self.fingerprint:
+            return _error(f"{HEADER} was already used for a different request", 422)
+        response = HttpResponse(stored['content'], status=stored['status'], content_type=stored['content_type'])
+        response[REPLAYED_HEADER] = 'true'
+        return response
+
+    def acquire(self):
+        """Set ``response`` to the stored or refusing response, or take the in-flight lock."""
+        self.response = self._stored_response()
+        if self.response is not None:
+            return
+        if cache.add(self.lock_key, self.fingerprint, LOCK_TIMEOUT):
+            self.locked = True
+            return
+        # The first request may have finished in the meantime
+        self.response = self._stored_response() or _error(
+            f"A request with this {HEADER} is still in progress", 409
+        )
+
+    def complete(self, response):
+        """Store ``response`` for replays unless it failed."""
+        if response.status_code != 200 or getattr(response, 'streaming', False):
+            return
+        try:
+            body = json.loads(response.content)
+        except ValueError:
+            return
+        if body.get('errors'):
+            return
+        cache.set(self.result_key, {
+            'fingerprint': self.fingerprint,
+            'status': response.status_code,
+            'content': response.content,
+            'content_type': response['Content-Type'],
+        }, TTL)
+
+    def release(self):
+        if self.locked:
+            cache.delete(self.lock_key)
+            self.locked = False
+
+
+def claim(request):
+    """
+    Return a Claim for a mutation request carrying an idempotency key, after
+    acquiring it, or None when the request does not use one. A malformed key
+    yields a Claim whose ``response`` is a 400.
+    """
+    key = request.headers.get(HEADER)
+    if not key or request.method != 'POST':
+        return None
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    if isinstance(data, list):
+        # One stored response per key cannot stand for several operations
+        if any(isinstance(entry, dict) and is_mutation(entry.get('query') or '') for entry in data):
+            request_claim = Claim(key, '')
+            request_claim.response = _error(f"{HEADER} cannot be used with batched mutations", 400)
+            return request_claim
+        return None
+    if not isinstance(data, dict) or not is_mutation(data.get('query') or ''):
+        return None
+
+    fingerprint = hashlib.sha256(json.dumps(
+        [data.get('query'), data.get('variables'), data.get('operationName')], sort_keys=True,
+    ).encode()).hexdigest()
+    request_claim = Claim(key, fingerprint)
+    if len(key) > MAX_KEY_LENGTH:
+        request_claim.response = _error(f"{HEADER} must be at most {MAX_KEY_LENGTH} characters", 400)
+        return request_claim
+    request_claim.acquire()
+    return request_claim
@@ -0,0 +1,141 @@
+"""
+Background customer CSV imports.
+
+``create_import_job`` splits an uploaded CSV into ImportChunks and queues one
+Celery task per chunk. ``process_chunk`` validates a whole chunk in memory,
+checks for existing emails with a single query and inserts the rest with
+``bulk_create``. It marks the chunk done in the same transaction, so a retried
+or resumed chunk is never imported twice.
+"""
+import csv
+import io
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import caching, outbox
+from .models import Customer, ImportChunk, ImportJob
+from .utils import chunked
+
+CHUNK_SIZE = 1000
+BULK_BATCH_SIZE = 500
+COLUMNS = ('name', 'email', 'phone')
+
+
+def create_import_job(fileobj, filename='', chunk_size=CHUNK_SIZE):
+    """Store the CSV in ``fileobj`` as chunks of an ImportJob and queue them once committed."""
+    reader = csv.DictReader(io.TextIOWrapper(fileobj, encoding='utf-8-sig'))
+    missing = {'name', 'email'} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(sorted(missing))}")
+
+    with transaction.atomic():
+        job = ImportJob.objects.create(filename=filename)
+        total_rows = total_chunks = 0
+        rows = ({column: (row.get(column) or '').strip() for column in COLUMNS} for row in reader)
+        for index, chunk in enumerate(chunked(rows, chunk_size)):
+            ImportChunk.objects.create(job=job, index=index, first_row=total_rows + 1, rows=chunk)
+            total_rows += len(chunk)
+            total_chunks += 1
+        job.total_rows = total_rows
+        job.total_chunks = total_chunks
+        if not total_chunks:
+            job.finished_at = timezone.now()
+        job.save()
+        transaction.on_commit(lambda: dispatch_chunks(job.pk))
+    return job
+
+
+def dispatch_chunks(job_id):
+    """Queue every chunk of ``job_id`` that is not done yet; also used to resume a job."""
+    from celery import group
+
+    from .tasks import import_customer_chunk
+
+    pending = ImportChunk.objects.filter(job_id=job_id, status=ImportChunk.PENDING).values_list('pk', flat=True)
+    tasks = [import_customer_chunk.s(chunk_id) for chunk_id in pending]
+    if tasks:
+        group(tasks).apply_async()
+    return len(tasks)
+
+
+def validate_rows(chunk):
+    """Split a chunk's rows into (row number, unsaved Customer) pairs and [row number, message] errors."""
+    errors = []
+    candidates = []
+    for offset, row in enumerate(chunk.rows):
+        number = chunk.first_row + offset
+        customer = Customer(name=row['name'], email=row['email'], phone=row['phone'] or None)
+        try:
+            customer.clean_fields(exclude=['created_at'])
+        except ValidationError as e:
+            errors.append([number, '; '.join(
+                f"{field}: {' '.join(messages)}" for field, messages in e.message_dict.items()
+            )])
+            continue
+        candidates.append((number, customer))
+
+    emails = [customer.email for _, customer in candidates]
+    existing = set(Customer.objects.filter(email__in=emails).values_list('email', flat=True))
+    valid = []
+    for number, customer in candidates:
+        if customer.email in existing:
+            errors.append([number, "Email already exists"])
+            continue
+        existing.add(customer.email)
+        valid.append((number, customer))
+    return valid, errors
+
+
+def insert_customers(valid, errors):
+    """
+    Bulk insert ``valid`` customers, falling back to row-by-row when another
+    chunk raced us. Returns the created customers.
+    """
+    try:
+        with transaction.atomic():
+            return Customer.objects.bulk_create([customer for _, customer in valid], batch_size=BULK_BATCH_SIZE)
+    except IntegrityError:
+        created = []
+        for number, customer in valid:
+            customer.pk = None
+            customer._state.adding = True
+            try:
+                with transaction.atomic():
+                    customer.save()
+                created.append(customer)
+            except IntegrityError:
+                errors.append([number, "Email already exists"])
+        return created
+
+
+def process_chunk(chunk_id):
+    """Import one chunk; a chunk that is already done is returned untouched."""
+    with transaction.atomic():
+        chunk = ImportChunk.objects.select_for_update().get(pk=chunk_id)
+        if chunk.status == ImportChunk.DONE:
+            return chunk
+
+        valid, errors = validate_rows(chunk)
+        created = insert_customers(valid, errors)
+        if created:
+            caching.invalidate(Customer)
+            outbox.customers_created(created)
+
+        chunk.status = ImportChunk.DONE
+        chunk.created_count = len(created)
+        chunk.errors = sorted(errors)
+        chunk.save(update_fields=['status', 'created_count', 'errors'])
+
+        ImportJob.objects.filter(pk=chunk.job_id).update(
+            completed_chunks=F('completed_chunks') + 1,
+            processed_rows=F('processed_rows') + len(chunk.rows),
+            created_count=F('created_count') + len(created),
+            error_count=F('error_count') + len(errors),
+        )
+        ImportJob.objects.filter(
+            pk=chunk.job_id, completed_chunks__gte=F('total_chunks'), finished_at__isnull=True
+        ).update(finished_at=timezone.now())
+    return chunk
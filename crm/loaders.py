@@ -0,0 +1,125 @@
+"""
+Per-request async DataLoaders for the async GraphQL path, and a per-request
+memo for the sync one.
+
+Both paths run the resolvers of ``crm.schema``. Those marked ``loop_safe``
+run on the event loop under ``crm.async_schema`` and check ``on_event_loop``
+to return DataLoader futures there; every other resolver runs in a worker
+thread, where it takes the sync path.
+
+Each loader collects the keys requested during one tick of the event loop and
+fetches them with a single async ORM query, so resolving ``customer`` on 50
+orders costs one query instead of 50. The sync resolvers look objects up
+through ``memoized``, which loads each one once per request.
+
+Both live on the request, so every operation of a batched request shares
+them. The views call ``reset`` around mutations so later operations never
+see objects loaded before a write.
+"""
+import asyncio
+from collections import defaultdict
+
+from graphene.utils.dataloader import DataLoader
+
+from .models import ArchivedOrderProduct, Customer, Order, Product
+
+
+class ModelLoader(DataLoader):
+    """Load model instances by primary key; missing keys resolve to None."""
+
+    model = None
+
+    async def batch_load_fn(self, keys):
+        objects = {obj.pk: obj async for obj in self.model.objects.filter(pk__in=keys)}
+        return [objects.get(key) for key in keys]
+
+
+class CustomerLoader(ModelLoader):
+    model = Customer
+
+
+class ProductLoader(ModelLoader):
+    model = Product
+
+
+class OrderLoader(ModelLoader):
+    model = Order
+
+
+class OrderProductsLoader(DataLoader):
+    """Load the products of many orders through one query on the M2M table."""
+
+    links = Order.products.through
+
+    def __init__(self, product_loader, **kwargs):
+        super().__init__(**kwargs)
+        self.product_loader = product_loader
+
+    async def batch_load_fn(self, order_ids):
+        products = defaultdict(list)
+        links = self.links.objects.filter(order_id__in=order_ids).select_related('product')
+        async for link in links:
+            products[link.order_id].append(link.product)
+            self.product_loader.prime(link.product_id, link.product)
+        return [products[order_id] for order_id in order_ids]
+
+
+class ArchivedOrderProductsLoader(OrderProductsLoader):
+    """OrderProductsLoader for archived orders."""
+
+    links = ArchivedOrderProduct
+
+
+class Loaders:
+    """The set of loaders shared by every resolver in one request."""
+
+    def __init__(self):
+        self.customer = CustomerLoader()
+        self.product = ProductLoader()
+        self.order = OrderLoader()
+        self.order_products = OrderProductsLoader(self.product)
+        self.archived_order_products = ArchivedOrderProductsLoader(self.product)
+
+
+def get_loaders(info):
+    """Return the request's loaders, creating them on first use."""
+    context = info.context
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = Loaders()
+        context.loaders = loaders
+    return loaders
+
+
+def memoized(info, key, load):
+    """Return ``load()``, called at most once per request for ``key``."""
+    context = info.context
+    if context is None:
+        return load()
+    memo = getattr(context, 'memo', None)
+    if memo is None:
+        memo = context.memo = {}
+    if key not in memo:
+        memo[key] = load()
+    return memo[key]
+
+
+def reset(context):
+    """Forget everything loaded so far in the request."""
+    context.loaders = Loaders()
+    context.memo = {}
+
+
+def on_event_loop():
+    """Whether the caller runs on an event loop rather than in a worker thread."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def loop_safe(resolver):
+    """Mark ``resolver`` as safe to call on the event loop: it never queries the database itself."""
+    resolver.loop_safe = True
+    return resolver
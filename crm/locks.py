@@ -0,0 +1,150 @@
+"""
+Single-flight locks for scheduled jobs.
+
+``@single_flight()`` lets one run of a job go ahead cluster-wide, however
+many beat schedulers, workers or nodes fire it. The lock is a JobLease row,
+taken and kept with conditional updates only:
+
+- Taking it succeeds only when the lease has expired. A crashed or killed
+  holder therefore loses the lock after at most ``ttl`` (stale takeover).
+- While the job runs, a thread renews the lease every ``ttl / 3``. Jobs
+  longer than ``ttl`` keep the lock. A holder that stalled and was taken
+  over notices on its next renewal.
+- Long jobs call ``check()`` between batches. Once the lease is lost, or
+  has gone unrenewed past its expiry, ``check()`` raises LeaseLost and the
+  job stops before writing anything else. The run then returns
+  ``{'aborted': reason}``.
+- With ``every``, a run is also skipped when the previous one started less
+  than half of ``every`` ago. A job scheduled once per interval then runs
+  once per interval, even when it fires twice.
+
+Skipped runs return ``{'skipped': reason}`` and do nothing else.
+"""
+import functools
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import JobLease
+from .routers import PRIMARY
+
+TTL = timedelta(minutes=2)
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('crm_job_lease', default=None)
+
+
+class LeaseLost(Exception):
+    """The running job no longer holds its lease; another run may have taken over."""
+
+
+class Lease:
+    """A held JobLease, renewed in the background until ``release()``."""
+
+    def __init__(self, name, owner, ttl, expires_at):
+        self.name = name
+        self.owner = owner
+        self.ttl = ttl
+        self.expires_at = expires_at
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._renew, name=f'lease:{name}', daemon=True)
+        self._thread.start()
+
+    def _mine(self):
+        return JobLease.objects.filter(name=self.name, owner=self.owner)
+
+    def renew(self):
+        """Extend the lease by ``ttl``. Returns False, and marks it lost, when another process took it over."""
+        expires_at = timezone.now() + self.ttl
+        if not self._mine().update(expires_at=expires_at):
+            self.lost = True
+            logger.warning("Lost the lease on %s to another process", self.name)
+            return False
+        self.expires_at = expires_at
+        return True
+
+    def _renew(self):
+        try:
+            while not self._stop.wait(self.ttl.total_seconds() / 3):
+                try:
+                    if not self.renew():
+                        return
+                except Exception:
+                    # Try again next time; check() fails once the lease runs out
+                    logger.exception("Could not renew the lease on %s", self.name)
+        finally:
+            connection.close()
+
+    def check(self):
+        """Raise LeaseLost unless the lease is still held."""
+        if self.lost or timezone.now() >= self.expires_at:
+            raise LeaseLost(f"Lost the lease on {self.name}")
+
+    def release(self):
+        self._stop.set()
+        self._thread.join()
+        now = timezone.now()
+        self._mine().update(expires_at=now, finished_at=now)
+
+
+def acquire(name, ttl=TTL, every=None):
+    """Take the lease on ``name``. Returns a Lease, or None when it is held or ran too recently."""
+    now = timezone.now()
+    owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    due = Q()
+    if every is not None:
+        due = Q(started_at__isnull=True) | Q(started_at__lte=now - every / 2)
+    taken = JobLease.objects.filter(due, name=name, expires_at__lte=now).update(
+        owner=owner, expires_at=now + ttl, started_at=now, finished_at=None,
+    )
+    if not taken:
+        if JobLease.objects.using(PRIMARY).filter(name=name).exists():
+            return None
+        try:
+            with transaction.atomic():
+                JobLease.objects.create(name=name, owner=owner, expires_at=now + ttl, started_at=now)
+        except IntegrityError:
+            # Someone else created it first
+            return None
+    return Lease(name, owner, ttl, now + ttl)
+
+
+def check():
+    """In a single-flight job, raise LeaseLost once its lease is lost. Does nothing elsewhere."""
+    lease = _current.get()
+    if lease is not None:
+        lease.check()
+
+
+def single_flight(name=None, ttl=TTL, every=None):
+    """Run the decorated job only while holding its lease (named after the function by default)."""
+    def decorate(func):
+        lock_name = name or f'{func.__module__}.{func.__name__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            lease = acquire(lock_name, ttl, every)
+            if lease is None:
+                logger.info("Skipping %s: already running or ran recently", lock_name)
+                return {'skipped': 'already running or ran recently'}
+            token = _current.set(lease)
+            try:
+                return func(*args, **kwargs)
+            except LeaseLost as error:
+                logger.warning("Stopped %s: %s", lock_name, error)
+                return {'aborted': str(error)}
+            finally:
+                _current.reset(token)
+                lease.release()
+        return wrapper
+    return decorate
@@ -0,0 +1,248 @@
+"""
+Buffered, rotating log files for cron jobs and Celery tasks.
+
+``get_sink(path)`` hands out one LogSink per path per process, so a job keeps a
+single open handle instead of reopening the file for every line. Writes are
+buffered, and a background thread flushes them every few seconds; they are
+also flushed at exit. Files are rotated once they pass a size or an age
+limit. Every write checks both, including the first write of a short-lived
+process. A file's age is kept in a ``<path>.started`` sidecar, because most
+filesystems do not record when a file was created.
+
+Several processes (cron jobs, Celery workers) may append to the same file.
+Rotation takes an exclusive lock on ``<path>.lock`` and checks the size again
+from the file on disk, so only one of them rotates. The others notice that the
+path now names a new file, as logging's WatchedFileHandler does, and reopen it
+before their next write.
+
+Set CRM_LOG_FORMAT=json to write JSON lines instead of plain text. Each
+record then carries a timestamp, the message and any extra fields the
+caller passed.
+
+This module does not import Django so standalone scripts can use it.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process lock on Windows; rotation there is per process
+    fcntl = None
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 5
+
+
+class LogSink:
+    """A single append-only log file with buffering and size/age rotation."""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE,
+                 backup_count=DEFAULT_BACKUP_COUNT, json_lines=None,
+                 buffer_size=DEFAULT_BUFFER_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        if json_lines is None:
+            json_lines = os.environ.get('CRM_LOG_FORMAT', '').lower() == 'json'
+        self.json_lines = json_lines
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+        self._identity = None
+        self._size = 0
+        self._started_at = 0.0
+        self._last_flush = 0.0
+        self._pending = False
+
+    def write(self, message, **fields):
+        """Append one record. ``fields`` are only written in JSON mode."""
+        if self.json_lines:
+            record = {'ts': datetime.now().isoformat(timespec='seconds'), 'message': message}
+            record.update(fields)
+            line = json.dumps(record, default=str)
+        else:
+            line = message
+        data = line + '\n'
+
+        with self._lock:
+            if self._file is None or self._pid != os.getpid():
+                self._open()
+            elif self._moved():
+                self._reopen()
+            if self._should_rotate(len(data)):
+                self._rotate(len(data))
+            self._file.write(data)
+            self._size += len(data)
+            self._pending = True
+
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval:
+                self._flush(now)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._flush(time.monotonic())
+
+    def flush_if_due(self):
+        """Flush records older than ``flush_interval``; called by the flusher thread."""
+        with self._lock:
+            now = time.monotonic()
+            if self._pending and self._pid == os.getpid() and now - self._last_flush >= self.flush_interval:
+                self._flush(now)
+
+    def _flush(self, now):
+        self._file.flush()
+        self._last_flush = now
+        self._pending = False
+
+    def close(self):
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._file.close()
+            self._file = None
+
+    def _open(self):
+        # A forked child must not reuse (or flush) the parent's handle
+        self._file = open(self.path, 'a', buffering=self.buffer_size, encoding='utf-8')
+        self._pid = os.getpid()
+        stat = os.fstat(self._file.fileno())
+        self._identity = (stat.st_dev, stat.st_ino)
+        self._size = self._file.tell()
+        self._started_at = self._read_started_at()
+        self._last_flush = time.monotonic()
+        self._pending = False
+        _start_flusher()
+
+    @property
+    def _started_path(self):
+        return f"{self.path}.started"
+
+    def _read_started_at(self):
+        if self._size:
+            try:
+                with open(self._started_path, encoding='utf-8') as sidecar:
+                    return float(sidecar.read())
+            except (OSError, ValueError):
+                pass
+        # A new file, or one from before the sidecar existed: its age starts now
+        return self._mark_started()
+
+    def _mark_started(self):
+        started_at = time.time()
+        with open(self._started_path, 'w', encoding='utf-8') as sidecar:
+            sidecar.write(repr(started_at))
+        return started_at
+
+    def _should_rotate(self, incoming):
+        if self._size and self._size + incoming > self.max_bytes:
+            return True
+        return self._size > 0 and time.time() - self._started_at > self.max_age
+
+    def _moved(self):
+        """Whether the path no longer names our file, e.g. another process rotated it."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_dev, stat.st_ino) != self._identity
+
+    def _reopen(self):
+        self._file.close()
+        self._open()
+
+    def _rotate(self, incoming):
+        with _file_lock(f"{self.path}.lock"):
+            # Another process may have rotated, or grown the file, since we
+            # last looked: decide again from the file on disk
+            self._file.flush()
+            if self._moved():
+                self._reopen()
+                return
+            self._size = os.fstat(self._file.fileno()).st_size
+            if not self._should_rotate(incoming):
+                return
+            self._file.close()
+            if self.backup_count > 0:
+                for index in range(self.backup_count - 1, 0, -1):
+                    source = f"{self.path}.{index}"
+                    if os.path.exists(source):
+                        os.replace(source, f"{self.path}.{index + 1}")
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+            self._open()
+
+
+@contextmanager
+def _file_lock(path):
+    """Hold an exclusive lock on ``path`` across processes."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(path, **options):
+    """Return the process-wide sink for ``path``, creating it on first use."""
+    with _sinks_lock:
+        sink = _sinks.get(path)
+        if sink is None:
+            sink = _sinks[path] = LogSink(path, **options)
+        return sink
+
+
+FLUSHER_TICK = 1
+_flusher_pid = None
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSHER_TICK)
+        for sink in list(_sinks.values()):
+            sink.flush_if_due()
+
+
+def _start_flusher():
+    """Start this process's flusher thread, once; a forked child starts its own."""
+    global _flusher_pid
+    with _sinks_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_loop, name='logsink-flusher', daemon=True).start()
+
+
+def flush_all():
+    for sink in list(_sinks.values()):
+        sink.flush()
+
+
+def close_all():
+    for sink in list(_sinks.values()):
+        sink.close()
+
+
+atexit.register(close_all)
+# Empty the buffers before forking so children do not write them a second time
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=flush_all)
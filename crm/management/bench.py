@@ -0,0 +1,12 @@
+"""Helpers shared by the bench_* management commands."""
+import statistics
+
+
+def percentiles(samples, *points):
+    """The ``points`` percentiles (1-99) of ``samples``, or 0 for each when there are none."""
+    if not samples:
+        return [0.0] * len(points)
+    if len(samples) == 1:
+        return [samples[0]] * len(points)
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return [cuts[point - 1] for point in points]
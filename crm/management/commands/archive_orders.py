@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from crm import archive
+from crm.routers import pin_primary
+
+
+class Command(BaseCommand):
+    help = "Move orders older than the archive horizon, and their product links, to the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CRM_ORDER_ARCHIVE_DAYS,
+                            help="Archive orders placed more than this many days ago")
+        parser.add_argument('--chunk-size', type=int, default=archive.CHUNK_SIZE)
+        parser.add_argument('--max-chunks', type=int, default=None)
+
+    def handle(self, *args, **options):
+        pin_primary()
+        before = timezone.now() - timedelta(days=options['days'])
+        moved = archive.archive_orders(before, options['chunk_size'], options['max_chunks'])
+        self.stdout.write(f"Archived {moved} orders placed before {before:%Y-%m-%d %H:%M}")
@@ -0,0 +1,88 @@
+import time
+from contextlib import ExitStack
+
+from celery import Celery
+from celery.contrib.testing.worker import start_worker
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from crm.management.bench import percentiles
+
+REPORT_QUEUE = 'reports'
+SHORT_QUEUE = 'inventory'
+
+
+def make_app():
+    app = Celery('bench', broker='memory://', backend='cache+memory://')
+    app.conf.broker_transport_options = {'polling_interval': 0.001}
+
+    @app.task(name='bench.report')
+    def report(seconds):
+        time.sleep(seconds)
+
+    @app.task(name='bench.short')
+    def short(sent):
+        # Time from enqueue to start: what a stock or reminder task waits
+        return time.time() - sent
+
+    return app, report, short
+
+
+def run(routed, reports, report_seconds, shorts, interval):
+    """Queue ``reports`` long tasks, then ``shorts`` short ones; return the short tasks' waits."""
+    app, report, short = make_app()
+    workers = settings.CRM_CELERY_WORKERS
+    with ExitStack() as stack:
+        if routed:
+            for queue in (REPORT_QUEUE, SHORT_QUEUE):
+                stack.enter_context(start_worker(
+                    app, pool='threads', queues=[queue], hostname=f'{queue}@bench', perform_ping_check=False,
+                    concurrency=workers[queue]['concurrency'],
+                    prefetch_multiplier=workers[queue]['prefetch_multiplier'],
+                ))
+            report_queue, short_queue = REPORT_QUEUE, SHORT_QUEUE
+        else:
+            # One worker with the same total threads. Unlimited prefetch: the
+            # memory transport only refills a full prefetch window every 2 s,
+            # which would overstate the wait.
+            concurrency = workers[REPORT_QUEUE]['concurrency'] + workers[SHORT_QUEUE]['concurrency']
+            stack.enter_context(start_worker(
+                app, pool='threads', queues=['celery'], hostname='shared@bench', perform_ping_check=False,
+                concurrency=concurrency, prefetch_multiplier=0,
+            ))
+            report_queue = short_queue = 'celery'
+
+        for _ in range(reports):
+            report.apply_async((report_seconds,), queue=report_queue)
+        results = []
+        for _ in range(shorts):
+            results.append(short.apply_async((time.time(),), queue=short_queue))
+            time.sleep(interval)
+        return sorted(result.get(timeout=reports * report_seconds + 60) for result in results)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how long short tasks wait while report tasks run, with one shared "
+        "queue and with the queues in CRM_CELERY_WORKERS. Runs in-process on the memory broker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reports', type=int, default=10)
+        parser.add_argument('--report-seconds', type=float, default=1.0)
+        parser.add_argument('--shorts', type=int, default=200)
+        parser.add_argument('--interval', type=float, default=0.01)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['reports']} reports of {options['report_seconds']}s, "
+            f"{options['shorts']} short tasks every {options['interval'] * 1000:.0f}ms\n"
+            f"{'mode':<9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        )
+        for label, routed in (('shared', False), ('routed', True)):
+            waits = run(routed, options['reports'], options['report_seconds'], options['shorts'], options['interval'])
+            p50, p95, p99 = percentiles(waits, 50, 95, 99)
+            self.stdout.write(
+                f"{label:<9}{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}"
+                f"{p99 * 1000:>10.1f}{max(waits, default=0.0) * 1000:>10.1f}"
+            )
@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+from crm.management.bench import percentiles
+
+# Both endpoints serve the same schema
+QUERY = """
+{ allOrders(first: 20) { edges { node {
+    id totalAmount customer { name email }
+    products { edges { node { name price } } }
+} } } }
+"""
+
+
+def run_load(url, query, total, concurrency, timeout):
+    """Fire ``total`` POSTs at ``url`` from ``concurrency`` threads and return latency stats."""
+    local = threading.local()
+
+    def one_request(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json={'query': query}, timeout=timeout)
+            ok = response.status_code == 200 and 'errors' not in response.json()
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one_request, range(total)))
+    elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = percentiles([latency for latency, _ in results], 50, 95, 99)
+    return {
+        'throughput': total / elapsed,
+        'p50': p50 * 1000,
+        'p95': p95 * 1000,
+        'p99': p99 * 1000,
+        'errors': sum(1 for _, ok in results if not ok),
+    }
+
+
+class Command(BaseCommand):
+    help = "Load-test the WSGI /graphql endpoint against the ASGI /graphql/async endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync-url', default='http://localhost:8000/graphql')
+        parser.add_argument('--async-url', default='http://localhost:8001/graphql/async')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        targets = [
+            ('wsgi', options['sync_url']),
+            ('asgi', options['async_url']),
+        ]
+        self.stdout.write(
+            f"{options['requests']} requests, concurrency {options['concurrency']}\n"
+            f"{'path':<6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+        )
+        for label, url in targets:
+            # Warm up connections and caches before measuring
+            run_load(url, QUERY, options['concurrency'], options['concurrency'], options['timeout'])
+            stats = run_load(url, QUERY, options['requests'], options['concurrency'], options['timeout'])
+            self.stdout.write(
+                f"{label:<6}{stats['throughput']:>10.1f}{stats['p50']:>10.1f}"
+                f"{stats['p95']:>10.1f}{stats['p99']:>10.1f}{stats['errors']:>8}"
+            )
@@ -0,0 +1,61 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.models import Customer, Product
+
+CREATE_ORDER = """
+mutation ($input: OrderInput!) { createOrder(input: $input) { success } }
+"""
+CREATE_ORDERS = """
+mutation ($inputs: [OrderInput!]!) { createOrders(inputs: $inputs) { createdCount failedCount } }
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare order throughput of createOrder (one request per order) and "
+        "createOrders (batches) against a running server. Creates real orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000/graphql')
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--products-per-order', type=int, default=3)
+
+    def handle(self, *args, **options):
+        customers = list(Customer.objects.values_list('pk', flat=True)[:50])
+        products = list(Product.objects.filter(stock__gte=options['orders'] * 2).values_list('pk', flat=True)[:20])
+        if not customers or len(products) < options['products_per_order']:
+            raise CommandError("Need customers and products with at least twice --orders units of stock")
+
+        per_order = options['products_per_order']
+        inputs = [
+            {
+                'customerId': str(customers[i % len(customers)]),
+                'productIds': [str(products[(i + j) % len(products)]) for j in range(per_order)],
+            }
+            for i in range(options['orders'])
+        ]
+        session = requests.Session()
+
+        start = time.perf_counter()
+        failed = 0
+        for order_input in inputs:
+            response = session.post(options['url'], json={'query': CREATE_ORDER, 'variables': {'input': order_input}})
+            failed += not response.json()['data']['createOrder']['success']
+        single = len(inputs) / (time.perf_counter() - start)
+        self.stdout.write(f"createOrder   {single:>9.1f} orders/s  failed {failed}")
+
+        start = time.perf_counter()
+        failed = 0
+        size = options['batch_size']
+        for offset in range(0, len(inputs), size):
+            response = session.post(
+                options['url'], json={'query': CREATE_ORDERS, 'variables': {'inputs': inputs[offset:offset + size]}},
+            )
+            failed += response.json()['data']['createOrders']['failedCount']
+        batched = len(inputs) / (time.perf_counter() - start)
+        self.stdout.write(f"createOrders  {batched:>9.1f} orders/s  failed {failed}  ({batched / single:.1f}x)")
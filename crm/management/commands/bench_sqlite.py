@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.db import DEFAULT_SQLITE_PRAGMAS, apply_pragmas
+from crm.management.bench import percentiles
+
+SCHEMA = """
+CREATE TABLE customer (id INTEGER PRIMARY KEY, name TEXT, email TEXT);
+CREATE TABLE product (id INTEGER PRIMARY KEY, name TEXT, price NUMERIC, stock INTEGER);
+CREATE TABLE "order" (id INTEGER PRIMARY KEY, customer_id INTEGER, order_date TEXT, total_amount NUMERIC);
+CREATE TABLE order_products (id INTEGER PRIMARY KEY, order_id INTEGER, product_id INTEGER);
+CREATE INDEX order_customer ON "order" (customer_id);
+CREATE INDEX order_products_order ON order_products (order_id);
+"""
+READ_QUERY = """
+SELECT o.id, o.total_amount, c.name
+FROM "order" o JOIN customer c ON c.id = o.customer_id
+ORDER BY o.id DESC LIMIT 20
+"""
+
+
+def seed(path, orders):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO customer (name, email) VALUES (?, ?)",
+                     [(f"c{i}", f"c{i}@example.com") for i in range(500)])
+    conn.executemany("INSERT INTO product (name, price, stock) VALUES (?, ?, ?)",
+                     [(f"p{i}", i + 1, 100) for i in range(100)])
+    conn.executemany('INSERT INTO "order" (customer_id, order_date, total_amount) VALUES (?, datetime(), ?)',
+                     [(i % 500 + 1, 10) for i in range(orders)])
+    conn.commit()
+    conn.close()
+
+
+def run(path, tuned, readers, writers, duration):
+    """Hammer ``path`` with readers and writers; return read/write rates and read latencies."""
+    pragmas = DEFAULT_SQLITE_PRAGMAS if tuned else {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+    setup = sqlite3.connect(path)
+    apply_pragmas(setup, pragmas)
+    setup.close()
+
+    def connect():
+        conn = sqlite3.connect(path, check_same_thread=False)
+        if tuned:
+            apply_pragmas(conn, pragmas)
+        return conn
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats = {'reads': 0, 'writes': 0, 'errors': 0, 'latencies': []}
+
+    def reader():
+        # Tuned mode keeps one connection (CONN_MAX_AGE); default reconnects per request
+        conn = connect() if tuned else None
+        latencies = []
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                current = conn or connect()
+                current.execute(READ_QUERY).fetchall()
+                if conn is None:
+                    current.close()
+                latencies.append(time.perf_counter() - start)
+            except sqlite3.OperationalError:
+                with lock:
+                    stats['errors'] += 1
+        with lock:
+            stats['reads'] += len(latencies)
+            stats['latencies'].extend(latencies)
+
+    def writer():
+        conn = connect()
+        writes = 0
+        while not stop.is_set():
+            try:
+                with conn:
+                    cursor = conn.execute(
+                        'INSERT INTO "order" (customer_id, order_date, total_amount) VALUES (?, datetime(), ?)',
+                        (writes % 500 + 1, 25),
+                    )
+                    conn.executemany(
+                        "INSERT INTO order_products (order_id, product_id) VALUES (?, ?)",
+                        [(cursor.lastrowid, product_id) for product_id in (1, 2, 3)],
+                    )
+                writes += 1
+            except sqlite3.OperationalError:
+                with lock:
+                    stats['errors'] += 1
+        with lock:
+            stats['writes'] += writes
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    p50, p99 = percentiles(stats['latencies'], 50, 99)
+    return {
+        'reads': stats['reads'] / duration,
+        'writes': stats['writes'] / duration,
+        'p50': p50 * 1000,
+        'p99': p99 * 1000,
+        'errors': stats['errors'],
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare SQLite reader throughput with writes in flight, default vs tuned settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5)
+        parser.add_argument('--orders', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, {options['duration']}s each\n"
+            f"{'mode':<9}{'reads/s':>10}{'writes/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}"
+        )
+        for label, tuned in (('default', False), ('tuned', True)):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                seed(path, options['orders'])
+                result = run(path, tuned, options['readers'], options['writers'], options['duration'])
+            self.stdout.write(
+                f"{label:<9}{result['reads']:>10.0f}{result['writes']:>10.0f}"
+                f"{result['p50']:>9.2f}{result['p99']:>9.2f}{result['errors']:>8}"
+            )
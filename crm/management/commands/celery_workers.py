@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Print one `celery worker` command per queue in CRM_CELERY_WORKERS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loglevel', default='info')
+
+    def handle(self, *args, **options):
+        for queue, worker in settings.CRM_CELERY_WORKERS.items():
+            self.stdout.write(
+                f"celery -A crm worker -Q {queue} -n {queue}@%h -l {options['loglevel']}"
+                f" -c {worker['concurrency']} --prefetch-multiplier {worker['prefetch_multiplier']}"
+            )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from crm import rollups
+from crm.routers import pin_primary
+
+
+class Command(BaseCommand):
+    help = "Recompute each customer's order_count, lifetime_value and last_order_at and fix any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=rollups.BACKFILL_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without saving")
+
+    def handle(self, *args, **options):
+        pin_primary()
+        drifted = rollups.reconcile_customers(options['chunk_size'], options['dry_run'])
+        verb = "Found" if options['dry_run'] else "Fixed"
+        self.stdout.write(f"{verb} {drifted} customers with drifted order stats")
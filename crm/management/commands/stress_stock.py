@@ -0,0 +1,123 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from crm import catalog
+from crm.models import Customer, Order, Product, StockReservation
+from crm.routers import pin_primary, unit_of_work
+from crm.schema import schema
+
+RESERVE = """
+mutation ($productId: ID!) {
+  reserveStock(items: [{productId: $productId, quantity: 1}]) { reservations { id } }
+}
+"""
+RELEASE = """
+mutation ($ids: [ID!]!) { releaseStock(reservationIds: $ids) { releasedCount } }
+"""
+CREATE_ORDER = """
+mutation ($input: OrderInput!) { createOrder(input: $input) { success } }
+"""
+
+
+def sold_out(result):
+    # Anything else stops the worker and is reported
+    return result.errors and 'Insufficient stock' in result.errors[0].message
+
+
+def run(threads, stock, abandon, direct, seed):
+    """Sell ``stock`` units of a fresh product from ``threads`` workers until it runs out."""
+    customer = Customer.objects.create(name='Stress', email=f'stress-{time.time_ns()}@example.com')
+    product = Product.objects.create(name=f'stress-{time.time_ns()}', price=1, stock=stock)
+    catalog.invalidate()
+    lock = threading.Lock()
+    stats = {'orders': 0, 'released': 0, 'errors': []}
+
+    def worker(number):
+        rng = random.Random(seed + number)
+        orders = released = 0
+        errors = []
+        with unit_of_work():
+            pin_primary()
+            while True:
+                order_input = {'customerId': str(customer.pk), 'productIds': [str(product.pk)]}
+                if rng.random() >= direct:
+                    result = schema.execute(RESERVE, variables={'productId': str(product.pk)})
+                    if sold_out(result):
+                        break
+                    if result.errors:
+                        errors.append(result.errors[0].message)
+                        break
+                    ids = [item['id'] for item in result.data['reserveStock']['reservations']]
+                    if rng.random() < abandon:
+                        result = schema.execute(RELEASE, variables={'ids': ids})
+                        if result.errors:
+                            errors.append(result.errors[0].message)
+                        else:
+                            released += result.data['releaseStock']['releasedCount']
+                        continue
+                    order_input['reservationIds'] = ids
+                result = schema.execute(CREATE_ORDER, variables={'input': order_input})
+                if sold_out(result):
+                    break
+                if result.errors:
+                    errors.append(result.errors[0].message)
+                    break
+                orders += 1
+        connection.close()
+        with lock:
+            stats['orders'] += orders
+            stats['released'] += released
+            stats['errors'].extend(errors)
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    product.refresh_from_db()
+    held = StockReservation.objects.filter(product=product, status=StockReservation.HELD).count()
+    sold = Order.objects.filter(products=product).count()
+    return {
+        'rate': stats['orders'] / elapsed,
+        'orders': stats['orders'],
+        'released': stats['released'],
+        'errors': stats['errors'],
+        'stock': product.stock,
+        # Every unit is either still in stock, held, or in exactly one order
+        'consistent': product.stock >= 0 and product.stock + held + sold == stock and sold == stats['orders'],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Sell one hot product from several threads at once, through reserveStock/"
+        "releaseStock/createOrder, and check it is never oversold. Creates real orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', default='1,2,4,8')
+        parser.add_argument('--stock', type=int, default=200)
+        parser.add_argument('--abandon', type=float, default=0.2, help="Share of reservations released again")
+        parser.add_argument('--direct', type=float, default=0.3, help="Share of orders placed without a reservation")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['stock']} units per run\n"
+            f"{'threads':<9}{'orders/s':>10}{'orders':>8}{'released':>10}{'errors':>8}{'stock':>7}  check"
+        )
+        for threads in [int(value) for value in options['threads'].split(',')]:
+            result = run(threads, options['stock'], options['abandon'], options['direct'], options['seed'])
+            self.stdout.write(
+                f"{threads:<9}{result['rate']:>10.1f}{result['orders']:>8}{result['released']:>10}"
+                f"{len(result['errors']):>8}{result['stock']:>7}  {'ok' if result['consistent'] else 'OVERSOLD'}"
+            )
+            for message in sorted(set(result['errors']))[:5]:
+                self.stderr.write(f"  {message}")
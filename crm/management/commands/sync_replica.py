@@ -0,0 +1,45 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def copy_database(source, target):
+    """Copy a consistent snapshot of the ``source`` SQLite file over ``target``."""
+    primary = sqlite3.connect(source)
+    replica = sqlite3.connect(target)
+    try:
+        primary.backup(replica)
+    finally:
+        replica.close()
+        primary.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Replication stand-in for local development: copy the primary SQLite "
+        "database onto the replica, once or every --interval seconds"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Keep syncing every N seconds (0 syncs once)")
+
+    def handle(self, *args, **options):
+        databases = settings.DATABASES
+        if 'replica' not in databases:
+            raise CommandError("No 'replica' database configured; set CRM_REPLICA_DB_NAME")
+        for alias in ('default', 'replica'):
+            if databases[alias]['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError(f"'{alias}' is not SQLite; use real replication instead")
+        source = str(databases['default']['NAME'])
+        target = str(databases['replica']['NAME'])
+
+        while True:
+            start = time.perf_counter()
+            copy_database(source, target)
+            self.stdout.write(f"Synced {source} -> {target} in {(time.perf_counter() - start) * 1000:.1f} ms")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,185 @@
+"""
+Prometheus metrics for the GraphQL endpoint, the ORM and Celery tasks.
+
+Set PROMETHEUS_MULTIPROC_DIR to a directory shared by every WSGI worker and
+Celery process (and empty it on deploy). Each process then writes its samples
+there and the /metrics view merges them, so totals stay correct no matter
+which worker answers the scrape.
+
+Operations are labelled with their name, so clients must not be able to
+grow the label set without limit. Documents that fail to parse or validate
+count as 'invalid', and past ``MAX_OPERATION_LABELS`` distinct names a
+process labels new ones 'other'.
+"""
+import os
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from celery.signals import task_postrun, task_prerun
+from django.db import connections
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500)
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800)
+
+# Distinct operation names labelled per process; the rest are 'other'
+MAX_OPERATION_LABELS = 200
+
+GRAPHQL_OPERATION_DURATION = Histogram(
+    'crm_graphql_operation_duration_seconds',
+    'Time spent executing a GraphQL operation',
+    ['operation'],
+    buckets=LATENCY_BUCKETS,
+)
+GRAPHQL_OPERATION_ERRORS = Counter(
+    'crm_graphql_operation_errors_total',
+    'GraphQL operations that raised or returned errors',
+    ['operation'],
+)
+GRAPHQL_OPERATION_QUERIES = Histogram(
+    'crm_graphql_operation_sql_queries',
+    'SQL queries issued by a single GraphQL operation',
+    ['operation'],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+DB_QUERIES = Counter(
+    'crm_db_queries_total',
+    'SQL queries executed',
+    ['source'],
+)
+DB_QUERY_SECONDS = Counter(
+    'crm_db_query_seconds_total',
+    'Wall time spent in SQL queries',
+    ['source'],
+)
+CACHE_REQUESTS = Counter(
+    'crm_cache_requests_total',
+    'Versioned cache lookups by model and result (hit, miss or bypass)',
+    ['model', 'result'],
+)
+CELERY_TASK_DURATION = Histogram(
+    'crm_celery_task_duration_seconds',
+    'Celery task run time',
+    ['task'],
+    buckets=TASK_BUCKETS,
+)
+CELERY_TASK_OUTCOMES = Counter(
+    'crm_celery_task_outcomes_total',
+    'Celery task runs by outcome',
+    ['task', 'outcome'],
+)
+
+_OPERATION_NAME_RE = re.compile(r'^\s*(?:query|mutation|subscription)\s+(\w+)')
+
+_operation_names = set()
+_operation_names_lock = threading.Lock()
+
+
+def operation_label(query, operation_name=None, valid=True):
+    """
+    Label for an operation: the explicit name or the name in the document,
+    'anonymous' without one, 'invalid' unless the document validated, and
+    'other' once the process has labelled ``MAX_OPERATION_LABELS`` names.
+    """
+    if not valid:
+        return 'invalid'
+    if not operation_name:
+        match = _OPERATION_NAME_RE.match(query or '')
+        operation_name = match.group(1) if match else None
+    if not operation_name:
+        return 'anonymous'
+    with _operation_names_lock:
+        if operation_name not in _operation_names:
+            if len(_operation_names) >= MAX_OPERATION_LABELS:
+                return 'other'
+            _operation_names.add(operation_name)
+    return operation_name
+
+
+class QueryTimer:
+    """Database execute wrapper that counts queries and sums their duration."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+@contextmanager
+def track_queries(source):
+    """Count SQL queries on every configured connection and record them under ``source``."""
+    timer = QueryTimer()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        try:
+            yield timer
+        finally:
+            DB_QUERIES.labels(source).inc(timer.count)
+            DB_QUERY_SECONDS.labels(source).inc(timer.duration)
+
+
+def observe_operation(operation, duration, queries, failed):
+    """Record one operation. ``queries`` is None when SQL ran on other threads and was not counted."""
+    GRAPHQL_OPERATION_DURATION.labels(operation).observe(duration)
+    if queries is not None:
+        GRAPHQL_OPERATION_QUERIES.labels(operation).observe(queries)
+    if failed:
+        GRAPHQL_OPERATION_ERRORS.labels(operation).inc()
+
+
+def render():
+    """Return (payload, content_type) for the current metrics, merged across processes if configured."""
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+# --------------------------
+# CELERY SIGNALS
+# --------------------------
+
+_running_tasks = {}
+
+
+@task_prerun.connect
+def _on_task_prerun(task_id=None, **kwargs):
+    stack = ExitStack()
+    stack.enter_context(track_queries('celery'))
+    _running_tasks[task_id] = (time.perf_counter(), stack)
+
+
+@task_postrun.connect
+def _on_task_postrun(task_id=None, task=None, retval=None, state=None, **kwargs):
+    name = task.name if task is not None else 'unknown'
+    running = _running_tasks.pop(task_id, None)
+    if running is not None:
+        started, stack = running
+        stack.close()
+        CELERY_TASK_DURATION.labels(name).observe(time.perf_counter() - started)
+
+    # Our report tasks swallow exceptions and return {'status': 'error'}
+    outcome = (state or 'unknown').lower()
+    if isinstance(retval, dict) and retval.get('status') == 'error':
+        outcome = 'error'
+    CELERY_TASK_OUTCOMES.labels(name, outcome).inc()
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_customer_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('total_rows', models.PositiveIntegerField(default=0)),
+                ('total_chunks', models.PositiveIntegerField(default=0)),
+                ('completed_chunks', models.PositiveIntegerField(default=0)),
+                ('processed_rows', models.PositiveIntegerField(default=0)),
+                ('created_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImportChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('first_row', models.PositiveIntegerField()),
+                ('rows', models.JSONField()),
+                ('status', models.CharField(db_index=True, default='pending', max_length=10)),
+                ('created_count', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(default=list)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='crm.importjob')),
+            ],
+            options={
+                'ordering': ['job', 'index'],
+                'constraints': [models.UniqueConstraint(fields=('job', 'index'), name='unique_import_chunk')],
+            },
+        ),
+    ]
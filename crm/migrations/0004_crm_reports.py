@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_import_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrmReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('mode', models.CharField(default='incremental', max_length=12)),
+                ('last_order_id', models.PositiveBigIntegerField(default=0)),
+                ('last_customer_id', models.PositiveBigIntegerField(default=0)),
+                ('total_customers', models.PositiveIntegerField(default=0)),
+                ('total_orders', models.PositiveIntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('new_customers', models.PositiveIntegerField(default=0)),
+                ('new_orders', models.PositiveIntegerField(default=0)),
+                ('new_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
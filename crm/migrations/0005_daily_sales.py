@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_crm_reports'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='crm.customer')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='crm.product')),
+            ],
+            options={
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('customer__isnull', True), ('product__isnull', True)), fields=('date',), name='unique_daily_sales_total'), models.UniqueConstraint(condition=models.Q(('customer__isnull', True)), fields=('date', 'product'), name='unique_daily_sales_product'), models.UniqueConstraint(condition=models.Q(('product__isnull', True)), fields=('date', 'customer'), name='unique_daily_sales_customer')],
+            },
+        ),
+    ]
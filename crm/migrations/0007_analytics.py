@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_customer_order_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CohortRetention',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort', models.DateField()),
+                ('months_since', models.PositiveSmallIntegerField()),
+                ('customers', models.PositiveIntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('computed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['cohort', 'months_since'],
+                'constraints': [models.UniqueConstraint(fields=('cohort', 'months_since'), name='unique_cohort_month')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TopProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField(unique=True)),
+                ('order_count', models.PositiveIntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('computed_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.product')),
+            ],
+            options={
+                'ordering': ['rank'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductAffinity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('co_orders', models.PositiveIntegerField()),
+                ('confidence', models.FloatField()),
+                ('lift', models.FloatField()),
+                ('computed_at', models.DateTimeField(auto_now_add=True)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='crm.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='affinities', to='crm.product')),
+            ],
+            options={
+                'ordering': ['product', '-co_orders'],
+                'constraints': [models.UniqueConstraint(fields=('product', 'other'), name='unique_product_affinity')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0011_job_leases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('order_date', models.DateTimeField(db_index=True)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='crm.customer')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.archivedorder')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.product')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='products',
+            field=models.ManyToManyField(related_name='archived_orders', through='crm.ArchivedOrderProduct', to='crm.product'),
+        ),
+        migrations.AddConstraint(
+            model_name='archivedorderproduct',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='archived_order_product_unique'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 
 from django.db import models
 from django.core.validators import MinValueValidator, RegexValidator
+from django.utils import timezone
 
 class Customer(models.Model):
     name = models.CharField(max_length=100)
@@ -17,12 +18,19 @@ class Customer(models.Model):
             )
         ]
     )
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Kept up to date by crm.rollups on order creation
+    order_count = models.PositiveIntegerField(default=0)
+    lifetime_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_order_at = models.DateTimeField(null=True, blank=True, db_index=True)
     
     def __str__(self):
         return self.name
 
 class Product(models.Model):
     name = models.CharField(max_length=100)
+    # Identifier from external catalogs, used by bulkUpsertProducts
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
     stock = models.PositiveIntegerField(default=0)
     
@@ -42,4 +50,230 @@ class Order(models.Model):
         # Calculate total amount before saving
         if not self.total_amount:
             self.total_amount = sum(product.price for product in self.products.all())
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class ArchivedOrder(models.Model):
+    """An order moved out of Order by crm.archive, under the same id."""
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='archived_orders')
+    products = models.ManyToManyField(Product, through='ArchivedOrderProduct', related_name='archived_orders')
+    order_date = models.DateTimeField(db_index=True)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived order #{self.id}"
+
+class ArchivedOrderProduct(models.Model):
+    """An ArchivedOrder's product link, with the same columns as Order.products.through."""
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='archived_order_product_unique'),
+        ]
+
+class ImportJob(models.Model):
+    """A customer CSV import, split into ImportChunks processed by Celery."""
+    filename = models.CharField(max_length=255, blank=True)
+    total_rows = models.PositiveIntegerField(default=0)
+    total_chunks = models.PositiveIntegerField(default=0)
+    completed_chunks = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def status(self):
+        if self.total_chunks and self.completed_chunks >= self.total_chunks:
+            return 'completed'
+        return 'running' if self.completed_chunks else 'pending'
+
+    def __str__(self):
+        return f"Import #{self.id} ({self.status})"
+
+class ImportChunk(models.Model):
+    """
+    A slice of an import's rows. Processing a chunk and marking it done
+    happen in one transaction, so retries and resumes never import a chunk
+    twice.
+    """
+    PENDING = 'pending'
+    DONE = 'done'
+
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    first_row = models.PositiveIntegerField()
+    rows = models.JSONField()
+    status = models.CharField(max_length=10, default=PENDING, db_index=True)
+    created_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ['job', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'index'], name='unique_import_chunk'),
+        ]
+
+class CrmReport(models.Model):
+    """
+    One run of the weekly CRM report. ``last_order_id``/``last_customer_id``
+    are the watermarks the next incremental run starts after.
+    """
+    FULL = 'full'
+    INCREMENTAL = 'incremental'
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    mode = models.CharField(max_length=12, default=INCREMENTAL)
+    last_order_id = models.PositiveBigIntegerField(default=0)
+    last_customer_id = models.PositiveBigIntegerField(default=0)
+    total_customers = models.PositiveIntegerField(default=0)
+    total_orders = models.PositiveIntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    new_customers = models.PositiveIntegerField(default=0)
+    new_orders = models.PositiveIntegerField(default=0)
+    new_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Report #{self.id} ({self.created_at:%Y-%m-%d})"
+
+class DailySales(models.Model):
+    """
+    Order totals per day. Each day has one row with neither product nor
+    customer set (the day's total), one row per product sold and one row
+    per ordering customer.
+    """
+    date = models.DateField()
+    product = models.ForeignKey(Product, null=True, blank=True, on_delete=models.CASCADE)
+    customer = models.ForeignKey(Customer, null=True, blank=True, on_delete=models.CASCADE)
+    order_count = models.PositiveIntegerField(default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date'],
+                condition=models.Q(product__isnull=True, customer__isnull=True),
+                name='unique_daily_sales_total',
+            ),
+            models.UniqueConstraint(
+                fields=['date', 'product'],
+                condition=models.Q(customer__isnull=True),
+                name='unique_daily_sales_product',
+            ),
+            models.UniqueConstraint(
+                fields=['date', 'customer'],
+                condition=models.Q(product__isnull=True),
+                name='unique_daily_sales_customer',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Sales {self.date}: {self.revenue}"
+
+class CohortRetention(models.Model):
+    """Customers of a first-order month cohort still ordering ``months_since`` months later."""
+    cohort = models.DateField()
+    months_since = models.PositiveSmallIntegerField()
+    customers = models.PositiveIntegerField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2)
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['cohort', 'months_since']
+        constraints = [
+            models.UniqueConstraint(fields=['cohort', 'months_since'], name='unique_cohort_month'),
+        ]
+
+class TopProduct(models.Model):
+    """Products ranked by the number of orders they appear in."""
+    rank = models.PositiveIntegerField(unique=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    order_count = models.PositiveIntegerField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2)
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['rank']
+
+class ProductAffinity(models.Model):
+    """How often ``other`` is bought in the same order as ``product``."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='affinities')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    co_orders = models.PositiveIntegerField()
+    confidence = models.FloatField()
+    lift = models.FloatField()
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['product', '-co_orders']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='unique_product_affinity'),
+        ]
+
+class StockReservation(models.Model):
+    """
+    Units of a product held for an order that is not placed yet. Held units
+    are already taken off Product.stock; releasing puts them back.
+    """
+    HELD = 'held'
+    COMMITTED = 'committed'
+    RELEASED = 'released'
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, default=HELD)
+    expires_at = models.DateTimeField()
+    order = models.ForeignKey(Order, null=True, blank=True, on_delete=models.SET_NULL, related_name='reservations')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_expiry'),
+        ]
+
+    def __str__(self):
+        return f"Reservation #{self.id}: {self.quantity} x product {self.product_id} ({self.status})"
+
+class OutboxEvent(models.Model):
+    """
+    A side effect recorded in the same transaction as the change that caused
+    it, and delivered later by crm.outbox. ``key`` names the entity, e.g.
+    ``product:12``; events of one entity are handled in id order.
+    """
+    topic = models.CharField(max_length=64)
+    key = models.CharField(max_length=64, db_index=True)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=32, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'available_at'], name='outbox_pending'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} {self.key} #{self.id}"
+
+class JobLease(models.Model):
+    """Which process runs a scheduled job right now, and when it last started (see crm.locks)."""
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=100, blank=True, default='')
+    expires_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.owner or 'free'})"
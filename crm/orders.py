@@ -0,0 +1,135 @@
+"""
+Batched order creation for the ``createOrders`` mutation.
+
+Customers are resolved with one query for the whole batch, and products and
+prices come from the in-memory catalog. Orders and their M2M links are then
+inserted with ``bulk_create``. Stock is taken with ``reservations.take``:
+one guarded ``F()`` update per product, summed over the batch. The whole batch is tried under a
+single savepoint. If anything fails, for example a product running out of
+stock, that savepoint is rolled back and the orders are replayed one
+savepoint each. Every order then gets its own success or error.
+
+Each listed product id takes one unit of stock and adds its price to the
+total, as in ``createOrder``.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import caching, catalog, outbox, reservations, rollups, subscriptions
+from .models import Customer, Order
+
+
+class OrderError(Exception):
+    """An order in the batch that cannot be placed."""
+
+
+def _prepare(inputs):
+    """Validate ``inputs`` in memory. Returns a list of (Order, products) or OrderError per input."""
+    def as_int(value, label):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise OrderError(f"Invalid {label} ID {value}")
+
+    customer_ids = set()
+    product_ids = set()
+    for order_input in inputs:
+        try:
+            customer_ids.add(as_int(order_input.customer_id, 'customer'))
+        except OrderError:
+            pass
+        for product_id in order_input.product_ids or []:
+            try:
+                product_ids.add(as_int(product_id, 'product'))
+            except OrderError:
+                pass
+    customers = set(Customer.objects.filter(pk__in=customer_ids).values_list('pk', flat=True))
+    product_catalog = catalog.get_products(product_ids)
+
+    prepared = []
+    for order_input in inputs:
+        try:
+            if order_input.reservation_ids:
+                raise OrderError("Reservations can only be used with createOrder")
+            customer_id = as_int(order_input.customer_id, 'customer')
+            if customer_id not in customers:
+                raise OrderError(f"Customer with ID {order_input.customer_id} does not exist")
+            products = []
+            for product_id in order_input.product_ids or []:
+                product = product_catalog.get(as_int(product_id, 'product'))
+                if product is None:
+                    raise OrderError(f"Product with ID {product_id} does not exist")
+                products.append(product)
+            if not products:
+                raise OrderError("At least one product is required")
+            order = Order(
+                customer_id=customer_id,
+                order_date=order_input.order_date or timezone.now(),
+                total_amount=sum(product.price for product in products),
+            )
+            prepared.append((order, products))
+        except OrderError as error:
+            prepared.append(error)
+    return prepared
+
+
+def _take_stock(batch):
+    units = Counter(product.pk for _, products in batch for product in products)
+    try:
+        reservations.take(units)
+    except reservations.InsufficientStock as error:
+        raise OrderError(str(error))
+
+
+def _insert(batch):
+    """Place every order in ``batch`` or raise. Run inside a savepoint."""
+    _take_stock(batch)
+    orders = Order.objects.bulk_create([order for order, _ in batch])
+    links = Order.products.through
+    links.objects.bulk_create([
+        links(order_id=order.pk, product_id=product_id)
+        for order, (_, products) in zip(orders, batch)
+        for product_id in dict.fromkeys(product.pk for product in products)
+    ])
+    rollups.record_orders(batch)
+
+
+def create_orders(inputs):
+    """
+    Create an order for each of ``inputs``. Returns a list with, for each
+    input, either the created Order or an error message.
+    """
+    prepared = _prepare(inputs)
+    results = [item if isinstance(item, OrderError) else None for item in prepared]
+    pending = [(index, item) for index, item in enumerate(prepared) if not isinstance(item, OrderError)]
+    if not pending:
+        return [str(result) for result in results]
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                _insert([item for _, item in pending])
+            for index, (order, _) in pending:
+                results[index] = order
+        except (OrderError, IntegrityError):
+            for index, item in pending:
+                # Forget the ids handed out by the rolled back bulk insert
+                item[0].pk = None
+                item[0]._state.adding = True
+                try:
+                    with transaction.atomic():
+                        _insert([item])
+                    results[index] = item[0]
+                except (OrderError, IntegrityError) as error:
+                    results[index] = OrderError(str(error))
+
+        placed_orders = [result for result in results if isinstance(result, Order)]
+        if placed_orders:
+            caching.invalidate(Customer)
+            outbox.orders_created(placed_orders)
+        for order in placed_orders:
+            subscriptions.order_created(order)
+
+    return [str(result) if isinstance(result, OrderError) else result for result in results]
@@ -0,0 +1,255 @@
+"""
+Transactional outbox for order, customer and stock events.
+
+Writers call ``emit`` (or the helpers below) inside the transaction that
+makes the change. The OutboxEvent rows commit or roll back with it, so an
+event exists exactly when its change does. Once the transaction commits, a
+``drain_outbox`` task is queued, at most once per ``KICK_DELAY`` seconds,
+so events arriving together are handled in one batch. Queuing gives up
+after ``KICK_TIMEOUT`` seconds without retrying, and Celery beat drains
+every minute in case a kick is lost.
+
+``drain`` claims up to ``BATCH_SIZE`` events at a time:
+
+- Claiming sets a lease (``available_at`` moves ``LEASE`` into the future)
+  with a conditional update. Two consumers can therefore never hold the
+  same event. Where the database supports it, the candidate rows are also
+  read with ``SELECT ... FOR UPDATE SKIP LOCKED``. SQLite has no row locks,
+  and there the conditional update alone decides.
+- Events of one ``key`` are handled in id order. A consumer only keeps the
+  events of a key when it also holds the oldest pending event of that key.
+- Each topic's events go to its handler as one list. Events are marked
+  processed only after their handler returns. A crashed consumer's lease
+  simply runs out, so delivery is at least once and handlers must be
+  idempotent.
+- A failing handler's events are retried with exponential backoff. Later
+  events of the same keys wait behind them. After ``MAX_ATTEMPTS`` they are
+  given up and logged.
+"""
+import logging
+import uuid
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .logsink import get_sink
+from .models import Customer, OutboxEvent, Product
+from .routers import PRIMARY
+
+BATCH_SIZE = 500
+MAX_BATCHES = 20
+LEASE = timedelta(minutes=5)
+MAX_ATTEMPTS = 10
+MAX_BACKOFF = timedelta(hours=1)
+RETENTION = timedelta(days=7)
+KICK_DELAY = 2
+KICK_TIMEOUT = 1
+KICK_KEY = 'crm:outbox:kick'
+
+ORDER_CREATED = 'order.created'
+CUSTOMER_CREATED = 'customer.created'
+STOCK_CHANGED = 'stock.changed'
+
+LOW_STOCK_THRESHOLD = 10
+ORDER_EVENTS_LOG = '/tmp/crm_order_events_log.txt'
+CUSTOMER_EVENTS_LOG = '/tmp/crm_customer_events_log.txt'
+LOW_STOCK_LOG = '/tmp/low_stock_updates_log.txt'
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(topic):
+    """Register a function taking a list of OutboxEvents of ``topic``."""
+    def register(func):
+        HANDLERS[topic] = func
+        return func
+    return register
+
+
+# --------------------------
+# WRITING
+# --------------------------
+
+def _kick():
+    if not cache.add(KICK_KEY, 1, KICK_DELAY):
+        return
+    from .tasks import drain_outbox
+    # Runs in the request: give up at once on a broker outage, beat drains the events anyway
+    connection = drain_outbox.app.connection_for_write(
+        connect_timeout=KICK_TIMEOUT,
+        transport_options={
+            'max_retries': 0,
+            'socket_connect_timeout': KICK_TIMEOUT,
+            'socket_timeout': KICK_TIMEOUT,
+        },
+    )
+    with connection:
+        drain_outbox.apply_async(countdown=KICK_DELAY, connection=connection, retry=False)
+
+
+def emit(events):
+    """Record ``events``, (topic, key, payload) tuples, in the current transaction."""
+    rows = [OutboxEvent(topic=topic, key=key, payload=payload) for topic, key, payload in events]
+    if not rows:
+        return
+    OutboxEvent.objects.bulk_create(rows)
+    # A broker outage must not fail the commit; beat drains the events anyway
+    transaction.on_commit(_kick, robust=True)
+
+
+def orders_created(orders):
+    emit((ORDER_CREATED, f'order:{order.pk}', {'order_id': order.pk, 'customer_id': order.customer_id})
+         for order in orders)
+
+
+def customers_created(customers):
+    emit((CUSTOMER_CREATED, f'customer:{customer.pk}', {'customer_id': customer.pk}) for customer in customers)
+
+
+def stock_changed(products):
+    emit((STOCK_CHANGED, f'product:{product.pk}', {'product_id': product.pk, 'stock': product.stock})
+         for product in products)
+
+
+# --------------------------
+# CONSUMING
+# --------------------------
+
+def _pending():
+    return OutboxEvent.objects.using(PRIMARY).filter(processed_at__isnull=True)
+
+
+def _first_pending(keys):
+    return dict(
+        _pending().filter(key__in=keys).values('key').annotate(first=Min('pk')).values_list('key', 'first')
+    )
+
+
+def _unclaim(ids):
+    OutboxEvent.objects.filter(pk__in=ids).update(
+        claimed_by='', available_at=timezone.now(), attempts=F('attempts') - 1,
+    )
+
+
+def claim(batch_size=BATCH_SIZE):
+    """Lease up to ``batch_size`` available events. Returns them in id order, and the lease token."""
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    candidates = _pending().filter(available_at__lte=now).order_by('pk')
+    skip_locked = connections[PRIMARY].features.has_select_for_update_skip_locked
+    # No transaction on SQLite: one that reads before writing fails when another writer got in first
+    with transaction.atomic(using=PRIMARY) if skip_locked else nullcontext():
+        if skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        candidates = list(candidates.values_list('pk', 'key')[:batch_size])
+        # Skip keys whose oldest pending event is leased by someone else
+        first = _first_pending({key for _, key in candidates})
+        ids = {pk for pk, _ in candidates}
+        ids = [pk for pk, key in candidates if first.get(key) in ids]
+        OutboxEvent.objects.filter(pk__in=ids, processed_at__isnull=True, available_at__lte=now).update(
+            claimed_by=token, available_at=now + LEASE, attempts=F('attempts') + 1,
+        )
+    events = list(_pending().filter(pk__in=ids, claimed_by=token).order_by('pk'))
+
+    # Another consumer may have leased an older event of a key in the meantime
+    first = _first_pending({event.key for event in events})
+    held = {event.pk for event in events}
+    lost = [event.pk for event in events if first.get(event.key) not in held]
+    if lost:
+        _unclaim(lost)
+    return [event for event in events if event.pk not in lost], token
+
+
+def _retry(events, token, error):
+    now = timezone.now()
+    for event in events:
+        if event.attempts >= MAX_ATTEMPTS:
+            logger.error("Giving up outbox event %s after %s attempts: %s", event.pk, event.attempts, error)
+            changes = {'processed_at': now}
+        else:
+            changes = {'available_at': now + min(timedelta(seconds=2 ** event.attempts), MAX_BACKOFF)}
+        OutboxEvent.objects.filter(pk=event.pk, claimed_by=token).update(
+            claimed_by='', last_error=str(error)[:1000], **changes,
+        )
+
+
+def dispatch(events, token):
+    """Run each topic's handler on its events. Returns how many were processed."""
+    by_topic = defaultdict(list)
+    for event in events:
+        by_topic[event.topic].append(event)
+
+    done = []
+    for topic, batch in by_topic.items():
+        try:
+            func = HANDLERS.get(topic)
+            if func is not None:
+                func(batch)
+        except Exception as error:
+            logger.exception("Outbox handler for %s failed", topic)
+            _retry(batch, token, error)
+        else:
+            done.extend(event.pk for event in batch)
+    OutboxEvent.objects.filter(pk__in=done, claimed_by=token).update(processed_at=timezone.now())
+    return len(done)
+
+
+def drain(batch_size=BATCH_SIZE, max_batches=MAX_BATCHES):
+    """Handle available events, at most ``max_batches`` batches. Returns how many were processed."""
+    processed = 0
+    for _ in range(max_batches):
+        events, token = claim(batch_size)
+        if not events:
+            break
+        processed += dispatch(events, token)
+    return processed
+
+
+def purge(older_than=RETENTION):
+    """Delete events processed more than ``older_than`` ago."""
+    deleted, _ = OutboxEvent.objects.filter(processed_at__lt=timezone.now() - older_than).delete()
+    return deleted
+
+
+# --------------------------
+# HANDLERS
+# --------------------------
+
+@handler(ORDER_CREATED)
+def log_orders(events):
+    """Order confirmations, one line per order."""
+    emails = dict(Customer.objects.filter(
+        pk__in={event.payload['customer_id'] for event in events},
+    ).values_list('pk', 'email'))
+    sink = get_sink(ORDER_EVENTS_LOG)
+    for event in events:
+        email = emails.get(event.payload['customer_id'], 'N/A')
+        sink.write(f"Order ID: {event.payload['order_id']}, Customer Email: {email}",
+                   order_id=event.payload['order_id'], customer_email=email)
+
+
+@handler(CUSTOMER_CREATED)
+def log_customers(events):
+    """Welcome notices, one line per new customer."""
+    customers = Customer.objects.filter(pk__in=[event.payload['customer_id'] for event in events])
+    sink = get_sink(CUSTOMER_EVENTS_LOG)
+    for customer in customers:
+        sink.write(f"Welcome {customer.name} <{customer.email}>", customer_id=customer.pk, email=customer.email)
+
+
+@handler(STOCK_CHANGED)
+def log_low_stock(events):
+    """Low-stock alerts for products whose latest stock in the batch is below the threshold."""
+    latest = {event.payload['product_id']: event.payload['stock'] for event in events}
+    low = [product_id for product_id, stock in latest.items() if stock < LOW_STOCK_THRESHOLD]
+    sink = get_sink(LOW_STOCK_LOG)
+    for product in Product.objects.filter(pk__in=low).order_by('pk'):
+        sink.write(f"Low stock: {product.name} has {latest[product.pk]} left",
+                   product_id=product.pk, stock=latest[product.pk])
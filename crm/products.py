@@ -0,0 +1,108 @@
+"""
+Bulk product upsert for the ``bulkUpsertProducts`` mutation.
+
+Incoming rows are matched to existing products by SKU or by name, with one
+query for the whole batch. Each match is diffed in memory. New products are
+inserted with chunked ``bulk_create``. Changed products are saved with
+``bulk_update``, grouped by the exact set of changed columns, so unchanged
+columns are never written. Unchanged rows cost nothing.
+"""
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import caching, catalog, outbox, subscriptions
+from .models import Product
+
+CHUNK_SIZE = 500
+KEYS = ('sku', 'name')
+FIELDS = ('name', 'sku', 'price', 'stock')
+
+
+def _row_errors(error):
+    return '; '.join(f"{field}: {' '.join(messages)}" for field, messages in error.message_dict.items())
+
+
+def upsert_products(rows, key='sku', chunk_size=CHUNK_SIZE):
+    """
+    Create or update products from ``rows`` (dicts with name, sku, price,
+    stock), matched on ``key``. Returns ``(created, updated, unchanged,
+    errors)``, where ``errors`` holds (row number, message) pairs.
+    """
+    if key not in KEYS:
+        raise ValueError(f"Unknown key {key!r}")
+
+    errors = []
+    keyed = {}
+    for number, row in enumerate(rows, start=1):
+        value = row.get(key)
+        if not value:
+            errors.append((number, f"{key} is required"))
+        elif value in keyed:
+            errors.append((number, f"Duplicate {key} {value!r} in this batch"))
+        else:
+            keyed[value] = (number, row)
+
+    existing = defaultdict(list)
+    for product in Product.objects.filter(**{f'{key}__in': list(keyed)}):
+        existing[getattr(product, key)].append(product)
+
+    # Matched by name, a row's SKU may already belong to another product
+    sku_owners = {}
+    if key == 'name':
+        skus = [row['sku'] for _, row in keyed.values() if row.get('sku')]
+        sku_owners = {
+            sku: ('product', pk) for sku, pk in Product.objects.filter(sku__in=skus).values_list('sku', 'pk')
+        }
+
+    to_create = []
+    changed_by_columns = defaultdict(list)
+    unchanged = 0
+    for value, (number, row) in keyed.items():
+        matches = existing.get(value, [])
+        if len(matches) > 1:
+            errors.append((number, f"{len(matches)} products share the {key} {value!r}"))
+            continue
+        product = matches[0] if matches else Product(stock=0)
+        sku = row.get('sku')
+        if key == 'name' and sku:
+            claimant = ('product', product.pk) if product.pk else ('row', number)
+            if sku_owners.setdefault(sku, claimant) != claimant:
+                errors.append((number, f"SKU {sku!r} belongs to another product"))
+                continue
+        columns = []
+        for field in FIELDS:
+            if field in row and row[field] is not None and getattr(product, field) != row[field]:
+                setattr(product, field, row[field])
+                columns.append(field)
+        try:
+            product.clean_fields()
+        except ValidationError as error:
+            errors.append((number, _row_errors(error)))
+            continue
+        if product.pk is None:
+            to_create.append(product)
+        elif columns:
+            changed_by_columns[tuple(columns)].append(product)
+        else:
+            unchanged += 1
+
+    with transaction.atomic():
+        Product.objects.bulk_create(to_create, batch_size=chunk_size)
+        for columns, products in changed_by_columns.items():
+            Product.objects.bulk_update(products, columns, batch_size=chunk_size)
+
+        updated = sum(len(products) for products in changed_by_columns.values())
+        if to_create or updated:
+            caching.invalidate(Product)
+        if to_create or any(set(columns) - {'stock'} for columns in changed_by_columns):
+            catalog.invalidate()
+        stock_changed = to_create + [
+            product for columns, products in changed_by_columns.items() if 'stock' in columns for product in products
+        ]
+        outbox.stock_changed(stock_changed)
+        for product in stock_changed:
+            subscriptions.stock_changed(product)
+
+    return len(to_create), updated, unchanged, sorted(errors)
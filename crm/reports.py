@@ -0,0 +1,55 @@
+"""
+CRM report runs stored as CrmReport rows.
+
+An incremental run only aggregates the orders and customers created after
+the previous report's watermarks and adds them to that report's totals, so
+its cost follows the number of new rows rather than the size of the tables.
+A full run re-aggregates everything and resets the baseline, e.g. after
+orders were deleted. Watermarks are primary keys, so finding the new rows
+is a range scan on an index every table already has. Archived orders keep
+their ids, so both order tables are read against the same watermark.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Max, Sum
+
+from . import locks
+from .models import ArchivedOrder, CrmReport, Customer, Order
+
+
+def _new_rows(queryset, watermark, **aggregates):
+    # The primary key index bounds the scan to rows past the watermark
+    return queryset.filter(pk__gt=watermark).aggregate(count=Count('pk'), last=Max('pk'), **aggregates)
+
+
+def build_report(incremental=True):
+    """Aggregate and save a CrmReport, incrementally from the latest report when there is one."""
+    previous = CrmReport.objects.order_by('-created_at', '-pk').first() if incremental else None
+    if previous is None:
+        previous = CrmReport(last_order_id=0, last_customer_id=0)
+        mode = CrmReport.FULL
+    else:
+        mode = CrmReport.INCREMENTAL
+
+    active = _new_rows(Order.objects.all(), previous.last_order_id, revenue=Sum('total_amount'))
+    archived = _new_rows(ArchivedOrder.objects.all(), previous.last_order_id, revenue=Sum('total_amount'))
+    orders = {
+        'count': active['count'] + archived['count'],
+        'last': max(active['last'] or 0, archived['last'] or 0) or None,
+        'revenue': (active['revenue'] or Decimal('0')) + (archived['revenue'] or Decimal('0')),
+    }
+    customers = _new_rows(Customer.objects.all(), previous.last_customer_id)
+    new_revenue = orders['revenue'] or Decimal('0')
+
+    locks.check()
+    return CrmReport.objects.create(
+        mode=mode,
+        last_order_id=orders['last'] or previous.last_order_id,
+        last_customer_id=customers['last'] or previous.last_customer_id,
+        total_customers=previous.total_customers + customers['count'],
+        total_orders=previous.total_orders + orders['count'],
+        total_revenue=previous.total_revenue + new_revenue,
+        new_customers=customers['count'],
+        new_orders=orders['count'],
+        new_revenue=new_revenue,
+    )
@@ -0,0 +1,148 @@
+"""
+Stock reservations.
+
+Stock is only ever changed by conditional updates such as
+``UPDATE product SET stock = stock - n WHERE id = ? AND stock >= n``. The
+database applies each one atomically, so stock can never go negative and no
+row is locked before the write itself. Products are always updated in id
+order, so two transactions never wait on each other in opposite orders.
+
+- ``take``/``put_back``: change stock directly, for orders placed in one step.
+- ``reserve``: take units and record them as a held StockReservation that
+  expires after ``DEFAULT_TTL``.
+- ``commit``: turn held reservations into a placed order.
+- ``release``: give held units back; ``release_expired`` does this for
+  abandoned holds.
+
+Reservation status only moves on with a conditional update from ``held``.
+A reservation is therefore committed or released exactly once, even when a
+client and the expiry task race. Reservations are always read from the
+primary: a lagging replica would miss fresh holds.
+
+On SQLite, a transaction that reads before it writes fails at once if
+another writer committed in between, whatever the busy timeout. Every
+transaction here therefore starts with its first write.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import caching, locks, outbox, subscriptions
+from .models import Product, StockReservation
+from .routers import PRIMARY
+
+DEFAULT_TTL = timedelta(minutes=15)
+MAX_TTL = timedelta(hours=1)
+EXPIRY_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id):
+        super().__init__(f"Insufficient stock for product with ID {product_id}")
+        self.product_id = product_id
+
+
+class ReservationError(Exception):
+    """Reservations that are unknown, no longer held or do not match the order."""
+
+
+def _stock_changed(product_ids):
+    caching.invalidate(Product)
+    products = list(Product.objects.using(PRIMARY).filter(pk__in=product_ids))
+    outbox.stock_changed(products)
+    for product in products:
+        subscriptions.stock_changed(product)
+
+
+def take(units):
+    """Take ``units`` ({product_id: quantity}) off stock, or raise InsufficientStock. Run in a transaction."""
+    for product_id in sorted(units):
+        quantity = units[product_id]
+        if not Product.objects.filter(pk=product_id, stock__gte=quantity).update(stock=F('stock') - quantity):
+            raise InsufficientStock(product_id)
+    _stock_changed(units)
+
+
+def put_back(units):
+    for product_id in sorted(units):
+        Product.objects.filter(pk=product_id).update(stock=F('stock') + units[product_id])
+    _stock_changed(units)
+
+
+def reserve(units, ttl=DEFAULT_TTL):
+    """Hold ``units`` until committed, released or expired. Returns the new reservations."""
+    expires_at = timezone.now() + ttl
+    with transaction.atomic():
+        take(units)
+        return StockReservation.objects.bulk_create([
+            StockReservation(product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in sorted(units.items())
+        ])
+
+
+def commit(reservation_ids, order, expected_units=None):
+    """
+    Mark held reservations as used by ``order``. With ``expected_units``, the
+    reservations must hold exactly those units. Raises ReservationError. Run
+    in the order's transaction.
+    """
+    try:
+        reservation_ids = {int(pk) for pk in reservation_ids}
+    except (TypeError, ValueError):
+        raise ReservationError("Invalid reservation ID")
+    now = timezone.now()
+    reservations = list(StockReservation.objects.using(PRIMARY).filter(
+        pk__in=reservation_ids, status=StockReservation.HELD, expires_at__gt=now,
+    ))
+    if len(reservations) != len(reservation_ids):
+        raise ReservationError("Some reservations do not exist, expired or were already used")
+    held = Counter()
+    for reservation in reservations:
+        held[reservation.product_id] += reservation.quantity
+    if expected_units is not None and held != Counter(expected_units):
+        raise ReservationError("Reserved products do not match the order")
+
+    claimed = StockReservation.objects.filter(
+        pk__in=reservation_ids, status=StockReservation.HELD, expires_at__gt=now,
+    ).update(
+        status=StockReservation.COMMITTED, order=order,
+    )
+    if claimed != len(reservations):
+        raise ReservationError("Reservations were released while committing")
+    return reservations
+
+
+def release(reservation_ids):
+    """Put the units of the still-held ``reservation_ids`` back. Returns how many were released."""
+    held = list(StockReservation.objects.using(PRIMARY).filter(
+        pk__in=reservation_ids, status=StockReservation.HELD,
+    ).values_list('pk', 'product_id', 'quantity'))
+    units = Counter()
+    released = 0
+    with transaction.atomic():
+        for pk, product_id, quantity in held:
+            # Skips rows committed or released since they were read
+            if StockReservation.objects.filter(pk=pk, status=StockReservation.HELD).update(
+                status=StockReservation.RELEASED,
+            ):
+                units[product_id] += quantity
+                released += 1
+        if units:
+            put_back(units)
+    return released
+
+
+def release_expired(batch_size=EXPIRY_BATCH_SIZE):
+    """Release held reservations past their expiry, ``batch_size`` at a time. Returns how many were released."""
+    released = 0
+    while True:
+        expired = list(StockReservation.objects.using(PRIMARY).filter(
+            status=StockReservation.HELD, expires_at__lte=timezone.now(),
+        ).values_list('pk', flat=True)[:batch_size])
+        if not expired:
+            return released
+        locks.check()
+        released += release(expired)
@@ -0,0 +1,231 @@
+"""
+Aggregates maintained on order creation: the DailySales rollup and the
+per-customer order_count/lifetime_value/last_order_at.
+
+``record_order`` adds a new order to both inside the transaction that
+creates it, so revenue and customer activity questions never scan every
+order. ``rebuild`` recomputes the rollup from the orders and archived
+orders tables, for the initial backfill or after orders were changed or
+deleted, and ``reconcile_customers`` does the same for the customer fields.
+
+Product rows count each product once per order at the product's price, the
+same way order totals are computed.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Max, Sum, Value, When
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+
+from . import caching
+from .models import ArchivedOrder, ArchivedOrderProduct, Customer, DailySales, Order
+from .utils import chunked
+
+BACKFILL_CHUNK_SIZE = 5000
+
+# Every order is in exactly one of these, with its links in the matching table
+ORDER_TABLES = (
+    (Order, Order.products.through),
+    (ArchivedOrder, ArchivedOrderProduct),
+)
+
+GRANULARITIES = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def sales_date(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def _bump(date, order_count, item_count, revenue, product_id=None, customer_id=None):
+    """Add to one rollup row, creating it on the first order of its day."""
+    key = {'date': date, 'product_id': product_id, 'customer_id': customer_id}
+    increments = {
+        'order_count': F('order_count') + order_count,
+        'item_count': F('item_count') + item_count,
+        'revenue': F('revenue') + revenue,
+    }
+    if DailySales.objects.filter(**key).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            DailySales.objects.create(order_count=order_count, item_count=item_count, revenue=revenue, **key)
+    except IntegrityError:
+        # Another transaction created the row first
+        DailySales.objects.filter(**key).update(**increments)
+
+
+def record_orders(placed):
+    """
+    Add ``placed`` (order, products) pairs to the aggregates, with one
+    update per touched customer and rollup row. Call inside the orders'
+    transaction.
+    """
+    customers = {}
+    sales = defaultdict(lambda: [0, 0, Decimal('0')])
+    for order, products in placed:
+        stats = customers.setdefault(order.customer_id, [0, Decimal('0'), order.order_date])
+        stats[0] += 1
+        stats[1] += order.total_amount
+        stats[2] = max(stats[2], order.order_date)
+
+        # Like the M2M links, count each product once per order
+        lines = list({product.pk: product for product in products}.values())
+        date = sales_date(order.order_date)
+        for key in ((date, None, None), (date, None, order.customer_id)):
+            row = sales[key]
+            row[0] += 1
+            row[1] += len(lines)
+            row[2] += order.total_amount
+        for product in lines:
+            row = sales[(date, product.pk, None)]
+            row[0] += 1
+            row[1] += 1
+            row[2] += product.price
+
+    for customer_id, (order_count, lifetime_value, last_order_at) in customers.items():
+        Customer.objects.filter(pk=customer_id).update(
+            order_count=F('order_count') + order_count,
+            lifetime_value=F('lifetime_value') + lifetime_value,
+            last_order_at=Case(
+                When(last_order_at__gte=last_order_at, then=F('last_order_at')),
+                default=Value(last_order_at),
+            ),
+        )
+    for (date, product_id, customer_id), (order_count, item_count, revenue) in sales.items():
+        _bump(date, order_count, item_count, revenue, product_id=product_id, customer_id=customer_id)
+
+
+def record_order(order, products):
+    """Add ``order`` and its ``products`` to the aggregates. Call inside the order's transaction."""
+    record_orders([(order, products)])
+
+
+def _accumulate(totals, orders, links):
+    order_ids = [order['id'] for order in orders]
+    items = defaultdict(list)
+    for order_id, product_id, price in links.objects.filter(order_id__in=order_ids).values_list(
+        'order_id', 'product_id', 'product__price'
+    ):
+        items[order_id].append((product_id, price))
+
+    for order in orders:
+        date = sales_date(order['order_date'])
+        lines = items[order['id']]
+        for key in ((date, None, None), (date, None, order['customer_id'])):
+            row = totals[key]
+            row[0] += 1
+            row[1] += len(lines)
+            row[2] += order['total_amount']
+        for product_id, price in lines:
+            row = totals[(date, product_id, None)]
+            row[0] += 1
+            row[1] += 1
+            row[2] += price
+
+
+def rebuild(date_from=None, date_to=None, chunk_size=BACKFILL_CHUNK_SIZE):
+    """
+    Recompute the rollup rows between ``date_from`` and ``date_to`` (both
+    optional and inclusive), reading orders ``chunk_size`` at a time.
+    Returns the number of rollup rows written.
+    """
+    existing = DailySales.objects.all()
+    if date_from:
+        existing = existing.filter(date__gte=date_from)
+    if date_to:
+        existing = existing.filter(date__lte=date_to)
+
+    totals = defaultdict(lambda: [0, 0, Decimal('0')])
+    for model, links in ORDER_TABLES:
+        orders = model.objects.order_by('pk').values('id', 'order_date', 'customer_id', 'total_amount')
+        if date_from:
+            orders = orders.filter(order_date__date__gte=date_from)
+        if date_to:
+            orders = orders.filter(order_date__date__lte=date_to)
+        for chunk in chunked(orders.iterator(chunk_size=chunk_size), chunk_size):
+            _accumulate(totals, chunk, links)
+
+    rows = [
+        DailySales(date=date, product_id=product_id, customer_id=customer_id,
+                   order_count=order_count, item_count=item_count, revenue=revenue)
+        for (date, product_id, customer_id), (order_count, item_count, revenue) in totals.items()
+    ]
+    with transaction.atomic():
+        existing.delete()
+        DailySales.objects.bulk_create(rows, batch_size=chunk_size)
+    return len(rows)
+
+
+def reconcile_customers(chunk_size=BACKFILL_CHUNK_SIZE, dry_run=False):
+    """
+    Recompute the order stats of every customer, ``chunk_size`` customers at
+    a time, and save the ones that drifted. Returns the number of drifted
+    customers.
+    """
+    fields = ['order_count', 'lifetime_value', 'last_order_at']
+    drifted = 0
+    customers = Customer.objects.order_by('pk').only('pk', *fields)
+    for chunk in chunked(customers.iterator(chunk_size=chunk_size), chunk_size):
+        stats = {}
+        for model, _ in ORDER_TABLES:
+            for row in (
+                model.objects.filter(customer_id__in=[customer.pk for customer in chunk])
+                .values('customer_id')
+                .annotate(order_count=Count('pk'), lifetime_value=Sum('total_amount'), last_order_at=Max('order_date'))
+            ):
+                total = stats.setdefault(row['customer_id'], {
+                    'order_count': 0, 'lifetime_value': Decimal('0'), 'last_order_at': None,
+                })
+                total['order_count'] += row['order_count']
+                total['lifetime_value'] += row['lifetime_value']
+                total['last_order_at'] = max(filter(None, [total['last_order_at'], row['last_order_at']]))
+        changed = []
+        for customer in chunk:
+            actual = stats.get(customer.pk, {'order_count': 0, 'lifetime_value': Decimal('0'), 'last_order_at': None})
+            if any(getattr(customer, field) != actual[field] for field in fields):
+                for field in fields:
+                    setattr(customer, field, actual[field])
+                changed.append(customer)
+        drifted += len(changed)
+        if changed and not dry_run:
+            Customer.objects.bulk_update(changed, fields)
+    if drifted and not dry_run:
+        caching.invalidate(Customer)
+    return drifted
+
+
+def order_count(date_from=None, date_to=None, product_id=None, customer_id=None):
+    """
+    Orders placed between ``date_from`` and ``date_to`` (both optional and
+    inclusive), of one product or one customer at most, from the rollup.
+    """
+    queryset = DailySales.objects.filter(product_id=product_id, customer_id=customer_id)
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+    return queryset.aggregate(total=Sum('order_count'))['total'] or 0
+
+
+def revenue_series(granularity='day', date_from=None, date_to=None, product_id=None, customer_id=None):
+    """Revenue per day, week or month from the rollup, as dicts ordered by period."""
+    queryset = DailySales.objects.filter(product_id=product_id, customer_id=customer_id)
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+
+    trunc = GRANULARITIES[granularity]
+    period = trunc('date') if trunc else F('date')
+    return (
+        queryset.annotate(period=period)
+        .values('period')
+        .annotate(order_count=Sum('order_count'), item_count=Sum('item_count'), revenue=Sum('revenue'))
+        .order_by('period')
+    )
@@ -0,0 +1,92 @@
+"""
+Primary/replica routing for GraphQL traffic.
+
+Reads go to the ``replica`` database when one is configured; writes always
+go to ``default``. A unit of work (an HTTP request or a Celery task) is pinned
+to the primary as soon as it writes, and GraphQL mutations pin it before
+their resolvers run. That gives read-your-writes within a request, while
+plain queries and reporting reads stay off the primary.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from graphql import OperationType
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+
+_pinned = ContextVar('crm_primary_pinned', default=False)
+
+
+def pin_primary():
+    """Send every later read in this request or task to the primary."""
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def unit_of_work():
+    """Scope primary pinning to one request or task."""
+    token = _pinned.set(False)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or REPLICA not in settings.DATABASES:
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        pin_primary()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return {obj1._state.db, obj2._state.db} <= {PRIMARY, REPLICA}
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary, never migrated on its own
+        return db != REPLICA
+
+
+class PrimaryForMutationsMiddleware:
+    """Graphene middleware pinning mutation operations to the primary before any resolver reads."""
+
+    def resolve(self, next, root, info, **args):
+        if info.operation.operation == OperationType.MUTATION and info.path.prev is None:
+            pin_primary()
+        return next(root, info, **args)
+
+
+@sync_and_async_middleware
+def replica_pinning_middleware(get_response):
+    """Django middleware giving each request a fresh, unpinned routing state."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with unit_of_work():
+                return await get_response(request)
+    else:
+        def middleware(request):
+            with unit_of_work():
+                return get_response(request)
+    return middleware
+
+
+@task_prerun.connect
+def _on_task_prerun(**kwargs):
+    _pinned.set(False)
+
+
+@task_postrun.connect
+def _on_task_postrun(**kwargs):
+    _pinned.set(False)
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .consumers import GraphQLSubscriptionConsumer
+
+websocket_urlpatterns = [
+    path("graphql", GraphQLSubscriptionConsumer.as_asgi()),
+]
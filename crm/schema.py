@@ -1,9 +1,19 @@
 import graphene
-from graphene_django import DjangoObjectType, DjangoFilterConnectionField
-from django.db.models import Q
+import inspect
+from functools import partial
+from asgiref.sync import sync_to_async
+from graphene.relay.connection import connection_adapter, page_info_adapter
+from graphene_django import DjangoObjectType
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql_relay import connection_from_array_slice, cursor_to_offset, get_offset_with_default, offset_to_cursor
+from django.db.models import Q, QuerySet
 from django.db import transaction
-from .models import Customer, Product, Order
-from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .models import ArchivedOrder, Customer, Product, Order, ImportJob, CrmReport
+from .filters import ArchivedOrderFilter, CustomerFilter, ProductFilter, OrderFilter
+from . import archive, caching, catalog, counts, loaders, orders, outbox, products, reservations, rollups, subscriptions
+from collections import Counter
+from datetime import timedelta
 from django.core.exceptions import ValidationError
 from graphql import GraphQLError
 from datetime import datetime
@@ -13,28 +23,281 @@ from crm.models import Product
 # TYPES
 # --------------------------
 
+class CountedConnection(graphene.relay.Connection):
+    """Connection with a totalCount computed by the field's countStrategy."""
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    @loaders.loop_safe
+    def resolve_total_count(self, info):
+        if loaders.on_event_loop():
+            return sync_to_async(self.count_rows)()
+        return self.count_rows()
+
 class CustomerNode(DjangoObjectType):
     class Meta:
         model = Customer
         interfaces = (graphene.relay.Node,)
         filterset_class = CustomerFilter
+        connection_class = CountedConnection
+    
+    @classmethod
+    def get_node(cls, info, id):
+        if loaders.on_event_loop():
+            return loaders.get_loaders(info).customer.load(int(id))
+        return loaders.memoized(info, (Customer, str(id)), lambda: caching.cached_object(
+            Customer, id, lambda: super(CustomerNode, cls).get_node(info, id),
+        ))
 
 class ProductNode(DjangoObjectType):
     class Meta:
         model = Product
         interfaces = (graphene.relay.Node,)
         filterset_class = ProductFilter
+        connection_class = CountedConnection
+    
+    @classmethod
+    def get_node(cls, info, id):
+        if loaders.on_event_loop():
+            return loaders.get_loaders(info).product.load(int(id))
+        return loaders.memoized(info, (Product, str(id)), lambda: caching.cached_object(
+            Product, id, lambda: super(ProductNode, cls).get_node(info, id),
+        ))
 
 class OrderNode(DjangoObjectType):
     class Meta:
         model = Order
         interfaces = (graphene.relay.Node,)
         filterset_class = OrderFilter
+        connection_class = CountedConnection
     
     total_amount = graphene.Float()
+    archived = graphene.Boolean()
+    customer = graphene.Field(CustomerNode, required=True)
+    products = graphene.Dynamic(lambda: CountedConnectionField(ProductNode, required=True))
     
+    @loaders.loop_safe
     def resolve_total_amount(self, info):
         return float(self.total_amount)
+    
+    @loaders.loop_safe
+    def resolve_archived(self, info):
+        return getattr(self, 'archived', False)
+    
+    @loaders.loop_safe
+    def resolve_customer(self, info):
+        return CustomerNode.get_node(info, self.customer_id)
+    
+    @loaders.loop_safe
+    def resolve_products(self, info, **kwargs):
+        # Archived rows come out of the union as Order instances
+        archived = getattr(self, 'archived', False)
+        if loaders.on_event_loop():
+            order_loaders = loaders.get_loaders(info)
+            order_products = order_loaders.archived_order_products if archived else order_loaders.order_products
+            return order_products.load(self.pk)
+        if archived:
+            return Product.objects.filter(archived_orders=self.pk)
+        return self.products.all()
+
+class ImportRowError(graphene.ObjectType):
+    row = graphene.Int()
+    message = graphene.String()
+
+class ImportJobType(DjangoObjectType):
+    class Meta:
+        model = ImportJob
+        fields = (
+            'id', 'filename', 'total_rows', 'total_chunks', 'completed_chunks',
+            'processed_rows', 'created_count', 'error_count', 'created_at', 'finished_at',
+        )
+    
+    status = graphene.String()
+    progress = graphene.Float()
+    errors = graphene.List(ImportRowError, first=graphene.Int(default_value=100))
+    
+    def resolve_progress(self, info):
+        return self.processed_rows / self.total_rows if self.total_rows else 1.0
+    
+    def resolve_errors(self, info, first):
+        errors = []
+        for chunk_errors in self.chunks.filter(status='done').exclude(errors=[]).values_list('errors', flat=True):
+            errors.extend(ImportRowError(row=row, message=message) for row, message in chunk_errors)
+            if len(errors) >= first:
+                break
+        return errors[:first]
+
+class CrmReportType(DjangoObjectType):
+    class Meta:
+        model = CrmReport
+        fields = (
+            'id', 'created_at', 'mode', 'total_customers', 'total_orders', 'total_revenue',
+            'new_customers', 'new_orders', 'new_revenue',
+        )
+    
+    total_revenue = graphene.Float()
+    new_revenue = graphene.Float()
+    
+    def resolve_total_revenue(self, info):
+        return float(self.total_revenue)
+    
+    def resolve_new_revenue(self, info):
+        return float(self.new_revenue)
+
+class RevenueGranularity(graphene.Enum):
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+
+class RevenuePoint(graphene.ObjectType):
+    period = graphene.Date()
+    order_count = graphene.Int()
+    item_count = graphene.Int()
+    revenue = graphene.Float()
+
+class CountStrategy(graphene.Enum):
+    EXACT = counts.EXACT
+    CACHED = counts.CACHED
+    ESTIMATED = counts.ESTIMATED
+
+class StockReservationType(graphene.ObjectType):
+    id = graphene.ID()
+    product_id = graphene.ID()
+    quantity = graphene.Int()
+    status = graphene.String()
+    expires_at = graphene.DateTime()
+
+class CountedConnectionField(DjangoFilterConnectionField):
+    """
+    Filter connection with a countStrategy argument for totalCount (see
+    crm.counts). Unless the strategy is EXACT or the client pages backwards,
+    a page is read without counting the rows first.
+    """
+
+    PAGINATION_ARGS = ('first', 'last', 'before', 'after', 'offset', 'count_strategy')
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('count_strategy', CountStrategy(default_value=CountStrategy.EXACT.value))
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    @loaders.loop_safe
+    def connection_resolver(cls, resolver, connection, default_manager, queryset_resolver, max_limit,
+                            enforce_first_or_last, root, info, **args):
+        resolve = super().connection_resolver
+        if not loaders.on_event_loop():
+            return resolve(resolver, connection, default_manager, queryset_resolver, max_limit,
+                           enforce_first_or_last, root, info, **args)
+        # Under crm.async_schema: page through what a loop-safe resolver
+        # loaded, unless filters need a queryset; the rest runs in a thread
+        iterable = None
+        if getattr(resolver, 'loop_safe', False) and not set(args) - set(cls.PAGINATION_ARGS):
+            iterable = resolver(root, info, **args)
+        if not inspect.isawaitable(iterable):
+            return sync_to_async(resolve)(resolver, connection, default_manager, queryset_resolver, max_limit,
+                                          enforce_first_or_last, root, info, **args)
+        return cls.resolve_loaded(iterable, connection, default_manager, max_limit, enforce_first_or_last,
+                                  root, info, args)
+
+    @classmethod
+    async def resolve_loaded(cls, iterable, connection, default_manager, max_limit, enforce_first_or_last,
+                             root, info, args):
+        """connection_resolver for the rows a DataLoader loaded, which need no filtering."""
+        rows = await iterable
+        return super().connection_resolver(
+            lambda root, info, **args: rows, connection, default_manager,
+            lambda connection, iterable, info, args: iterable,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        if args.get('order_by') is not None:
+            # orderBy is a list; the OrderingFilter parses comma-separated fields
+            args = {**args, 'order_by': ','.join(args['order_by'])}
+        return super().resolve_queryset(connection, iterable, info, args, filtering_args, filterset_class)
+
+    @classmethod
+    def estimate_count(cls, queryset, args):
+        """This field's own estimate of the rows of ``queryset``, or None."""
+        return None
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        strategy = getattr(args.get('count_strategy'), 'value', args.get('count_strategy')) or counts.EXACT
+        parts = caching.normalize_args(args, exclude=cls.PAGINATION_ARGS)
+        iterable = maybe_queryset(iterable)
+        first = args.get('first') or (max_limit if args.get('last') is None else None)
+        paged_forward = first is not None and args.get('last') is None and not args.get('before')
+        if strategy == counts.EXACT or not isinstance(iterable, QuerySet) or not paged_forward:
+            result = super().resolve_connection(connection, args, iterable, max_limit)
+            result.count_rows = lambda: result.length
+            return result
+
+        offset = args.pop('offset', None)
+        if offset:
+            if args.get('after'):
+                offset += cursor_to_offset(args['after']) + 1
+            args['after'] = offset_to_cursor(offset - 1)
+        args['first'] = first
+        slice_start = get_offset_with_default(args.get('after'), -1) + 1
+        # One row past the page tells whether there is a next one
+        rows = list(iterable[slice_start:slice_start + first + 1])
+        result = connection_from_array_slice(
+            rows,
+            args,
+            slice_start=slice_start,
+            array_length=slice_start + len(rows),
+            array_slice_length=len(rows),
+            connection_type=partial(connection_adapter, connection),
+            edge_type=connection.Edge,
+            page_info_type=page_info_adapter,
+        )
+        result.iterable = iterable
+        result.count_rows = lambda: counts.count(
+            iterable, strategy, parts, estimate=lambda: cls.estimate_count(iterable, parts),
+        )
+        return result
+
+class CachedFilterConnectionField(CountedConnectionField):
+    """Filter connection whose filtered, ordered rows are served from crm.caching."""
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        queryset = super().resolve_queryset(connection, iterable, info, args, filtering_args, filterset_class)
+        parts = [info.field_name, caching.normalize_args(args, exclude=cls.PAGINATION_ARGS)]
+        return caching.cached_rows(queryset, parts)
+
+class OrderConnectionField(CountedConnectionField):
+    """allOrders connection; unions in archived orders when includeArchived is set."""
+
+    # Filters the DailySales rollup can count: dates, and one product
+    ESTIMATED_FILTERS = {'order_date_gte', 'order_date_lte', 'product_id'}
+
+    @classmethod
+    def estimate_count(cls, queryset, args):
+        filters = args.get('filters', {})
+        if set(args) - {'filters', 'include_archived'} or set(filters) - cls.ESTIMATED_FILTERS:
+            return None
+        date_from = filters.get('order_date_gte')
+        if not args.get('include_archived'):
+            # Older orders are archived, give or take the day the horizon falls on
+            date_from = max(filter(None, [date_from, rollups.sales_date(archive.horizon())]))
+        return rollups.order_count(date_from, filters.get('order_date_lte'), filters.get('product_id'))
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        queryset = super().resolve_queryset(connection, iterable, info, args, filtering_args, filterset_class)
+        if not args.get('include_archived'):
+            return queryset
+        archived = super().resolve_queryset(
+            connection, filter_orders(args.get('filters'), model=ArchivedOrder),
+            info, args, filtering_args, ArchivedOrderFilter,
+        )
+        return archive.with_archived(queryset, archived)
 
 # --------------------------
 # INPUT TYPES
@@ -49,11 +312,27 @@ class ProductInput(graphene.InputObjectType):
     name = graphene.String(required=True)
     price = graphene.Decimal(required=True)
     stock = graphene.Int()
+    sku = graphene.String()
+
+class ProductUpsertInput(graphene.InputObjectType):
+    name = graphene.String()
+    sku = graphene.String()
+    price = graphene.Decimal()
+    stock = graphene.Int()
+
+class ProductUpsertKey(graphene.Enum):
+    SKU = 'sku'
+    NAME = 'name'
 
 class OrderInput(graphene.InputObjectType):
     customer_id = graphene.ID(required=True)
     product_ids = graphene.List(graphene.ID, required=True)
     order_date = graphene.DateTime()
+    reservation_ids = graphene.List(graphene.ID)
+
+class StockItemInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    quantity = graphene.Int(default_value=1)
 
 class CustomerFilterInput(graphene.InputObjectType):
     name = graphene.String()
@@ -63,6 +342,13 @@ class CustomerFilterInput(graphene.InputObjectType):
     created_at_gte = graphene.Date()
     created_at_lte = graphene.Date()
     phone_pattern = graphene.String()
+    order_count_gte = graphene.Int()
+    order_count_lte = graphene.Int()
+    lifetime_value_gte = graphene.Float()
+    lifetime_value_lte = graphene.Float()
+    last_order_at_gte = graphene.Date()
+    last_order_at_lte = graphene.Date()
+    inactive_since = graphene.Date()
 
 class ProductFilterInput(graphene.InputObjectType):
     name = graphene.String()
@@ -109,7 +395,10 @@ class CreateCustomer(graphene.Mutation):
                 phone=input.phone
             )
             customer.full_clean()
-            customer.save()
+            with transaction.atomic():
+                customer.save()
+                outbox.customers_created([customer])
+            caching.invalidate(Customer)
             return CreateCustomer(
                 customer=customer,
                 message="Customer created successfully",
@@ -162,6 +451,10 @@ class BulkCreateCustomers(graphene.Mutation):
             except Exception as e:
                 errors.append(f"Row {idx + 1}: {str(e)}")
         
+        if customers:
+            caching.invalidate(Customer)
+            outbox.customers_created(customers)
+        
         return BulkCreateCustomers(
             customers=customers,
             errors=errors,
@@ -188,10 +481,16 @@ class CreateProduct(graphene.Mutation):
             product = Product(
                 name=input.name,
                 price=input.price,
-                stock=stock
+                stock=stock,
+                sku=input.sku or None
             )
             product.full_clean()
-            product.save()
+            with transaction.atomic():
+                product.save()
+                outbox.stock_changed([product])
+            caching.invalidate(Product)
+            catalog.invalidate()
+            subscriptions.stock_changed(product)
             return CreateProduct(product=product, success=True)
         except ValidationError as e:
             raise GraphQLError(str(e))
@@ -214,188 +513,167 @@ class CreateOrder(graphene.Mutation):
             except Customer.DoesNotExist:
                 raise GraphQLError(f"Customer with ID {input.customer_id} does not exist")
             
-            # Validate products exist
+            # Validate products exist, from the in-memory catalog
             products = []
+            product_catalog = catalog.get_products([int(product_id) for product_id in input.product_ids])
             for product_id in input.product_ids:
-                try:
-                    product = Product.objects.get(pk=product_id)
-                    products.append(product)
-                except Product.DoesNotExist:
+                product = product_catalog.get(int(product_id))
+                if product is None:
                     raise GraphQLError(f"Product with ID {product_id} does not exist")
+                products.append(product)
             
             if not products:
                 raise GraphQLError("At least one product is required")
             
-            # Create order
-            order = Order(
-                customer=customer,
-                order_date=input.order_date if input.order_date else datetime.now()
-            )
-            order.save()
-            order.products.set(products)
-            
-            # Calculate and save total amount
-            order.total_amount = sum(product.price for product in products)
-            order.save()
+            # Create order with its total, which Order.save() cannot derive
+            # from products before the order has a primary key. Stock is
+            # taken, or the reservations claimed, in the same transaction
+            units = Counter(product.pk for product in products)
+            with transaction.atomic():
+                if not input.reservation_ids:
+                    reservations.take(units)
+                order = Order(
+                    customer=customer,
+                    order_date=input.order_date if input.order_date else datetime.now(),
+                    total_amount=sum(product.price for product in products)
+                )
+                order.save()
+                if input.reservation_ids:
+                    reservations.commit(input.reservation_ids, order, units)
+                order.products.set([product.pk for product in products])
+                rollups.record_order(order, products)
+                outbox.orders_created([order])
+                # The customer's order stats changed
+                caching.invalidate(Customer)
+                subscriptions.order_created(order)
             
             return CreateOrder(order=order, success=True)
         except Exception as e:
             raise GraphQLError(f"Error creating order: {str(e)}")
 
-# --------------------------
-# QUERIES
-# --------------------------
+class BulkUpsertProducts(graphene.Mutation):
+    class Arguments:
+        inputs = graphene.List(graphene.NonNull(ProductUpsertInput), required=True)
+        key = ProductUpsertKey(default_value=ProductUpsertKey.SKU.value)
+    
+    created_count = graphene.Int()
+    updated_count = graphene.Int()
+    unchanged_count = graphene.Int()
+    errors = graphene.List(ImportRowError)
+    success = graphene.Boolean()
+    
+    @classmethod
+    def mutate(cls, root, info, inputs, key):
+        key = getattr(key, 'value', key)
+        created, updated, unchanged, errors = products.upsert_products([dict(row) for row in inputs], key)
+        return BulkUpsertProducts(
+            created_count=created,
+            updated_count=updated,
+            unchanged_count=unchanged,
+            errors=[ImportRowError(row=row, message=message) for row, message in errors],
+            success=not errors
+        )
 
-class Query(graphene.ObjectType):
-    customer = graphene.relay.Node.Field(CustomerNode)
-    all_customers = DjangoFilterConnectionField(
-        CustomerNode,
-        filters=CustomerFilterInput(),
-        order_by=graphene.List(of_type=graphene.String)
-    )
+class OrderResult(graphene.ObjectType):
+    index = graphene.Int()
+    success = graphene.Boolean()
+    order = graphene.Field(OrderNode)
+    error = graphene.String()
+
+class CreateOrders(graphene.Mutation):
+    class Arguments:
+        inputs = graphene.List(graphene.NonNull(OrderInput), required=True)
     
-    product = graphene.relay.Node.Field(ProductNode)
-    all_products = DjangoFilterConnectionField(
-        ProductNode,
-        filters=ProductFilterInput(),
-        order_by=graphene.List(of_type=graphene.String)
-    )
+    results = graphene.List(OrderResult)
+    created_count = graphene.Int()
+    failed_count = graphene.Int()
+    success = graphene.Boolean()
     
-    order = graphene.relay.Node.Field(OrderNode)
-    all_orders = DjangoFilterConnectionField(
-        OrderNode,
-        filters=OrderFilterInput(),
-        order_by=graphene.List(of_type=graphene.String)
-    )
+    @classmethod
+    def mutate(cls, root, info, inputs):
+        results = []
+        for index, result in enumerate(orders.create_orders(inputs)):
+            if isinstance(result, Order):
+                results.append(OrderResult(index=index, success=True, order=result))
+            else:
+                results.append(OrderResult(index=index, success=False, error=result))
+        created = sum(1 for result in results if result.success)
+        return CreateOrders(
+            results=results,
+            created_count=created,
+            failed_count=len(results) - created,
+            success=created == len(results)
+        )
+
+class ReserveStock(graphene.Mutation):
+    class Arguments:
+        items = graphene.List(graphene.NonNull(StockItemInput), required=True)
+        ttl_seconds = graphene.Int()
     
-    def resolve_all_customers(self, info, **kwargs):
-        filter_args = kwargs.get('filters', {})
-        order_by = kwargs.get('order_by', [])
-        
-        queryset = Customer.objects.all()
-        
-        # Apply filters
-        if filter_args:
-            filters = Q()
-            if filter_args.get('name_icontains'):
-                filters &= Q(name__icontains=filter_args['name_icontains'])
-            if filter_args.get('email_icontains'):
-                filters &= Q(email__icontains=filter_args['email_icontains'])
-            if filter_args.get('created_at_gte'):
-                filters &= Q(created_at__gte=filter_args['created_at_gte'])
-            if filter_args.get('created_at_lte'):
-                filters &= Q(created_at__lte=filter_args['created_at_lte'])
-            if filter_args.get('phone_pattern'):
-                filters &= Q(phone__startswith=filter_args['phone_pattern'])
-            
-            queryset = queryset.filter(filters)
-        
-        # Apply ordering
-        if order_by:
-            queryset = queryset.order_by(*order_by)
-        
-        return queryset
+    reservations = graphene.List(StockReservationType)
+    success = graphene.Boolean()
     
-    def resolve_all_products(self, info, **kwargs):
-        filter_args = kwargs.get('filters', {})
-        order_by = kwargs.get('order_by', [])
-        
-        queryset = Product.objects.all()
-        
-        # Apply filters
-        if filter_args:
-            filters = Q()
-            if filter_args.get('name_icontains'):
-                filters &= Q(name__icontains=filter_args['name_icontains'])
-            if filter_args.get('price_gte'):
-                filters &= Q(price__gte=filter_args['price_gte'])
-            if filter_args.get('price_lte'):
-                filters &= Q(price__lte=filter_args['price_lte'])
-            if filter_args.get('stock_gte'):
-                filters &= Q(stock__gte=filter_args['stock_gte'])
-            if filter_args.get('stock_lte'):
-                filters &= Q(stock__lte=filter_args['stock_lte'])
-            if filter_args.get('low_stock'):
-                filters &= Q(stock__lt=10)
+    @classmethod
+    def mutate(cls, root, info, items, ttl_seconds=None):
+        try:
+            ttl = timedelta(seconds=ttl_seconds) if ttl_seconds is not None else reservations.DEFAULT_TTL
+            if not timedelta(0) < ttl <= reservations.MAX_TTL:
+                raise GraphQLError(f"ttlSeconds must be between 1 and {int(reservations.MAX_TTL.total_seconds())}")
             
-            queryset = queryset.filter(filters)
-        
-        # Apply ordering
-        if order_by:
-            queryset = queryset.order_by(*order_by)
-        
-        return queryset
-    
-    def resolve_all_orders(self, info, **kwargs):
-        filter_args = kwargs.get('filters', {})
-        order_by = kwargs.get('order_by', [])
-        
-        queryset = Order.objects.all()
-        
-        # Apply filters
-        if filter_args:
-            filters = Q()
-            if filter_args.get('total_amount_gte'):
-                filters &= Q(total_amount__gte=filter_args['total_amount_gte'])
-            if filter_args.get('total_amount_lte'):
-                filters &= Q(total_amount__lte=filter_args['total_amount_lte'])
-            if filter_args.get('order_date_gte'):
-                filters &= Q(order_date__gte=filter_args['order_date_gte'])
-            if filter_args.get('order_date_lte'):
-                filters &= Q(order_date__lte=filter_args['order_date_lte'])
-            if filter_args.get('customer_name_icontains'):
-                filters &= Q(customer__name__icontains=filter_args['customer_name_icontains'])
-            if filter_args.get('product_name_icontains'):
-                filters &= Q(products__name__icontains=filter_args['product_name_icontains'])
-            if filter_args.get('product_id'):
-                filters &= Q(products__id=filter_args['product_id'])
+            units = Counter()
+            product_catalog = catalog.get_products([int(item.product_id) for item in items])
+            for item in items:
+                if item.quantity is None or item.quantity <= 0:
+                    raise GraphQLError("Quantity must be positive")
+                product = product_catalog.get(int(item.product_id))
+                if product is None:
+                    raise GraphQLError(f"Product with ID {item.product_id} does not exist")
+                units[product.pk] += item.quantity
+            if not units:
+                raise GraphQLError("At least one item is required")
             
-            queryset = queryset.filter(filters).distinct()
-        
-        # Apply ordering
-        if order_by:
-            queryset = queryset.order_by(*order_by)
-        
-        return queryset
-
-# --------------------------
-# SCHEMA DEFINITION
-# --------------------------
-
-class Mutation(graphene.ObjectType):
-    create_customer = CreateCustomer.Field()
-    bulk_create_customers = BulkCreateCustomers.Field()
-    create_product = CreateProduct.Field()
-    create_order = CreateOrder.Field()
-
-schema = graphene.Schema(query=Query, mutation=Mutation)
-import graphene
-from graphene_django.types import DjangoObjectType
-from products.models import Product  # Adjust import based on your app structure
-
-class ProductType(DjangoObjectType):
-    class Meta:
-        model = Product
+            return ReserveStock(reservations=reservations.reserve(units, ttl), success=True)
+        except Exception as e:
+            raise GraphQLError(f"Error reserving stock: {str(e)}")
 
-class UpdateLowStockProducts(graphene.Mutation):
+class ReleaseStock(graphene.Mutation):
     class Arguments:
-        pass
+        reservation_ids = graphene.List(graphene.NonNull(graphene.ID), required=True)
+    
+    released_count = graphene.Int()
+    success = graphene.Boolean()
+    
+    @classmethod
+    def mutate(cls, root, info, reservation_ids):
+        try:
+            released = reservations.release([int(pk) for pk in reservation_ids])
+            return ReleaseStock(released_count=released, success=True)
+        except Exception as e:
+            raise GraphQLError(f"Error releasing stock: {str(e)}")
 
-    updated_products = graphene.List(ProductType)
+class UpdateLowStockProducts(graphene.Mutation):
+    updated_products = graphene.List(ProductNode)
     success = graphene.Boolean()
     message = graphene.String()
 
-    def mutate(self, info):
+    @classmethod
+    def mutate(cls, root, info):
         try:
             # Query products with stock less than 10
             low_stock_products = Product.objects.filter(stock__lt=10)
             
             # Update stock by incrementing by 10
             updated_products = []
-            for product in low_stock_products:
-                product.stock += 10
-                product.save()
-                updated_products.append(product)
+            with transaction.atomic():
+                for product in low_stock_products:
+                    product.stock += 10
+                    product.save()
+                    subscriptions.stock_changed(product)
+                    updated_products.append(product)
+                outbox.stock_changed(updated_products)
+            
+            if updated_products:
+                caching.invalidate(Product)
             
             return UpdateLowStockProducts(
                 updated_products=updated_products,
@@ -410,8 +688,191 @@ class UpdateLowStockProducts(graphene.Mutation):
                 message=f"Error updating low-stock products: {str(e)}"
             )
 
+# --------------------------
+# QUERYSETS
+# --------------------------
+
+def filter_customers(filter_args=None, order_by=None):
+    """Customer queryset for the allCustomers filters and ordering."""
+    queryset = Customer.objects.all()
+
+    # Apply filters
+    if filter_args:
+        filters = Q()
+        if filter_args.get('name_icontains'):
+            filters &= Q(name__icontains=filter_args['name_icontains'])
+        if filter_args.get('email_icontains'):
+            filters &= Q(email__icontains=filter_args['email_icontains'])
+        if filter_args.get('created_at_gte'):
+            filters &= Q(created_at__gte=filter_args['created_at_gte'])
+        if filter_args.get('created_at_lte'):
+            filters &= Q(created_at__lte=filter_args['created_at_lte'])
+        if filter_args.get('phone_pattern'):
+            filters &= Q(phone__startswith=filter_args['phone_pattern'])
+        if filter_args.get('order_count_gte') is not None:
+            filters &= Q(order_count__gte=filter_args['order_count_gte'])
+        if filter_args.get('order_count_lte') is not None:
+            filters &= Q(order_count__lte=filter_args['order_count_lte'])
+        if filter_args.get('lifetime_value_gte') is not None:
+            filters &= Q(lifetime_value__gte=filter_args['lifetime_value_gte'])
+        if filter_args.get('lifetime_value_lte') is not None:
+            filters &= Q(lifetime_value__lte=filter_args['lifetime_value_lte'])
+        if filter_args.get('last_order_at_gte'):
+            filters &= Q(last_order_at__gte=filter_args['last_order_at_gte'])
+        if filter_args.get('last_order_at_lte'):
+            filters &= Q(last_order_at__lte=filter_args['last_order_at_lte'])
+        if filter_args.get('inactive_since'):
+            filters &= Q(last_order_at__isnull=True) | Q(last_order_at__lt=filter_args['inactive_since'])
+
+        queryset = queryset.filter(filters)
+
+    # Apply ordering
+    if order_by:
+        queryset = queryset.order_by(*order_by)
+
+    return queryset
+
+def filter_products(filter_args=None, order_by=None):
+    """Product queryset for the allProducts filters and ordering."""
+    queryset = Product.objects.all()
+
+    # Apply filters
+    if filter_args:
+        filters = Q()
+        if filter_args.get('name_icontains'):
+            filters &= Q(name__icontains=filter_args['name_icontains'])
+        if filter_args.get('price_gte'):
+            filters &= Q(price__gte=filter_args['price_gte'])
+        if filter_args.get('price_lte'):
+            filters &= Q(price__lte=filter_args['price_lte'])
+        if filter_args.get('stock_gte'):
+            filters &= Q(stock__gte=filter_args['stock_gte'])
+        if filter_args.get('stock_lte'):
+            filters &= Q(stock__lte=filter_args['stock_lte'])
+        if filter_args.get('low_stock'):
+            filters &= Q(stock__lt=10)
+
+        queryset = queryset.filter(filters)
+
+    # Apply ordering
+    if order_by:
+        queryset = queryset.order_by(*order_by)
+
+    return queryset
+
+def filter_orders(filter_args=None, order_by=None, model=Order):
+    """Order (or ArchivedOrder) queryset for the allOrders filters and ordering."""
+    queryset = model.objects.all()
+
+    # Apply filters
+    if filter_args:
+        filters = Q()
+        if filter_args.get('total_amount_gte'):
+            filters &= Q(total_amount__gte=filter_args['total_amount_gte'])
+        if filter_args.get('total_amount_lte'):
+            filters &= Q(total_amount__lte=filter_args['total_amount_lte'])
+        if filter_args.get('order_date_gte'):
+            filters &= Q(order_date__gte=filter_args['order_date_gte'])
+        if filter_args.get('order_date_lte'):
+            filters &= Q(order_date__lte=filter_args['order_date_lte'])
+        if filter_args.get('customer_name_icontains'):
+            filters &= Q(customer__name__icontains=filter_args['customer_name_icontains'])
+        if filter_args.get('product_name_icontains'):
+            filters &= Q(products__name__icontains=filter_args['product_name_icontains'])
+        if filter_args.get('product_id'):
+            filters &= Q(products__id=filter_args['product_id'])
+
+        queryset = queryset.filter(filters).distinct()
+
+    # Apply ordering
+    if order_by:
+        queryset = queryset.order_by(*order_by)
+
+    return queryset
+
+# --------------------------
+# QUERIES
+# --------------------------
+
+class Query(graphene.ObjectType):
+    customer = graphene.relay.Node.Field(CustomerNode)
+    all_customers = CachedFilterConnectionField(
+        CustomerNode,
+        filters=CustomerFilterInput()
+    )
+    
+    product = graphene.relay.Node.Field(ProductNode)
+    all_products = CachedFilterConnectionField(
+        ProductNode,
+        filters=ProductFilterInput()
+    )
+    
+    order = graphene.relay.Node.Field(OrderNode)
+    all_orders = OrderConnectionField(
+        OrderNode,
+        filters=OrderFilterInput(),
+        include_archived=graphene.Boolean(default_value=False)
+    )
+    
+    import_job = graphene.Field(ImportJobType, id=graphene.ID(required=True))
+    
+    crm_reports = graphene.List(
+        CrmReportType,
+        since=graphene.DateTime(),
+        until=graphene.DateTime(),
+        first=graphene.Int(default_value=52)
+    )
+    
+    revenue_series = graphene.List(
+        RevenuePoint,
+        granularity=RevenueGranularity(default_value=RevenueGranularity.DAY.value),
+        from_=graphene.Date(name='from'),
+        to=graphene.Date(),
+        product_id=graphene.ID(),
+        customer_id=graphene.ID()
+    )
+    
+    # orderBy is applied by the FilterSets' OrderingFilter
+    def resolve_all_customers(self, info, **kwargs):
+        return filter_customers(kwargs.get('filters', {}))
+    
+    def resolve_all_products(self, info, **kwargs):
+        return filter_products(kwargs.get('filters', {}))
+    
+    def resolve_all_orders(self, info, **kwargs):
+        return filter_orders(kwargs.get('filters', {}))
+    
+    def resolve_import_job(self, info, id):
+        return ImportJob.objects.filter(pk=id).first()
+    
+    def resolve_crm_reports(self, info, first, since=None, until=None):
+        queryset = CrmReport.objects.all()
+        if since:
+            queryset = queryset.filter(created_at__gte=since)
+        if until:
+            queryset = queryset.filter(created_at__lte=until)
+        return queryset[:first]
+    
+    def resolve_revenue_series(self, info, granularity, from_=None, to=None, product_id=None, customer_id=None):
+        granularity = getattr(granularity, 'value', granularity)
+        return [
+            RevenuePoint(**point)
+            for point in rollups.revenue_series(granularity, from_, to, product_id, customer_id)
+        ]
+
+# --------------------------
+# SCHEMA DEFINITION
+# --------------------------
+
 class Mutation(graphene.ObjectType):
+    create_customer = CreateCustomer.Field()
+    bulk_create_customers = BulkCreateCustomers.Field()
+    create_product = CreateProduct.Field()
+    bulk_upsert_products = BulkUpsertProducts.Field()
+    create_order = CreateOrder.Field()
+    create_orders = CreateOrders.Field()
+    reserve_stock = ReserveStock.Field()
+    release_stock = ReleaseStock.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
 
-# Make sure to include this mutation in your main Mutation class
-# If you already have a Mutation class, add: update_low_stock_products = UpdateLowStockProducts.Field()
+schema = graphene.Schema(query=Query, mutation=Mutation)
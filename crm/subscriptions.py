@@ -0,0 +1,50 @@
+"""
+Order and stock events for GraphQL subscriptions.
+
+Mutations publish small events (just ids and stock levels) to a channel layer
+group once their transaction commits; every open subscription listens on that
+group and loads the fresh row before pushing it to the client. With the
+in-memory layer this only reaches subscribers in the same process, so use the
+Redis layer whenever more than one server process handles traffic.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+ORDERS_GROUP = 'crm.orders'
+STOCK_GROUP = 'crm.stock'
+
+
+def publish(group, event):
+    """Send ``event`` to every subscriber of ``group``."""
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    async_to_sync(layer.group_send)(group, {'type': 'crm.event', **event})
+
+
+def publish_on_commit(group, event):
+    """Publish once the surrounding transaction commits, so listeners never see rolled-back rows."""
+    # A channel layer outage is logged, not raised: the write already committed,
+    # and the callbacks queued after this one (cache invalidation) must still run
+    transaction.on_commit(lambda: publish(group, event), robust=True)
+
+
+def order_created(order):
+    publish_on_commit(ORDERS_GROUP, {'order_id': order.pk})
+
+
+def stock_changed(product):
+    publish_on_commit(STOCK_GROUP, {'product_id': product.pk, 'stock': product.stock})
+
+
+async def listen(group):
+    """Yield the events sent to ``group`` until the consumer stops iterating."""
+    layer = get_channel_layer()
+    channel = await layer.new_channel()
+    await layer.group_add(group, channel)
+    try:
+        while True:
+            yield await layer.receive(channel)
+    finally:
+        await layer.group_discard(group, channel)
@@ -1,83 +1,62 @@
 from celery import shared_task
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
-import requests
+from django.db import OperationalError
+
+from . import analytics, archive, imports, outbox, reports, reservations
+from .locks import LeaseLost, single_flight
+from .logsink import get_sink
+
+REPORT_LOG = '/tmp/crm_report_log.txt'
 
 logger = logging.getLogger(__name__)
 
 @shared_task
-def generate_crm_report():
+@single_flight(every=timedelta(days=7))
+def generate_crm_report(incremental=True):
     """
-    Celery task to generate weekly CRM report using GraphQL queries
+    Celery task to generate the weekly CRM report and store it as a CrmReport
     """
     try:
-        # Setup GraphQL client
-        transport = RequestsHTTPTransport(
-            url="http://localhost:8000/graphql",
-            use_json=True
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        
-        # GraphQL query to get CRM statistics
-        query = gql("""
-            query {
-                totalCustomers: customers {
-                    totalCount
-                }
-                totalOrders: orders {
-                    totalCount
-                }
-                totalRevenue: orders {
-                    edges {
-                        node {
-                            totalAmount
-                        }
-                    }
-                }
-            }
-        """)
-        
-        # Execute the query
-        result = client.execute(query)
-        
-        # Extract data
-        total_customers = result.get('totalCustomers', {}).get('totalCount', 0)
-        total_orders = result.get('totalOrders', {}).get('totalCount', 0)
-        
-        # Calculate total revenue
-        total_revenue = 0
-        revenue_edges = result.get('totalRevenue', {}).get('edges', [])
-        for edge in revenue_edges:
-            total_amount = edge.get('node', {}).get('totalAmount', 0)
-            total_revenue += float(total_amount) if total_amount else 0
+        report = reports.build_report(incremental=incremental)
         
         # Format the report
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        report_message = f"{timestamp} - Report: {total_customers} customers, {total_orders} orders, {total_revenue:.2f} revenue"
+        timestamp = report.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        report_message = (
+            f"{timestamp} - Report: {report.total_customers} customers, "
+            f"{report.total_orders} orders, {report.total_revenue:.2f} revenue"
+        )
         
         # Log to file
-        with open('/tmp/crm_report_log.txt', 'a') as log_file:
-            log_file.write(report_message + '\n')
+        get_sink(REPORT_LOG).write(
+            report_message,
+            status='success',
+            report=report.id,
+            customers=report.total_customers,
+            orders=report.total_orders,
+            revenue=float(report.total_revenue),
+        )
         
         # Also log to Celery logger
         logger.info(f"CRM report generated: {report_message}")
         
         return {
             'status': 'success',
-            'customers': total_customers,
-            'orders': total_orders,
-            'revenue': total_revenue,
+            'report': report.id,
+            'mode': report.mode,
+            'customers': report.total_customers,
+            'orders': report.total_orders,
+            'revenue': float(report.total_revenue),
             'message': report_message
         }
         
+    except LeaseLost:
+        raise
     except Exception as e:
         error_message = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Error generating CRM report: {str(e)}"
         
         # Log error to file
-        with open('/tmp/crm_report_log.txt', 'a') as log_file:
-            log_file.write(error_message + '\n')
+        get_sink(REPORT_LOG).write(error_message, status='error', error=str(e))
         
         logger.error(error_message)
         
@@ -85,3 +64,72 @@ def generate_crm_report():
             'status': 'error',
             'message': error_message
         }
+
+@shared_task(autoretry_for=(OperationalError,), retry_backoff=True, max_retries=5)
+def import_customer_chunk(chunk_id):
+    """
+    Import one chunk of a customer CSV. Safe to retry: a chunk that already
+    committed is skipped.
+    """
+    chunk = imports.process_chunk(chunk_id)
+    return {
+        'job': chunk.job_id,
+        'chunk': chunk.index,
+        'created': chunk.created_count,
+        'errors': len(chunk.errors),
+    }
+
+@shared_task
+def resume_import_job(job_id):
+    """Re-queue the chunks of an import that never completed, e.g. after a worker crash."""
+    return {'job': job_id, 'queued_chunks': imports.dispatch_chunks(job_id)}
+
+@shared_task
+@single_flight(every=timedelta(days=1))
+def compute_customer_cohorts():
+    """Rebuild the CohortRetention table from all orders."""
+    return {'cohort_rows': analytics.save_cohorts(analytics.customer_cohorts())}
+
+@shared_task
+@single_flight(every=timedelta(days=1))
+def compute_product_reports(top=50, per_product=10):
+    """Rebuild the TopProduct and ProductAffinity tables from all order lines."""
+    ranking, pairs = analytics.save_product_reports(*analytics.product_reports(top, per_product))
+    return {'top_products': ranking, 'affinities': pairs}
+
+@shared_task
+@single_flight(every=timedelta(minutes=1))
+def release_expired_reservations():
+    """Put the stock of abandoned reservations back."""
+    return {'released': reservations.release_expired()}
+
+@shared_task(ignore_result=True)
+def drain_outbox():
+    """Hand pending outbox events to their handlers in batches."""
+    return {'processed': outbox.drain()}
+
+@shared_task
+@single_flight(every=timedelta(days=1))
+def purge_outbox():
+    """Delete outbox events processed more than a week ago."""
+    return {'deleted': outbox.purge()}
+
+@shared_task
+@single_flight(every=timedelta(days=1))
+def archive_orders():
+    """Move orders older than CRM_ORDER_ARCHIVE_DAYS to the archive tables."""
+    return {'archived': archive.archive_orders()}
+
+@shared_task
+@single_flight(every=timedelta(minutes=5))
+def log_crm_heartbeat():
+    """Formerly a django-crontab job on every node; see crm.cron."""
+    from . import cron
+    return cron.log_crm_heartbeat()
+
+@shared_task
+@single_flight(every=timedelta(hours=12))
+def update_low_stock():
+    """Formerly a django-crontab job on every node; see crm.cron."""
+    from . import cron
+    return cron.update_low_stock()
@@ -1,3 +1,1156 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphql import OperationType
+from graphql_relay import to_global_id
+from prometheus_client import REGISTRY
+
+from . import (
+    analytics, archive, caching, catalog, counts, exports, health, idempotency, imports, locks, logsink,
+    metrics, outbox, reports, reservations, routers,
+)
+from .consumers import GraphQLSubscriptionConsumer
+from .db import DEFAULT_SQLITE_PRAGMAS, apply_pragmas, configure_sqlite, sqlite_pragmas
+from .management.bench import percentiles
+from .models import (
+    ArchivedOrder, ArchivedOrderProduct, CohortRetention, CrmReport, Customer, DailySales, ImportChunk,
+    ImportJob, JobLease, Order, OutboxEvent, Product, StockReservation, TopProduct,
+)
+
+
+class GraphQLTestMixin:
+    """Helpers to post operations to the GraphQL endpoints."""
+
+    def post(self, body, path='/graphql', **headers):
+        return self.client.post(path, json.dumps(body), content_type='application/json', **headers)
+
+    def graphql(self, query, **headers):
+        response = self.post({'query': query}, **headers)
+        return response.json()
+
+
+def create_order(customer, products, **fields):
+    order = Order.objects.create(
+        customer=customer, total_amount=sum(product.price for product in products), **fields,
+    )
+    order.products.set(products)
+    return order
+
+
+
+# --------------------------
+# METRICS
+# --------------------------
+
+class MetricsTests(GraphQLTestMixin, TestCase):
+    def sample(self, name, operation):
+        return REGISTRY.get_sample_value(name, {'operation': operation}) or 0
+
+    def test_operations_are_timed_and_counted_by_name(self):
+        before = self.sample('crm_graphql_operation_duration_seconds_count', 'Hello')
+        errors = self.sample('crm_graphql_operation_errors_total', 'Hello')
+        self.graphql('query Hello { hello }')
+        self.graphql('query Hello { customer(id: "Q3VzdG9tZXJOb2RlOjA=") { name } }')
+        self.assertEqual(self.sample('crm_graphql_operation_duration_seconds_count', 'Hello'), before + 2)
+        self.assertEqual(self.sample('crm_graphql_operation_errors_total', 'Hello'), errors)
+        self.graphql('query Hello { customer(id: "nope") { name } }')
+        self.assertEqual(self.sample('crm_graphql_operation_errors_total', 'Hello'), errors + 1)
+
+    def test_label_set_is_bounded(self):
+        self.assertEqual(metrics.operation_label('{ hello }'), 'anonymous')
+        self.assertEqual(metrics.operation_label('query Broken {', valid=False), 'invalid')
+        with mock.patch.object(metrics, '_operation_names', set()), \
+                mock.patch.object(metrics, 'MAX_OPERATION_LABELS', 1):
+            self.assertEqual(metrics.operation_label('query First { hello }'), 'First')
+            self.assertEqual(metrics.operation_label('query Second { hello }'), 'other')
+            self.assertEqual(metrics.operation_label('query First { hello }'), 'First')
+
+    def test_metrics_view(self):
+        self.graphql('query Hello { hello }')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'crm_graphql_operation_duration_seconds_count{operation="Hello"}', response.content)
+
+
+# --------------------------
+# HEALTH CHECKS
+# --------------------------
+
+class HealthTests(TestCase):
+    def test_healthy(self):
+        with mock.patch.dict(health.CHECKS, {'broker': lambda: None}):
+            response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['status'], 'ok')
+        self.assertEqual(set(body['checks']), {'database', 'broker', 'schema'})
+        self.assertTrue(all(check['ok'] and check['latency_us'] >= 0 for check in body['checks'].values()))
+
+    def test_one_failing_probe_does_not_hide_the_others(self):
+        def broker_down():
+            raise ConnectionError('broker down')
+
+        with mock.patch.dict(health.CHECKS, {'broker': broker_down}):
+            response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 503)
+        checks = response.json()['checks']
+        self.assertEqual(checks['broker']['error'], 'broker down')
+        self.assertTrue(checks['database']['ok'] and checks['schema']['ok'])
+
+
+# --------------------------
+# LOG SINK
+# --------------------------
+
+class LogSinkTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'job_log.txt')
+
+    def sink(self, **options):
+        sink = logsink.LogSink(self.path, flush_interval=0, **options)
+        self.addCleanup(sink.close)
+        return sink
+
+    def read(self, suffix=''):
+        with open(self.path + suffix, encoding='utf-8') as log_file:
+            return log_file.read().splitlines()
+
+    def test_rotates_by_size_and_keeps_backups(self):
+        sink = self.sink(max_bytes=10, backup_count=2)
+        for line in ['one', 'two', 'three', 'four']:
+            sink.write(line)
+        sink.flush()
+        self.assertEqual(self.read(), ['four'])
+        self.assertEqual(self.read('.1'), ['three'])
+        self.assertEqual(self.read('.2'), ['one', 'two'])
+        self.assertFalse(os.path.exists(self.path + '.3'))
+
+    def test_rotates_by_age(self):
+        sink = self.sink(max_age=0)
+        sink.write('old')
+        sink.write('new')
+        sink.flush()
+        self.assertEqual(self.read(), ['new'])
+        self.assertEqual(self.read('.1'), ['old'])
+
+    def test_writers_of_one_file_rotate_once(self):
+        # Two sinks on one path stand for two processes
+        first, second = self.sink(max_bytes=20), self.sink(max_bytes=20)
+        first.write('a' * 8)
+        second.write('b' * 8)
+        first.write('c' * 14)
+        # The second sink decided to rotate too, just before the first did
+        with mock.patch.object(second, '_moved', side_effect=[False, True]):
+            second.write('d' * 14)
+        self.assertEqual(self.read('.1'), ['a' * 8, 'b' * 8])
+        self.assertEqual(self.read(), ['c' * 14, 'd' * 14])
+        self.assertFalse(os.path.exists(self.path + '.2'))
+
+    def test_reopens_a_file_rotated_by_another_writer(self):
+        first, second = self.sink(max_bytes=20), self.sink()
+        second.write('b' * 8)
+        first.write('a' * 8)
+        first.write('c' * 14)
+        second.write('d' * 8)
+        self.assertEqual(self.read('.1'), ['b' * 8, 'a' * 8])
+        self.assertEqual(self.read(), ['c' * 14, 'd' * 8])
+
+    def test_json_lines(self):
+        sink = self.sink(json_lines=True)
+        sink.write('done', rows=3)
+        sink.flush()
+        record = json.loads(self.read()[0])
+        self.assertEqual((record['message'], record['rows']), ('done', 3))
+
+
+# --------------------------
+# ASYNC GRAPHQL
+# --------------------------
+
+class AsyncSchemaTests(GraphQLTestMixin, TransactionTestCase):
+    QUERY = """
+    { allOrders(first: 2, orderBy: ["-total_amount"], countStrategy: ESTIMATED) {
+        totalCount
+        edges { node {
+            id totalAmount customer { id name }
+            products { totalCount edges { node { name price } } }
+        } }
+    } }
+    """
+
+    def setUp(self):
+        cache.clear()
+        alice = Customer.objects.create(name='Alice', email='alice@example.com')
+        bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        laptop = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+        mouse = Product.objects.create(name='Mouse', price=Decimal('19.99'), stock=5)
+        create_order(alice, [laptop, mouse])
+        create_order(bob, [mouse])
+        create_order(alice, [laptop])
+        self.alice = alice
+
+    def test_serves_the_sync_schema(self):
+        sync = self.post({'query': self.QUERY}).json()
+        self.assertNotIn('errors', sync)
+        self.assertEqual(self.post({'query': self.QUERY}, path='/graphql/async').json(), sync)
+        self.assertEqual([edge['node']['totalAmount'] for edge in sync['data']['allOrders']['edges']], [1019.98, 999.99])
+
+    def test_related_rows_are_loaded_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post({'query': self.QUERY.replace('first: 2', 'first: 3')}, path='/graphql/async')
+        self.assertNotIn('errors', response.json())
+        # One query for the customers and one for the products of all three orders
+        tables = [query['sql'].split(' FROM ')[1].split()[0] for query in queries.captured_queries]
+        self.assertEqual(tables.count('"crm_customer"'), 1)
+        self.assertEqual(tables.count('"crm_order_products"'), 1)
+
+    def test_node_lookup_and_mutation(self):
+        query = '{ customer(id: "%s") { name orderCount } }' % to_global_id('CustomerNode', self.alice.pk)
+        response = self.post({'query': query}, path='/graphql/async').json()
+        self.assertEqual(response, {'data': {'customer': {'name': 'Alice', 'orderCount': 0}}})
+
+        mutation = 'mutation { createCustomer(input: {name: "Carol", email: "carol@example.com"}) { customer { id } } }'
+        response = self.post({'query': mutation}, path='/graphql/async').json()
+        carol = Customer.objects.get(email='carol@example.com')
+        self.assertEqual(response['data']['createCustomer']['customer']['id'], to_global_id('CustomerNode', carol.pk))
+
+
+class PercentileTests(TestCase):
+    def test_small_samples(self):
+        self.assertEqual(percentiles([], 50, 99), [0.0, 0.0])
+        self.assertEqual(percentiles([0.2], 50, 99), [0.2, 0.2])
+        self.assertEqual(percentiles([1, 2, 3], 50), [2])
+
+
+# --------------------------
+# SUBSCRIPTIONS
+# --------------------------
+
+class SubscriptionTests(GraphQLTestMixin, TransactionTestCase):
+    async def connect(self, init=True):
+        communicator = WebsocketCommunicator(
+            GraphQLSubscriptionConsumer.as_asgi(), '/graphql', subprotocols=['graphql-transport-ws'],
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        if init:
+            await communicator.send_json_to({'type': 'connection_init'})
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'connection_ack'})
+        return communicator
+
+    async def subscribe(self, communicator, query):
+        await communicator.send_json_to({'id': '1', 'type': 'subscribe', 'payload': {'query': query}})
+        # Let the subscription join its channel layer group
+        self.assertTrue(await communicator.receive_nothing(0.1))
+
+    async def test_order_created(self):
+        customer = await Customer.objects.acreate(name='Alice', email='alice@example.com')
+        product = await Product.objects.acreate(name='Laptop', price=Decimal('999.99'), stock=5)
+        communicator = await self.connect()
+        await self.subscribe(communicator, 'subscription { orderCreated { totalAmount customer { name } } }')
+
+        mutation = 'mutation { createOrder(input: {customerId: "%s", productIds: ["%s"]}) { success } }'
+        await sync_to_async(self.graphql)(mutation % (customer.pk, product.pk))
+        message = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(message, {
+            'id': '1',
+            'type': 'next',
+            'payload': {'data': {'orderCreated': {'totalAmount': 999.99, 'customer': {'name': 'Alice'}}}},
+        })
+        await communicator.send_json_to({'id': '1', 'type': 'complete'})
+        await communicator.disconnect()
+
+    async def test_stock_changed_for_one_product(self):
+        # Restocked as well, but filtered out by productId
+        await Product.objects.acreate(name='Laptop', price=Decimal('999.99'), stock=5)
+        mouse = await Product.objects.acreate(name='Mouse', price=Decimal('19.99'), stock=5)
+        communicator = await self.connect()
+        await self.subscribe(communicator, 'subscription { stockChanged(productId: "%s") { name stock } }' % mouse.pk)
+
+        await sync_to_async(self.graphql)('mutation { updateLowStockProducts { success } }')
+        message = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(message['payload'], {'data': {'stockChanged': {'name': 'Mouse', 'stock': 15}}})
+        # The laptop's event was skipped
+        self.assertTrue(await communicator.receive_nothing(0.1))
+        await communicator.disconnect()
+
+    async def test_subscribe_before_init_closes(self):
+        communicator = await self.connect(init=False)
+        await communicator.send_json_to({'id': '1', 'type': 'subscribe', 'payload': {'query': '{ hello }'}})
+        self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close', 'code': 4401})
+
+
+# --------------------------
+# SQLITE TUNING
+# --------------------------
+
+class SqlitePragmaTests(TestCase):
+    def pragma(self, cursor, name):
+        cursor.execute(f"PRAGMA {name}")
+        return cursor.fetchone()[0]
+
+    def test_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            self.assertEqual(self.pragma(cursor, 'busy_timeout'), 5000)
+            self.assertEqual(self.pragma(cursor, 'synchronous'), 1)  # NORMAL
+            self.assertEqual(self.pragma(cursor, 'cache_size'), -64 * 1024)
+
+    def test_wal_mode_on_a_database_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database = sqlite3.connect(os.path.join(directory, 'crm.sqlite3'))
+            apply_pragmas(database.cursor(), DEFAULT_SQLITE_PRAGMAS)
+            self.assertEqual(self.pragma(database.cursor(), 'journal_mode'), 'wal')
+            database.close()
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 100})
+    def test_pragmas_come_from_settings(self):
+        self.assertEqual(sqlite_pragmas(), {'busy_timeout': 100})
+
+    def test_other_databases_are_left_alone(self):
+        postgres = mock.Mock(vendor='postgresql')
+        configure_sqlite(None, postgres)
+        postgres.cursor.assert_not_called()
+
+
+# --------------------------
+# READ REPLICA ROUTING
+# --------------------------
+
+@mock.patch.dict(settings.DATABASES, {routers.REPLICA: settings.DATABASES['default']})
+class RouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+
+    def test_reads_go_to_the_replica_until_a_write(self):
+        with routers.unit_of_work():
+            self.assertEqual(self.router.db_for_read(Customer), routers.REPLICA)
+            self.assertEqual(self.router.db_for_write(Customer), routers.PRIMARY)
+            # Read-your-writes: the rest of the unit of work stays on the primary
+            self.assertEqual(self.router.db_for_read(Customer), routers.PRIMARY)
+        with routers.unit_of_work():
+            self.assertEqual(self.router.db_for_read(Customer), routers.REPLICA)
+
+    def test_mutations_pin_before_their_resolvers_read(self):
+        middleware = routers.PrimaryForMutationsMiddleware()
+        info = SimpleNamespace(operation=SimpleNamespace(operation=OperationType.MUTATION), path=SimpleNamespace(prev=None))
+        with routers.unit_of_work():
+            pinned = middleware.resolve(lambda root, info: routers.is_pinned(), None, info)
+        self.assertTrue(pinned)
+        info.operation.operation = OperationType.QUERY
+        with routers.unit_of_work():
+            pinned = middleware.resolve(lambda root, info: routers.is_pinned(), None, info)
+        self.assertFalse(pinned)
+
+    def test_replica_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate(routers.REPLICA, 'crm'))
+        self.assertTrue(self.router.allow_migrate(routers.PRIMARY, 'crm'))
+
+    def test_without_a_replica_everything_reads_the_primary(self):
+        # The class's patch.dict puts it back
+        del settings.DATABASES[routers.REPLICA]
+        with routers.unit_of_work():
+            self.assertEqual(self.router.db_for_read(Customer), routers.PRIMARY)
+
+
+# --------------------------
+# EXPORTS
+# --------------------------
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.alice = Customer.objects.create(name='Alice', email='alice@example.com')
+        self.bob = Customer.objects.create(name='Bob', email='bob@example.com', phone='+1234567890')
+        self.laptop = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+        self.laptop_bag = Product.objects.create(name='Laptop bag', price=Decimal('49.99'), stock=5)
+        self.order = create_order(self.alice, [self.laptop, self.laptop_bag])
+        create_order(self.bob, [self.laptop_bag])
+
+    def export(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_orders_as_ndjson(self):
+        # Both products match, but the order is exported once
+        rows = [json.loads(line) for line in self.export('/export/orders?product_name=laptop&customer_name=ali').splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], self.order.pk)
+        self.assertEqual(rows[0]['customer__name'], 'Alice')
+        self.assertEqual(sorted(rows[0]['product_ids']), [self.laptop.pk, self.laptop_bag.pk])
+
+    def test_customers_as_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('/export/customers?format=csv'))))
+        self.assertEqual([row['name'] for row in rows], ['Alice', 'Bob'])
+        self.assertEqual(rows[1]['phone'], '+1234567890')
+
+    def test_rows_are_read_in_chunks(self):
+        chunks = list(exports.order_rows({}, chunk_size=1))
+        self.assertEqual([len(chunk) for chunk in chunks], [1, 1])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get('/export/orders?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/export/orders?total_amount__gte=lots').status_code, 400)
+        self.assertEqual(self.client.get('/export/products').status_code, 404)
+
+
+# --------------------------
+# CUSTOMER IMPORTS
+# --------------------------
+
+class ImportTests(GraphQLTestMixin, TestCase):
+    CSV = (
+        "name,email,phone\n"
+        "Alice,alice@example.com,+1-555-123-4567\n"
+        "Bob,not-an-email,\n"
+        "Carol,carol@example.com,\n"
+        "Carol again,carol@example.com,\n"
+        "Dave,existing@example.com,\n"
+    )
+
+    def setUp(self):
+        cache.clear()
+        Customer.objects.create(name='Existing', email='existing@example.com')
+
+    def upload(self, text=CSV):
+        upload = SimpleUploadedFile('customers.csv', text.encode(), content_type='text/csv')
+        return self.client.post('/import/customers', {'file': upload})
+
+    def create_job(self, chunk_size):
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = imports.create_import_job(io.BytesIO(self.CSV.encode()), chunk_size=chunk_size)
+        # The chunks are queued once the job commits
+        self.assertEqual(len(callbacks), 1)
+        return job
+
+    def import_job(self, job_id):
+        query = '{ importJob(id: "%s") { status progress createdCount errorCount errors { row message } } }'
+        return self.graphql(query % job_id)['data']['importJob']
+
+    def test_upload(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['totalRows'], 5)
+        self.assertEqual(self.import_job(response.json()['id'])['status'], 'pending')
+
+    def test_import_in_chunks(self):
+        job_id = self.create_job(chunk_size=2).pk
+        self.assertEqual(ImportChunk.objects.filter(job_id=job_id).count(), 3)
+        for chunk in ImportChunk.objects.filter(job_id=job_id):
+            imports.process_chunk(chunk.pk)
+        job = self.import_job(job_id)
+        self.assertEqual((job['status'], job['progress'], job['createdCount'], job['errorCount']), ('completed', 1.0, 2, 3))
+        self.assertEqual([error['row'] for error in job['errors']], [2, 4, 5])
+        self.assertEqual(
+            sorted(Customer.objects.values_list('name', flat=True)), ['Alice', 'Carol', 'Existing'],
+        )
+
+    def test_retried_chunk_is_not_imported_twice(self):
+        chunk = ImportChunk.objects.get(job=self.create_job(chunk_size=10))
+        imports.process_chunk(chunk.pk)
+        imports.process_chunk(chunk.pk)
+        job = ImportJob.objects.get(pk=chunk.job_id)
+        self.assertEqual((job.completed_chunks, job.created_count), (1, 2))
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_resume_queues_only_pending_chunks(self):
+        job = self.create_job(chunk_size=2)
+        imports.process_chunk(ImportChunk.objects.get(job=job, index=0).pk)
+        with mock.patch('celery.group') as group:
+            self.assertEqual(imports.dispatch_chunks(job.pk), 2)
+        group.return_value.apply_async.assert_called_once()
+
+    def test_missing_columns_are_refused(self):
+        response = self.upload("name,phone\nAlice,+1234567890\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ImportJob.objects.exists())
+
+
+# --------------------------
+# CRM REPORTS
+# --------------------------
+
+class ReportTests(GraphQLTestMixin, TestCase):
+    def setUp(self):
+        self.alice = Customer.objects.create(name='Alice', email='alice@example.com')
+        self.laptop = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+        create_order(self.alice, [self.laptop])
+
+    def test_incremental_report_adds_only_new_rows(self):
+        full = reports.build_report()
+        self.assertEqual(full.mode, CrmReport.FULL)
+        self.assertEqual((full.total_customers, full.total_orders, full.total_revenue), (1, 1, Decimal('999.99')))
+
+        bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        create_order(bob, [self.laptop])
+        report = reports.build_report()
+        self.assertEqual(report.mode, CrmReport.INCREMENTAL)
+        self.assertEqual((report.new_customers, report.new_orders, report.new_revenue), (1, 1, Decimal('999.99')))
+        self.assertEqual((report.total_customers, report.total_orders, report.total_revenue), (2, 2, Decimal('1999.98')))
+
+        # Nothing new: the totals carry over
+        report = reports.build_report()
+        self.assertEqual((report.new_orders, report.total_orders), (0, 2))
+
+    def test_full_report_resets_the_baseline(self):
+        reports.build_report()
+        Order.objects.all().delete()
+        report = reports.build_report(incremental=False)
+        self.assertEqual((report.mode, report.total_orders, report.total_customers), (CrmReport.FULL, 0, 1))
+
+    def test_crm_reports_query(self):
+        reports.build_report()
+        data = self.graphql('{ crmReports { mode totalOrders totalRevenue } }')['data']
+        self.assertEqual(data, {'crmReports': [{'mode': 'full', 'totalOrders': 1, 'totalRevenue': 999.99}]})
+
+
+# --------------------------
+# ORDERS AND AGGREGATES
+# --------------------------
+
+class OrderTests(GraphQLTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        self.laptop = Product.objects.create(name='Laptop', price=Decimal('1000.00'), stock=1)
+        self.mouse = Product.objects.create(name='Mouse', price=Decimal('25.00'), stock=5)
+
+    def create_order(self, *products):
+        product_ids = json.dumps([str(product.pk) for product in products])
+        return self.graphql(
+            'mutation { createOrder(input: {customerId: "%s", productIds: %s}) { success } }'
+            % (self.customer.pk, product_ids)
+        )
+
+    def test_create_order_updates_rollup(self):
+        self.assertTrue(self.create_order(self.laptop, self.mouse)['data']['createOrder']['success'])
+        self.assertTrue(self.create_order(self.mouse)['data']['createOrder']['success'])
+
+        today = timezone.localdate()
+        total = DailySales.objects.get(date=today, product=None, customer=None)
+        self.assertEqual((total.order_count, total.item_count, total.revenue), (2, 3, Decimal('1050.00')))
+        mouse = DailySales.objects.get(date=today, product=self.mouse)
+        self.assertEqual((mouse.order_count, mouse.revenue), (2, Decimal('50.00')))
+        self.assertEqual(DailySales.objects.get(date=today, customer=self.customer).order_count, 2)
+
+    def test_create_order_updates_customer_stats(self):
+        self.assertTrue(self.create_order(self.laptop, self.mouse)['data']['createOrder']['success'])
+        self.assertTrue(self.create_order(self.mouse)['data']['createOrder']['success'])
+
+        customer = Customer.objects.get(pk=self.customer.pk)
+        self.assertEqual(customer.order_count, 2)
+        self.assertEqual(customer.lifetime_value, Decimal('1050.00'))
+        self.assertEqual(customer.last_order_at, Order.objects.latest('order_date').order_date)
+
+    def test_create_orders_falls_back_to_one_savepoint_per_order(self):
+        inputs = ', '.join(
+            '{customerId: "%s", productIds: ["%s"]}' % (self.customer.pk, product.pk)
+            for product in (self.laptop, self.laptop, self.mouse)
+        )
+        result = self.graphql(
+            'mutation { createOrders(inputs: [%s]) { createdCount failedCount results { index success error } } }'
+            % inputs
+        )['data']['createOrders']
+
+        self.assertEqual((result['createdCount'], result['failedCount']), (2, 1))
+        self.assertEqual([entry['success'] for entry in result['results']], [True, False, True])
+        self.assertIn('Insufficient stock', result['results'][1]['error'])
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(Product.objects.get(pk=self.laptop.pk).stock, 0)
+        self.assertEqual(Product.objects.get(pk=self.mouse.pk).stock, 4)
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).order_count, 2)
+        self.assertEqual(DailySales.objects.get(product=None, customer=None).order_count, 2)
+
+    def test_failed_order_changes_nothing(self):
+        self.create_order(self.laptop)
+        result = self.create_order(self.laptop)
+        self.assertIn('Insufficient stock', result['errors'][0]['message'])
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).order_count, 1)
+        self.assertEqual(DailySales.objects.get(product=None, customer=None).order_count, 1)
+
+
+# --------------------------
+# ANALYTICS
+# --------------------------
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        alice = Customer.objects.create(name='Alice', email='alice@example.com')
+        bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        self.laptop = Product.objects.create(name='Laptop', price=Decimal('1000.00'), stock=5)
+        self.mouse = Product.objects.create(name='Mouse', price=Decimal('20.00'), stock=5)
+        for customer, products, month in [
+            (alice, [self.laptop, self.mouse], 1),
+            (bob, [self.laptop], 2),
+            (alice, [self.mouse], 3),
+        ]:
+            order = create_order(customer, products)
+            Order.objects.filter(pk=order.pk).update(order_date=datetime(2024, month, 15, tzinfo=dt_timezone.utc))
+
+    def test_customer_cohorts(self):
+        # Small chunks fold the rows in several passes
+        cohorts = analytics.customer_cohorts(chunk_size=1)
+        january, february = 2024 * 12, 2024 * 12 + 1
+        self.assertEqual(cohorts, [
+            (january, 0, 1, 1020.0),
+            (january, 2, 1, 20.0),
+            (february, 0, 1, 1000.0),
+        ])
+        self.assertEqual(analytics.save_cohorts(cohorts), 3)
+        self.assertEqual(
+            list(CohortRetention.objects.order_by('cohort', 'months_since').values_list('cohort', 'months_since')),
+            [(date(2024, 1, 1), 0), (date(2024, 1, 1), 2), (date(2024, 2, 1), 0)],
+        )
+
+    def test_product_reports(self):
+        top_products, affinities = analytics.product_reports(chunk_size=1)
+        self.assertEqual(top_products, [(self.laptop.pk, 2), (self.mouse.pk, 2)])
+        # One of three orders holds both: confidence 1/2, lift 1/2 / (2/3)
+        self.assertEqual(affinities, [
+            (self.laptop.pk, self.mouse.pk, 1, 0.5, 0.75),
+            (self.mouse.pk, self.laptop.pk, 1, 0.5, 0.75),
+        ])
+        self.assertEqual(analytics.save_product_reports(top_products, affinities), (2, 2))
+        self.assertEqual(TopProduct.objects.get(rank=1).revenue, Decimal('2000.00'))
+
+    def test_no_orders(self):
+        Order.objects.all().delete()
+        self.assertEqual(analytics.customer_cohorts(), [])
+        self.assertEqual(analytics.product_reports(), ([], []))
+
+
+# --------------------------
+# CACHING
+# --------------------------
+
+class CachingTests(GraphQLTestMixin, TestCase):
+    ALL_CUSTOMERS = '{ allCustomers(orderBy: ["name"]) { edges { node { name } } } }'
+
+    def setUp(self):
+        cache.clear()
+        self.alice = Customer.objects.create(name='Alice', email='alice@example.com')
+
+    def names(self):
+        data = self.graphql(self.ALL_CUSTOMERS)['data']
+        return [edge['node']['name'] for edge in data['allCustomers']['edges']]
+
+    def test_node_lookups_are_cached(self):
+        query = '{ customer(id: "%s") { name } }' % to_global_id('CustomerNode', self.alice.pk)
+        self.graphql(query)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.graphql(query), {'data': {'customer': {'name': 'Alice'}}})
+
+    def test_writes_invalidate_once_committed(self):
+        self.assertEqual(self.names(), ['Alice'])
+        # Written behind the cache's back: the cached rows are still served
+        Customer.objects.create(name='Bob', email='bob@example.com')
+        self.assertEqual(self.names(), ['Alice'])
+
+        mutation = 'mutation { createCustomer(input: {name: "Carol", email: "carol@example.com"}) { success } }'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.graphql(mutation)
+        self.assertEqual(self.names(), ['Alice', 'Bob', 'Carol'])
+
+    def test_large_results_bypass_the_cache(self):
+        Customer.objects.create(name='Bob', email='bob@example.com')
+        queryset = Customer.objects.order_by('name')
+        self.assertIsInstance(caching.cached_rows(queryset, ['all'], limit=1), QuerySet)
+        self.assertEqual(cache.get(caching.make_key(Customer, ['rows', ['all']])), caching.TOO_LARGE)
+        # Remembered until the next write to customers
+        self.assertIsInstance(caching.cached_rows(queryset, ['all'], limit=2), QuerySet)
+        caching.bump_version(Customer)
+        self.assertEqual(caching.cached_rows(queryset, ['all'], limit=2), list(queryset))
+
+    def test_versions_only_grow(self):
+        version = caching.get_version(Customer)
+        self.assertEqual(caching.bump_version(Customer), version + 1)
+        cache.delete('crm:version:crm.customer')
+        self.assertGreater(caching.get_version(Customer), version + 1)
+
+
+# --------------------------
+# PRODUCT CATALOG
+# --------------------------
+
+class CatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.laptop = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+
+    def test_lookups_are_served_from_memory(self):
+        catalog.get_catalog()
+        with self.assertNumQueries(0):
+            record = catalog.get_products([self.laptop.pk])[self.laptop.pk]
+        self.assertEqual((record.name, record.price), ('Laptop', Decimal('999.99')))
+        with self.assertRaises(AttributeError):
+            record.price = Decimal('1')
+
+    def test_invalidate_rebuilds_once_committed(self):
+        catalog.get_catalog()
+        Product.objects.filter(pk=self.laptop.pk).update(price=Decimal('899.99'))
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog.invalidate()
+        self.assertEqual(catalog.get_catalog()[self.laptop.pk].price, Decimal('899.99'))
+
+    def test_missing_ids_are_checked_against_the_database(self):
+        catalog.get_catalog()
+        # Created without invalidating the snapshot
+        mouse = Product.objects.create(name='Mouse', price=Decimal('19.99'), stock=5)
+        products = catalog.get_products([self.laptop.pk, mouse.pk, mouse.pk + 1])
+        self.assertEqual(set(products), {self.laptop.pk, mouse.pk})
+
+    def test_old_snapshots_are_rebuilt(self):
+        catalog.get_catalog()
+        Product.objects.filter(pk=self.laptop.pk).update(price=Decimal('899.99'))
+        self.assertEqual(catalog.get_catalog()[self.laptop.pk].price, Decimal('999.99'))
+        with mock.patch.object(catalog, 'MAX_AGE', 0):
+            self.assertEqual(catalog.get_catalog()[self.laptop.pk].price, Decimal('899.99'))
+
+
+# --------------------------
+# BULK PRODUCT UPSERT
+# --------------------------
+
+class BulkUpsertProductsTests(GraphQLTestMixin, TestCase):
+    MUTATION = """
+    mutation($inputs: [ProductUpsertInput!]!, $key: ProductUpsertKey) {
+        bulkUpsertProducts(inputs: $inputs, key: $key) {
+            createdCount updatedCount unchangedCount success errors { row message }
+        }
+    }
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.laptop = Product.objects.create(name='Laptop', sku='LAP-1', price=Decimal('999.99'), stock=5)
+        self.mouse = Product.objects.create(name='Mouse', sku='MOU-1', price=Decimal('19.99'), stock=5)
+
+    def upsert(self, inputs, key='SKU'):
+        response = self.post({'query': self.MUTATION, 'variables': {'inputs': inputs, 'key': key}})
+        return response.json()['data']['bulkUpsertProducts']
+
+    def test_upsert_by_sku(self):
+        result = self.upsert([
+            {'sku': 'LAP-1', 'price': '899.99'},
+            {'sku': 'MOU-1', 'name': 'Mouse', 'price': '19.99'},
+            {'sku': 'KEY-1', 'name': 'Keyboard', 'price': '49.99', 'stock': 3},
+            {'sku': 'KEY-1', 'name': 'Keyboard again', 'price': '59.99'},
+            {'name': 'No SKU', 'price': '1.00'},
+        ])
+        self.assertEqual(
+            (result['createdCount'], result['updatedCount'], result['unchangedCount'], result['success']),
+            (1, 1, 1, False),
+        )
+        self.assertEqual([error['row'] for error in result['errors']], [4, 5])
+        self.laptop.refresh_from_db()
+        self.assertEqual((self.laptop.price, self.laptop.stock), (Decimal('899.99'), 5))
+        self.assertEqual(Product.objects.get(sku='KEY-1').stock, 3)
+
+    def test_upsert_by_name_keeps_skus_unique(self):
+        result = self.upsert([
+            {'name': 'Laptop', 'sku': 'MOU-1'},
+            {'name': 'Mouse', 'stock': 50},
+        ], key='NAME')
+        self.assertEqual((result['updatedCount'], result['errors']), (1, [
+            {'row': 1, 'message': "SKU 'MOU-1' belongs to another product"},
+        ]))
+        self.assertEqual(Product.objects.get(name='Mouse').stock, 50)
+
+    def test_invalid_rows_are_reported(self):
+        result = self.upsert([{'sku': 'BAD-1', 'name': 'Bad', 'price': '-1'}])
+        self.assertFalse(result['success'])
+        self.assertEqual(result['errors'][0]['row'], 1)
+        self.assertFalse(Product.objects.filter(sku='BAD-1').exists())
+
+
+# --------------------------
+# IDEMPOTENCY KEYS
+# --------------------------
+
+class IdempotencyTests(GraphQLTestMixin, TestCase):
+    MUTATION = 'mutation { createCustomer(input: {name: "Bob", email: "%s"}) { success } }'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_replays_the_stored_response(self):
+        body = {'query': self.MUTATION % 'bob@example.com'}
+        first = self.post(body, HTTP_IDEMPOTENCY_KEY='key-1')
+        second = self.post(body, HTTP_IDEMPOTENCY_KEY='key-1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertNotIn(idempotency.REPLAYED_HEADER, first)
+        self.assertEqual(second[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(Customer.objects.count(), 1)
+
+    def test_in_flight_key_is_refused(self):
+        cache.add(idempotency.Claim('key-2', '').lock_key, 'other request')
+        response = self.post({'query': self.MUTATION % 'bob@example.com'}, HTTP_IDEMPOTENCY_KEY='key-2')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Customer.objects.exists())
+
+    def test_key_reused_for_another_request(self):
+        self.post({'query': self.MUTATION % 'bob@example.com'}, HTTP_IDEMPOTENCY_KEY='key-3')
+        response = self.post({'query': self.MUTATION % 'rob@example.com'}, HTTP_IDEMPOTENCY_KEY='key-3')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Customer.objects.count(), 1)
+
+
+# --------------------------
+# STOCK RESERVATIONS
+# --------------------------
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=5)
+        self.customer = Customer.objects.create(name='Alice', email='alice@example.com')
+
+    def stock(self):
+        return Product.objects.get(pk=self.product.pk).stock
+
+    def test_reserve_never_oversells(self):
+        reservations.reserve({self.product.pk: 3})
+        with self.assertRaises(reservations.InsufficientStock):
+            reservations.reserve({self.product.pk: 3})
+        self.assertEqual(self.stock(), 2)
+        reservations.reserve({self.product.pk: 2})
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(StockReservation.objects.filter(status=StockReservation.HELD).count(), 2)
+
+    def test_take_rolls_back_every_product(self):
+        other = Product.objects.create(name='Mouse', price=Decimal('25.00'), stock=1)
+        with self.assertRaises(reservations.InsufficientStock):
+            with transaction.atomic():
+                reservations.take({self.product.pk: 1, other.pk: 2})
+        self.assertEqual(self.stock(), 5)
+        self.assertEqual(Product.objects.get(pk=other.pk).stock, 1)
+
+    def test_commit_after_release_fails(self):
+        [reservation] = reservations.reserve({self.product.pk: 2})
+        self.assertEqual(reservations.release([reservation.pk]), 1)
+        self.assertEqual(self.stock(), 5)
+        order = create_order(self.customer, [self.product])
+        with self.assertRaises(reservations.ReservationError):
+            reservations.commit([reservation.pk], order)
+
+    def test_release_after_commit_does_nothing(self):
+        [reservation] = reservations.reserve({self.product.pk: 2})
+        order = create_order(self.customer, [self.product])
+        reservations.commit([reservation.pk], order, {self.product.pk: 2})
+        self.assertEqual(reservations.release([reservation.pk]), 0)
+        self.assertEqual(self.stock(), 3)
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, StockReservation.COMMITTED)
+        self.assertEqual(reservation.order_id, order.pk)
+
+    def test_commit_checks_the_reserved_units(self):
+        [reservation] = reservations.reserve({self.product.pk: 2})
+        order = create_order(self.customer, [self.product])
+        with self.assertRaises(reservations.ReservationError):
+            reservations.commit([reservation.pk], order, {self.product.pk: 1})
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, StockReservation.HELD)
+
+    def test_release_expired(self):
+        [expired] = reservations.reserve({self.product.pk: 2})
+        [held] = reservations.reserve({self.product.pk: 1})
+        StockReservation.objects.filter(pk=expired.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(reservations.release_expired(), 1)
+        self.assertEqual(reservations.release_expired(), 0)
+        self.assertEqual(self.stock(), 4)
+        self.assertEqual(StockReservation.objects.get(pk=expired.pk).status, StockReservation.RELEASED)
+        self.assertEqual(StockReservation.objects.get(pk=held.pk).status, StockReservation.HELD)
+        order = create_order(self.customer, [self.product])
+        with self.assertRaises(reservations.ReservationError):
+            reservations.commit([expired.pk], order)
+
+
+# --------------------------
+# OUTBOX
+# --------------------------
+
+class OutboxTests(TestCase):
+    TOPIC = 'test.event'
+
+    def emit(self, *keys):
+        with transaction.atomic():
+            outbox.emit((self.TOPIC, key, {'n': n}) for n, key in enumerate(keys))
+        return list(OutboxEvent.objects.order_by('pk'))
+
+    def test_events_of_a_key_are_handled_in_order(self):
+        first, second, other = self.emit('order:1', 'order:1', 'order:2')
+
+        events, token = outbox.claim(batch_size=1)
+        self.assertEqual(events, [first])
+        # The second event of order:1 waits behind the leased first one
+        blocked, _ = outbox.claim()
+        self.assertEqual(blocked, [other])
+
+        outbox.dispatch(events, token)
+        events, _ = outbox.claim()
+        self.assertEqual(events, [second])
+
+    def test_expired_lease_is_taken_over(self):
+        [event] = self.emit('order:1')
+        stale, stale_token = outbox.claim()
+        OutboxEvent.objects.filter(pk=event.pk).update(available_at=timezone.now() - timedelta(seconds=1))
+
+        events, token = outbox.claim()
+        self.assertEqual(events, [event])
+        self.assertEqual(events[0].attempts, 2)
+        # The consumer that lost the lease cannot mark the event processed
+        outbox.dispatch(stale, stale_token)
+        self.assertIsNone(OutboxEvent.objects.get(pk=event.pk).processed_at)
+        outbox.dispatch(events, token)
+        self.assertIsNotNone(OutboxEvent.objects.get(pk=event.pk).processed_at)
+
+    def test_failing_handler_is_retried_later(self):
+        first, second = self.emit('order:1', 'order:1')
+        failing = mock.Mock(side_effect=RuntimeError('boom'))
+        with mock.patch.dict(outbox.HANDLERS, {self.TOPIC: failing}), self.assertLogs('crm.outbox', 'ERROR'):
+            self.assertEqual(outbox.drain(), 0)
+        failing.assert_called_once()
+
+        first.refresh_from_db()
+        self.assertIsNone(first.processed_at)
+        self.assertGreater(first.available_at, timezone.now())
+        self.assertEqual(first.last_error, 'boom')
+        # Later events of the key wait for the retry
+        self.assertEqual(outbox.claim()[0], [])
+
+
+# --------------------------
+# SINGLE-FLIGHT LOCKS
+# --------------------------
+
+class SingleFlightTests(TestCase):
+    def test_one_run_at_a_time(self):
+        runs = []
+
+        @locks.single_flight(name='test.job')
+        def job():
+            runs.append(job_again())
+            return 'done'
+
+        @locks.single_flight(name='test.job')
+        def job_again():
+            return 'ran twice'
+
+        self.assertEqual(job(), 'done')
+        self.assertEqual(runs, [{'skipped': 'already running or ran recently'}])
+        # Released afterwards
+        self.assertEqual(job(), 'done')
+
+    def test_skips_runs_within_half_the_interval(self):
+        @locks.single_flight(name='test.hourly', every=timedelta(hours=1))
+        def job():
+            return 'done'
+
+        self.assertEqual(job(), 'done')
+        self.assertIn('skipped', job())
+        JobLease.objects.filter(name='test.hourly').update(started_at=timezone.now() - timedelta(minutes=31))
+        self.assertEqual(job(), 'done')
+
+    def test_stale_lease_is_taken_over(self):
+        stalled = locks.acquire('test.job')
+        self.assertIsNone(locks.acquire('test.job'))
+        JobLease.objects.filter(name='test.job').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        current = locks.acquire('test.job')
+        self.assertIsNotNone(current)
+        with self.assertLogs('crm.locks', 'WARNING'):
+            self.assertFalse(stalled.renew())
+        with self.assertRaises(locks.LeaseLost):
+            stalled.check()
+        stalled.release()
+        self.assertEqual(JobLease.objects.get(name='test.job').owner, current.owner)
+        current.release()
+
+    def test_lost_lease_stops_the_job(self):
+        writes = []
+
+        @locks.single_flight(name='test.job')
+        def job():
+            writes.append(1)
+            # Another process takes over while this one stalls
+            JobLease.objects.filter(name='test.job').update(owner='other')
+            locks._current.get().renew()
+            locks.check()
+            writes.append(2)
+
+        with self.assertLogs('crm.locks', 'WARNING'):
+            self.assertEqual(job(), {'aborted': 'Lost the lease on test.job'})
+        self.assertEqual(writes, [1])
+        lease = JobLease.objects.get(name='test.job')
+        self.assertEqual(lease.owner, 'other')
+        self.assertIsNone(lease.finished_at)
+
+    def test_check_outside_a_job_does_nothing(self):
+        locks.check()
+
+
+# --------------------------
+# ARCHIVE
+# --------------------------
+
+class ArchiveTests(GraphQLTestMixin, TestCase):
+    ORDERS = '{ allOrders%s { edges { node { totalAmount archived products { edges { node { name } } } } } } }'
+
+    def setUp(self):
+        cache.clear()
+        customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        self.laptop = Product.objects.create(name='Laptop', price=Decimal('1000.00'), stock=10)
+        self.mouse = Product.objects.create(name='Mouse', price=Decimal('25.00'), stock=10)
+        self.old = create_order(customer, [self.laptop])
+        Order.objects.filter(pk=self.old.pk).update(order_date=timezone.now() - timedelta(days=400))
+        self.recent = create_order(customer, [self.mouse])
+
+    def nodes(self, arguments=''):
+        edges = self.graphql(self.ORDERS % arguments)['data']['allOrders']['edges']
+        return [
+            (edge['node']['totalAmount'], edge['node']['archived'],
+             [product['node']['name'] for product in edge['node']['products']['edges']])
+            for edge in edges
+        ]
+
+    def test_archive_moves_old_orders_with_their_products(self):
+        self.assertEqual(archive.archive_orders(), 1)
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [self.recent.pk])
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual(archived.pk, self.old.pk)
+        self.assertEqual(
+            list(ArchivedOrderProduct.objects.values_list('order_id', 'product_id')),
+            [(self.old.pk, self.laptop.pk)],
+        )
+        self.assertEqual(archive.archive_orders(), 0)
+
+    def test_include_archived_unions_both_tables(self):
+        archive.archive_orders()
+        self.assertEqual(self.nodes(), [(25.0, False, ['Mouse'])])
+        self.assertEqual(self.nodes('(includeArchived: true)'), [(1000.0, True, ['Laptop']), (25.0, False, ['Mouse'])])
+        self.assertEqual(
+            self.nodes('(includeArchived: true, orderBy: ["totalAmount"])'),
+            [(25.0, False, ['Mouse']), (1000.0, True, ['Laptop'])],
+        )
+        self.assertEqual(
+            self.nodes('(includeArchived: true, filters: {totalAmountGte: 100})'),
+            [(1000.0, True, ['Laptop'])],
+        )
+
+
+# --------------------------
+# COUNT STRATEGIES
+# --------------------------
+
+class CountStrategyTests(GraphQLTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        self.products = [
+            Product.objects.create(name=f'Product {index}', price=Decimal('10.00'), stock=50) for index in range(3)
+        ]
+
+    def total_products(self, strategy, first=2):
+        query = '{ allProducts(first: %d, countStrategy: %s) { totalCount pageInfo { hasNextPage } edges { node { name } } } }'
+        return self.graphql(query % (first, strategy))['data']['allProducts']
+
+    def test_cached_count_lasts_until_invalidated(self):
+        self.assertEqual(self.total_products('CACHED')['totalCount'], 3)
+        # A write that does not invalidate products leaves the cached count alone
+        Product.objects.create(name='Product 3', price=Decimal('10.00'), stock=50)
+        self.assertEqual(self.total_products('CACHED')['totalCount'], 3)
+        caching.bump_version(Product)
+        self.assertEqual(self.total_products('CACHED')['totalCount'], 4)
+        self.assertEqual(self.total_products('EXACT')['totalCount'], 4)
+
+    def test_pages_without_counting(self):
+        page = self.total_products('ESTIMATED')
+        self.assertTrue(page['pageInfo']['hasNextPage'])
+        self.assertEqual(len(page['edges']), 2)
+        self.assertFalse(self.total_products('CACHED', first=3)['pageInfo']['hasNextPage'])
+
+    def test_estimated_order_count_reads_the_rollup(self):
+        mutation = 'mutation { createOrder(input: {customerId: "%s", productIds: ["%s"]}) { success } }'
+        with mock.patch('crm.outbox._kick'):
+            for product in self.products:
+                self.graphql(mutation % (self.customer.pk, product.pk))
+        # Bypasses the rollup, so only the exact count sees it
+        create_order(self.customer, self.products[:1])
+        query = '{ allOrders(first: 1, countStrategy: %s) { totalCount } }'
+        self.assertEqual(self.graphql(query % 'ESTIMATED')['data']['allOrders']['totalCount'], 3)
+        self.assertEqual(self.graphql(query % 'EXACT')['data']['allOrders']['totalCount'], 4)
+
+    def test_table_estimate_needs_statistics(self):
+        self.assertIsNone(counts.table_estimate(Product, 'default'))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(counts.table_estimate(Product, 'default'), 3)
+
+
+# --------------------------
+# BATCHED REQUESTS
+# --------------------------
+
+@mock.patch('crm.outbox._kick')
+class BatchTests(GraphQLTestMixin, TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(name='Alice', email='alice@example.com')
+        self.product = Product.objects.create(name='Mouse', price=Decimal('25.00'), stock=5)
+
+    def batch(self):
+        order_count = '{ customer(id: "%s") { orderCount } }' % self.node_id()
+        return [
+            {'id': 'before', 'query': order_count},
+            {'id': 'order', 'query': 'mutation { createOrder(input: {customerId: "%s", productIds: ["%s"]}) '
+                                     '{ success } }' % (self.customer.pk, self.product.pk)},
+            {'id': 'after', 'query': order_count},
+        ]
+
+    def node_id(self):
+        return to_global_id('CustomerNode', self.customer.pk)
+
+    def test_batch_results_follow_the_operations(self, kick):
+        response = self.post(self.batch())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'data': {'customer': {'orderCount': 0}}, 'id': 'before', 'status': 200},
+            {'data': {'createOrder': {'success': True}}, 'id': 'order', 'status': 200},
+            # The mutation dropped the customer loaded by the first operation
+            {'data': {'customer': {'orderCount': 1}}, 'id': 'after', 'status': 200},
+        ])
+
+    def test_async_batch_has_the_same_shape(self, kick):
+        query = '{ customer(id: "%s") { name } }' % self.node_id()
+        response = self.post([{'id': 'ok', 'query': query}, {'query': '{ nope }'}], path='/graphql/async')
+        self.assertEqual(response.status_code, 400)
+        ok, error = response.json()
+        self.assertEqual(ok, {'data': {'customer': {'name': 'Alice'}}, 'id': 'ok', 'status': 200})
+        self.assertEqual((error['id'], error['status']), (None, 400))
+        self.assertNotIn('data', error)
+
+    def test_invalid_batches_are_refused(self, kick):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post([{'query': '{ __typename }'}] * 21).status_code, 400)
@@ -1,7 +1,14 @@
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from .views import (
+    AsyncGraphQLView, MetricsGraphQLView, export_view, healthz, import_customers, metrics_view,
+)
 
 urlpatterns = [
-     path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+     path("graphql", csrf_exempt(MetricsGraphQLView.as_view(graphiql=True))),
+     path("graphql/async", csrf_exempt(AsyncGraphQLView.as_view())),
+     path("export/<str:kind>", export_view, name="export"),
+     path("import/customers", csrf_exempt(import_customers)),
+     path("metrics", metrics_view),
+     path("healthz", healthz),
  ]
\ No newline at end of file
@@ -1,3 +1,258 @@
-from django.shortcuts import render
+import asyncio
+import json
+import time
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.http import require_POST
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, instantiate_middleware
+
+from . import exports, health, idempotency, imports, metrics
+from .async_schema import schema as async_schema
+from .loaders import Loaders, reset
+
+
+# Most operations accepted in one batched request
+MAX_BATCH_SIZE = 20
+
+
+def _batch(request):
+    """The operations of a batched request (a JSON array body), or None."""
+    if request.method != 'POST' or request.content_type != 'application/json':
+        return None
+    if not request.body.lstrip().startswith(b'['):
+        return None
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return None
+    return data if isinstance(data, list) else None
+
+
+def _batch_error(operations):
+    if not operations:
+        return JsonResponse({'errors': [{'message': 'Batch must hold at least one operation.'}]}, status=400)
+    if len(operations) > MAX_BATCH_SIZE:
+        return JsonResponse(
+            {'errors': [{'message': f'Batch must hold at most {MAX_BATCH_SIZE} operations.'}]}, status=400,
+        )
+    if not all(isinstance(entry, dict) for entry in operations):
+        return JsonResponse({'errors': [{'message': 'Every operation in a batch must be an object.'}]}, status=400)
+    return None
+
+
+class MetricsGraphQLView(GraphQLView):
+    """
+    GraphQLView that records latency, errors and SQL usage per operation and
+    honours Idempotency-Key headers on mutations.
+
+    A JSON array of operations runs as one batch and returns an array of
+    results. The operations share the request, and with it the lookups
+    memoized in ``crm.loaders``.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        operations = _batch(request)
+        if operations is not None:
+            error = _batch_error(operations)
+            if error is not None:
+                return error
+            # graphene-django's batch mode, for this request only
+            self.batch = True
+        claim = idempotency.claim(request)
+        if claim is None:
+            return super().dispatch(request, *args, **kwargs)
+        if claim.response is not None:
+            return claim.response
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+            claim.complete(response)
+            return response
+        finally:
+            claim.release()
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, *args, **kwargs):
+        mutation = idempotency.is_mutation(query or '')
+        if mutation:
+            reset(request)
+        start = time.perf_counter()
+        failed = True
+        result = None
+        with metrics.track_queries('graphql') as queries:
+            try:
+                result = super().execute_graphql_request(
+                    request, data, query, variables, operation_name, *args, **kwargs
+                )
+                failed = bool(result is not None and result.errors)
+                return result
+            finally:
+                if mutation:
+                    reset(request)
+                if query:
+                    # Without data the document did not parse or validate
+                    valid = result is not None and result.data is not None
+                    operation = metrics.operation_label(query, operation_name, valid)
+                    metrics.observe_operation(operation, time.perf_counter() - start, queries.count, failed)
+
+
+class AsyncGraphQLView(View):
+    """
+    POST-only GraphQL endpoint that executes the async schema.
+
+    Under ASGI many concurrent operations share one worker while they wait
+    on the database. A JSON array of operations shares one set of
+    DataLoaders, so a lookup made by several operations is fetched once.
+    Batches of queries run concurrently and also batch their loads together.
+    Batches with a mutation run in order, with fresh loaders after each
+    mutation. Responses have the shape of MetricsGraphQLView's, batches
+    included: each result carries the operation's ``id`` and ``status``.
+    """
+
+    http_method_names = ['post']
+    schema = async_schema
+
+    async def post(self, request, *args, **kwargs):
+        claim = await sync_to_async(idempotency.claim)(request)
+        if claim is None:
+            return await self.execute(request)
+        if claim.response is not None:
+            return claim.response
+        try:
+            response = await self.execute(request)
+            await sync_to_async(claim.complete)(response)
+            return response
+        finally:
+            await sync_to_async(claim.release)()
+
+    async def execute(self, request):
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'errors': [{'message': 'POST body sent invalid JSON.'}]}, status=400)
+        request.loaders = Loaders()
+        if not isinstance(data, list):
+            response, status = await self.execute_operation(request, data)
+            return JsonResponse(response, status=status)
+
+        error = _batch_error(data)
+        if error is not None:
+            return error
+        if any(idempotency.is_mutation(entry.get('query') or '') for entry in data):
+            results = []
+            for entry in data:
+                results.append(await self.execute_operation(request, entry))
+        else:
+            results = await asyncio.gather(*(self.execute_operation(request, entry) for entry in data))
+        responses = [
+            {**response, 'id': entry.get('id'), 'status': status}
+            for entry, (response, status) in zip(data, results)
+        ]
+        return JsonResponse(responses, status=max(status for _, status in results), safe=False)
+
+    async def execute_operation(self, request, data):
+        """Run one operation. Returns its response body and status."""
+        query = data.get('query')
+        if not query:
+            return {'errors': [{'message': 'Must provide query string.'}]}, 400
+
+        operation_name = data.get('operationName')
+        mutation = idempotency.is_mutation(query)
+        if mutation:
+            reset(request)
+        start = time.perf_counter()
+        result = await self.schema.execute_async(
+            query,
+            variable_values=data.get('variables'),
+            operation_name=operation_name,
+            context_value=request,
+            middleware=list(instantiate_middleware(graphene_settings.MIDDLEWARE or [])),
+        )
+        metrics.observe_operation(
+            metrics.operation_label(query, operation_name, result.data is not None),
+            time.perf_counter() - start,
+            None,
+            bool(result.errors),
+        )
+        if mutation:
+            reset(request)
+
+        # As graphene-django: errors outside any field mean the operation did not run
+        response = {}
+        status = 200
+        if result.errors:
+            response['errors'] = [error.formatted for error in result.errors]
+        if result.errors and any(not error.path for error in result.errors):
+            status = 400
+        else:
+            response['data'] = result.data
+        return response, status
+
+
+@require_POST
+def import_customers(request):
+    """Accept a customer CSV (multipart field ``file``) and start a background import."""
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': "Upload the CSV as the 'file' field"}, status=400)
+    try:
+        job = imports.create_import_job(upload.file, filename=upload.name)
+    except (ValueError, UnicodeDecodeError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(
+        {'id': job.pk, 'totalRows': job.total_rows, 'totalChunks': job.total_chunks},
+        status=202,
+    )
+
+
+def metrics_view(request):
+    """Expose Prometheus metrics in the text exposition format."""
+    payload, content_type = metrics.render()
+    return HttpResponse(payload, content_type=content_type)
+
+
+def healthz(request):
+    """Report database, broker and schema readiness with probe latencies."""
+    healthy, checks = health.run_checks()
+    return JsonResponse(
+        {'status': 'ok' if healthy else 'unavailable', 'checks': checks},
+        status=200 if healthy else 503,
+    )
+
+
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+async def _iterate_in_thread(iterator):
+    # Under ASGI a sync iterator would be read into memory in full; pull it
+    # chunk by chunk on the thread that owns the database cursor instead
+    while True:
+        chunk = await sync_to_async(next)(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def export_view(request, kind):
+    """Stream every order or customer matching the OrderFilter/CustomerFilter query parameters."""
+    if kind not in exports.EXPORTS:
+        raise Http404(f"No export named '{kind}'")
+    params = request.GET.copy()
+    fmt = params.pop('format', ['ndjson'])[-1]
+    if fmt not in EXPORT_CONTENT_TYPES:
+        return JsonResponse({'error': f"Unsupported format '{fmt}', use ndjson or csv"}, status=400)
+    try:
+        chunks = exports.export(kind, params, fmt)
+    except ValueError as e:
+        # Invalid filter values; the argument holds the FilterSet errors
+        return JsonResponse({'errors': e.args[0]}, status=400)
+
+    if hasattr(request, 'scope'):
+        chunks = _iterate_in_thread(chunks)
+    response = StreamingHttpResponse(chunks, content_type=EXPORT_CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response